@@ -5,6 +5,12 @@ class TagsEnum(str, Enum):
     USER = "USER"
     TRANSACTIONS = "TRANSACTIONS"
     CATEGORIES = "CATEGORIES"
+    JOBS = "JOBS"
+    RATES = "RATES"
+    BUDGETS = "BUDGETS"
+    SYNC = "SYNC"
+    EVENTS = "EVENTS"
+    BATCH = "BATCH"
 
 tags_metadata = [
     {
@@ -19,4 +25,30 @@ tags_metadata = [
         "name": TagsEnum.CATEGORIES,
         "description": "The operations used for managing user's categories.",
     },
+    {
+        "name": TagsEnum.JOBS,
+        "description": (
+            "The status of long-running operations executed in the background."
+        ),
+    },
+    {
+        "name": TagsEnum.RATES,
+        "description": "Exchange rates between any of the supported currencies.",
+    },
+    {
+        "name": TagsEnum.BUDGETS,
+        "description": "Monthly spending limits of the user's categories.",
+    },
+    {
+        "name": TagsEnum.SYNC,
+        "description": "Incremental synchronization of the offline clients.",
+    },
+    {
+        "name": TagsEnum.EVENTS,
+        "description": "Live stream of the changes made to the user's data.",
+    },
+    {
+        "name": TagsEnum.BATCH,
+        "description": "Many create, modify and delete operations applied at once.",
+    },
 ]
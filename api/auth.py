@@ -2,16 +2,13 @@ from datetime import datetime, timedelta
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 import database.models as d
 from config import Config, get_config
-from database.main import get_db
+from database.main import get_db, get_replica_db
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -30,6 +27,8 @@ def get_current_user(
     db: Session = Depends(get_db),
     config: Config = Depends(get_config),
 ) -> d.User | None:
+    from jose import ExpiredSignatureError, JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate the credentials",
@@ -58,6 +57,8 @@ def get_current_user(
 
 
 def create_access_token(user: d.User, config: Config) -> str:
+    from jose import jwt
+
     expire = datetime.utcnow() + timedelta(
         minutes=config.ACCESS_TOKEN_EXPIRATION_MINUTES
     )
@@ -66,12 +67,16 @@ def create_access_token(user: d.User, config: Config) -> str:
 
 
 def create_refresh_token(user: d.User, config: Config) -> str:
+    from jose import jwt
+
     expire = datetime.utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRATION_DAYS)
     data = {"sub": user.username, "exp": expire}
     return jwt.encode(data, config.SECRET_KEY, algorithm="HS256")
 
 
 def verify_refresh_token(refresh_token: str, db: Session, config: Config) -> d.User:
+    from jose import ExpiredSignatureError, JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate refresh_token",
@@ -97,3 +102,23 @@ def verify_refresh_token(refresh_token: str, db: Session, config: Config) -> d.U
         raise credentials_exception
 
     return user
+
+
+def get_read_db(
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    replica_db: Session = Depends(get_replica_db),
+    config: Config = Depends(get_config),
+) -> Session:
+    """Session for the read-only endpoints, served by the replica when possible
+
+    The user's writes bump their data version, so a replica with an older version
+    has not caught up with them yet and the primary is used instead.
+    """
+    if config.SQLALCHEMY_READ_REPLICA_URI is None:
+        return db
+
+    replica_version = replica_db.scalar(
+        select(d.User.data_version).filter_by(id=user.id)
+    )
+    return replica_db if replica_version == user.data_version else db
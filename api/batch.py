@@ -0,0 +1,235 @@
+from typing import TYPE_CHECKING
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user
+from api.cache import ResponseCache, get_cache
+from api.idempotency import IdempotencyStore, get_idempotency_store, idempotent_response
+from api.transactions import check_references
+from database.categorization import Categorizer, get_categorizer
+from database.main import get_db, get_replica_db
+
+if TYPE_CHECKING:
+    from database.conversion import RateMatrix
+
+router = APIRouter(prefix="/batch", tags=[TagsEnum.BATCH])
+
+OPERATION_SCHEMAS: dict[tuple[str, str], type[s.GeneralBaseModel]] = {
+    ("transaction", "create"): s.TransactionCreate,
+    ("transaction", "modify"): s.TransactionModify,
+    ("category", "create"): s.CategoryCreate,
+    ("category", "modify"): s.CategoryCreate,
+}
+
+
+def parse_operation(operation: s.BatchOperation) -> dict:
+    """Validate the operation's data with the schema of the matching endpoint"""
+    if operation.method != "create" and operation.id is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"The id is required to {operation.method} a {operation.entity}",
+        )
+    schema = OPERATION_SCHEMAS.get((operation.entity, operation.method))
+    if schema is None:
+        return {}
+    try:
+        return schema.parse_obj(operation.data or {}).dict(exclude_unset=True)
+    except ValidationError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error.errors()
+        )
+
+
+def load_rates(
+    user: d.User,
+    operations: list[tuple[s.BatchOperation, dict]],
+    db: Session,
+    rates_db: Session,
+) -> "RateMatrix | None":
+    """Rates of all the conversions in the batch, loaded with a single query"""
+    # Deferred, NumPy is only needed when there is something to convert
+    from database.conversion import RateMatrix
+
+    conversions = []
+    modified = []
+    for operation, data in operations:
+        if operation.entity != "transaction":
+            continue
+        if operation.method == "create":
+            conversions.append((data["transaction_date"], data["base_currency"]))
+        elif (
+            operation.method == "modify"
+            and {"base_amount", "base_currency"} & data.keys()
+        ):
+            modified.append((operation.id, data))
+    if modified:
+        stored = {
+            row.id: row
+            for row in db.execute(
+                select(
+                    d.Transaction.id,
+                    d.Transaction.transaction_date,
+                    d.Transaction.base_currency,
+                ).where(
+                    d.Transaction.id.in_({id for id, _ in modified}),
+                    d.Transaction.user_id == user.id,
+                )
+            )
+        }
+        conversions.extend(
+            (
+                data.get("transaction_date", stored[id].transaction_date),
+                data.get("base_currency", stored[id].base_currency),
+            )
+            for id, data in modified
+            if id in stored
+        )
+
+    # Amounts in the main currency need rates as well, for their EUR normalization
+    conversions = [
+        (day.date(), currency)
+        for day, currency in conversions
+        if {currency, user.main_currency} != {"EUR"}
+    ]
+    if not conversions:
+        return None
+    days = [day for day, _ in conversions]
+    currencies = {currency for _, currency in conversions}
+    return RateMatrix.load(
+        rates_db, min(days), max(days), currencies | {user.main_currency}
+    )
+
+
+def execute_operation(
+    operation: s.BatchOperation,
+    data: dict,
+    user: d.User,
+    db: Session,
+    rates: "RateMatrix | None",
+    categorizer: Categorizer,
+) -> tuple[int, int | None]:
+    """Apply the operation as its endpoint would, return its status code and id"""
+    id = operation.id
+    if operation.entity == "transaction":
+        check_references([data], user, db)
+    match operation.entity, operation.method:
+        case "transaction", "create":
+            transaction = d.Transaction(user=user, **data, db=db, rates=rates)
+            categorizer.categorize([transaction])
+            db.add(transaction)
+            db.flush()
+            return status.HTTP_201_CREATED, transaction.id
+        case "category", "create":
+            if db.scalar(select(d.Category).filter_by(name=data["name"], user=user)):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Category '{data['name']}' already exists",
+                )
+            category = d.Category(user=user, **data)
+            db.add(category)
+            db.flush()
+            return status.HTTP_201_CREATED, category.id
+
+    model = d.Transaction if operation.entity == "transaction" else d.Category
+    instance = model.get_from_id(id, user, db)
+    if not instance:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{model.__name__} with the {id=} does not exist",
+        )
+    if operation.method == "delete":
+        db.delete(instance)
+    elif isinstance(instance, d.Transaction):
+        instance.update(data, db, rates=rates)
+    else:
+        if db.scalar(select(d.Category).filter_by(name=data["name"], user=user)):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Category with the '{data['name']=}' already exists",
+            )
+        instance.update(data)
+    db.flush()
+    return status.HTTP_200_OK, id
+
+
+@router.post("/", status_code=status.HTTP_200_OK)
+def execute_batch(
+    request: Request,
+    data: s.Batch,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    replica_db: Session = Depends(get_replica_db),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+) -> list[s.BatchResult]:
+    """Apply the operations in order, in a single transaction
+
+    Every operation runs in its own savepoint, so a failed one is rolled back alone
+    and reported in its result, while the others are applied.
+    """
+    return idempotent_response(
+        request,
+        user,
+        idempotency,
+        data,
+        lambda: apply_operations(data, user, db, cache, replica_db),
+        status.HTTP_200_OK,
+    )
+
+
+def apply_operations(
+    data: s.Batch,
+    user: d.User,
+    db: Session,
+    cache: ResponseCache,
+    replica_db: Session,
+) -> list[s.BatchResult]:
+    results: list[s.BatchResult | None] = []
+    parsed = []
+    for operation in data.operations:
+        try:
+            parsed.append((operation, parse_operation(operation)))
+            results.append(None)
+        except HTTPException as error:
+            results.append(s.BatchResult(status=error.status_code, detail=error.detail))
+
+    rates = load_rates(user, parsed, db, replica_db)
+    categorizer = get_categorizer(user, db)
+    applied = iter(parsed)
+    for i, result in enumerate(results):
+        if result is not None:
+            continue
+        operation, operation_data = next(applied)
+        try:
+            with db.begin_nested():
+                code, id = execute_operation(
+                    operation, operation_data, user, db, rates, categorizer
+                )
+            results[i] = s.BatchResult(status=code, id=id)
+        except HTTPException as error:
+            results[i] = s.BatchResult(
+                status=error.status_code, id=operation.id, detail=error.detail
+            )
+        except d.MissingRateError as error:
+            results[i] = s.BatchResult(
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                id=operation.id,
+                detail=str(error),
+            )
+        except IntegrityError:
+            results[i] = s.BatchResult(
+                status=status.HTTP_409_CONFLICT,
+                id=operation.id,
+                detail="The operation conflicts with the stored data",
+            )
+
+    db.commit()
+    cache.invalidate(user.id)
+    return results
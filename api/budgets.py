@@ -0,0 +1,108 @@
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user, get_read_db
+from api.cache import ResponseCache, cached_response, get_cache
+from database.main import get_db
+
+router = APIRouter(prefix="/budgets", tags=[TagsEnum.BUDGETS])
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+def create_budget(
+    data: s.BudgetCreate,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.Budget:
+    if not d.Category.get_from_id(data.category_id, user, db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category with the id={data.category_id} does not exist",
+        )
+    if db.scalar(select(d.Budget).filter_by(category_id=data.category_id)):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Budget for the category id={data.category_id} already exists",
+        )
+
+    budget = d.Budget(user_id=user.id, **data.dict())
+    db.add(budget)
+    db.flush()
+    # Spend may predate its incremental tracking, start the budget from exact totals
+    d.CategorySpend.rebuild(db.connection(), data.category_id)
+    db.commit()
+    cache.invalidate(user.id)
+    return budget
+
+
+@router.get("/", response_model=list[s.BudgetStatus], status_code=status.HTTP_200_OK)
+def get_budgets(
+    request: Request,
+    response: Response,
+    month: date | None = None,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[s.BudgetStatus] | Response:
+    """Spend of the budgeted categories in the month, the current one by default"""
+    month = (month or date.today()).replace(day=1)
+
+    def build() -> list[s.BudgetStatus]:
+        return [
+            s.BudgetStatus(
+                budget=s.Budget.from_orm(budget),
+                month=month,
+                spent=-total,
+                remaining=d.round_amount(
+                    budget.monthly_limit + total, user.main_currency
+                ),
+            )
+            for budget, total in user.select_budgets(db, month)
+        ]
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.put("/{id}", status_code=status.HTTP_200_OK)
+def modify_budget(
+    id: int,
+    data: s.BudgetModify,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.Budget:
+    budget = d.Budget.get_from_id(id, user, db)
+    if not budget:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Budget with the {id=} does not exist",
+        )
+    budget.update(data.dict(exclude_unset=True))
+    db.commit()
+    cache.invalidate(user.id)
+    return budget
+
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_budget(
+    id: int,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> None:
+    budget = d.Budget.get_from_id(id, user, db)
+    if not budget:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Budget with the {id=} does not exist",
+        )
+    db.delete(budget)
+    db.commit()
+    cache.invalidate(user.id)
@@ -0,0 +1,151 @@
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable
+from urllib.parse import urlencode
+
+from fastapi import Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+import database.models as d
+from api.etag import make_etag, not_modified
+from config import Config, get_config
+
+
+class ResponseCache(ABC):
+    """Per-user store of serialized responses"""
+
+    @abstractmethod
+    def get(self, user_id: int, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def invalidate(self, user_id: int) -> None:
+        """Drop all the responses cached for the user"""
+
+
+class LRUCache(ResponseCache):
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[int, str], bytes] = OrderedDict()
+        self._user_keys: dict[int, set[str]] = {}
+        self._lock = Lock()
+
+    def get(self, user_id: int, key: str) -> bytes | None:
+        with self._lock:
+            value = self._entries.get((user_id, key))
+            if value is not None:
+                self._entries.move_to_end((user_id, key))
+            return value
+
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        with self._lock:
+            self._entries[(user_id, key)] = value
+            self._entries.move_to_end((user_id, key))
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                (evicted_user_id, evicted_key), _ = self._entries.popitem(last=False)
+                user_keys = self._user_keys[evicted_user_id]
+                user_keys.discard(evicted_key)
+                if not user_keys:
+                    del self._user_keys[evicted_user_id]
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            for key in self._user_keys.pop(user_id, ()):
+                self._entries.pop((user_id, key), None)
+
+
+class RedisCache(ResponseCache):
+    """Shared cache for multiple workers - each user's responses live in one hash"""
+
+    def __init__(self, url: str, ttl_seconds: int) -> None:
+        import redis  # optional dependency, only required by this backend
+
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url)
+
+    def _name(self, user_id: int) -> str:
+        return f"wallit:responses:{user_id}"
+
+    def get(self, user_id: int, key: str) -> bytes | None:
+        return self._client.hget(self._name(user_id), key)
+
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        pipeline = self._client.pipeline()
+        pipeline.hset(self._name(user_id), key, value)
+        pipeline.expire(self._name(user_id), self.ttl_seconds)
+        pipeline.execute()
+
+    def invalidate(self, user_id: int) -> None:
+        self._client.delete(self._name(user_id))
+
+
+class NullCache(ResponseCache):
+    def get(self, user_id: int, key: str) -> bytes | None:
+        return None
+
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        pass
+
+    def invalidate(self, user_id: int) -> None:
+        pass
+
+
+def create_cache(config: Config) -> ResponseCache:
+    match config.RESPONSE_CACHE_BACKEND:
+        case "memory":
+            return LRUCache(config.RESPONSE_CACHE_MAX_ENTRIES)
+        case "redis":
+            if config.RESPONSE_CACHE_REDIS_URL is None:
+                raise ValueError(
+                    "RESPONSE_CACHE_REDIS_URL is required by redis backend"
+                )
+            return RedisCache(
+                config.RESPONSE_CACHE_REDIS_URL, config.RESPONSE_CACHE_TTL_SECONDS
+            )
+        case "none":
+            return NullCache()
+    raise ValueError(f"Unknown cache backend '{config.RESPONSE_CACHE_BACKEND}'")
+
+
+_cache: ResponseCache | None = None
+
+
+def get_cache(config: Config = Depends(get_config)) -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = create_cache(config)
+    return _cache
+
+
+def cached_response(
+    request: Request,
+    response: Response,
+    user: d.User,
+    cache: ResponseCache,
+    build: Callable[[], Any],
+) -> Response:
+    """Serve the response from the user's cache, call `build` only on a miss
+
+    Keys are built from the path, query parameters and the user's data version,
+    so any write to the user's data makes the stale entries unreachable.
+    """
+    query = urlencode(sorted(request.query_params.multi_items()))
+    key = f"{request.url.path}?{query}:{user.data_version}"
+    etag = make_etag(user.id, key)
+    if cached := not_modified(request, response, etag):
+        return cached
+
+    content = cache.get(user.id, key)
+    if content is None:
+        content = json.dumps(jsonable_encoder(build())).encode()
+        cache.set(user.id, key, content)
+
+    headers = {name: response.headers[name] for name in ("ETag", "Cache-Control")}
+    return Response(content, media_type="application/json", headers=headers)
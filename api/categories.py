@@ -1,47 +1,147 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 import api.schemas as s
 import database.models as d
 from api import TagsEnum
-from api.auth import get_current_user
+from api.auth import get_current_user, get_read_db
+from api.cache import ResponseCache, cached_response, get_cache
+from api.etag import make_etag, not_modified
+from api.idempotency import IdempotencyStore, get_idempotency_store, idempotent_response
+from api.jobs import accepted_job_response
+from config import Config, get_config
 from database.main import get_db
+from jobs.runner import JobRunner, get_job_runner
 
 router = APIRouter(prefix="/categories", tags=[TagsEnum.CATEGORIES])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 def create_category(
+    request: Request,
     data: s.CategoryCreate,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
 ) -> s.Category:
-    if db.scalar(select(d.Category).filter_by(name=data.name, user=user)):
+    def handle() -> s.Category:
+        if db.scalar(select(d.Category).filter_by(name=data.name, user=user)):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Category '{data.name}' already exists",
+            )
+
+        category = d.Category(user=user, **data.dict(exclude_unset=True))
+        db.add(category)
+        db.commit()
+        cache.invalidate(user.id)
+        return s.Category.from_orm(category)
+
+    return idempotent_response(
+        request, user, idempotency, data, handle, status.HTTP_201_CREATED
+    )
+
+
+@router.get("/", response_model=list[s.Category], status_code=status.HTTP_200_OK)
+def get_categories(
+    request: Request,
+    response: Response,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[s.Category] | Response:
+    def build() -> list[s.Category]:
+        return [
+            s.Category.from_orm(category) for category in user.select_categories(db)
+        ]
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.get("/rules", status_code=status.HTTP_200_OK)
+def get_category_rules(
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> list[s.CategoryRule]:
+    return user.select_category_rules(db)
+
+
+@router.post("/rules", status_code=status.HTTP_201_CREATED)
+def create_category_rule(
+    data: s.CategoryRuleCreate,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.CategoryRule:
+    if not d.Category.get_from_id(data.category_id, user, db):
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Category '{data.name}' already exists",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category with the id={data.category_id} does not exist",
         )
 
-    category = d.Category(user=user, **data.dict(exclude_unset=True))
-    db.add(category)
+    rule = d.CategoryRule(user_id=user.id, **data.dict())
+    db.add(rule)
     db.commit()
-    return category
+    cache.invalidate(user.id)
+    return rule
 
 
-@router.get("/{id}", status_code=status.HTTP_200_OK)
-def get_category(
+@router.delete("/rules/{id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_category_rule(
     id: int,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> s.Category:
-    category = d.Category.get_from_id(id, user, db)
-    if not category:
+    cache: ResponseCache = Depends(get_cache),
+) -> None:
+    rule = d.CategoryRule.get_from_id(id, user, db)
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category rule with the {id=} does not exist",
+        )
+    db.delete(rule)
+    db.commit()
+    cache.invalidate(user.id)
+
+
+@router.post(
+    "/recategorize",
+    response_model=s.Job,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def recategorize_transactions(
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    config: Config = Depends(get_config),
+    runner: JobRunner = Depends(get_job_runner),
+) -> Response:
+    """Categorize all the uncategorized transactions in the background"""
+    job = runner.enqueue(
+        "recategorize", user, {"batch_size": config.CATEGORIZE_BATCH_SIZE}, db
+    )
+    return accepted_job_response(job)
+
+
+@router.get("/{id}", response_model=s.Category, status_code=status.HTTP_200_OK)
+def get_category(
+    id: int,
+    request: Request,
+    response: Response,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> s.Category | Response:
+    version = d.Category.get_version(id, user, db)
+    if version is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category with the {id=} does not exist",
         )
-    return category
+    if cached := not_modified(request, response, make_etag("category", id, version)):
+        return cached
+
+    return d.Category.get_from_id(id, user, db)
 
 
 @router.put("/{id}", status_code=status.HTTP_200_OK)
@@ -50,6 +150,7 @@ def modify_category(
     data: s.CategoryCreate,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
 ) -> s.Category:
     category = d.Category.get_from_id(id, user, db)
     if not category:
@@ -64,20 +165,72 @@ def modify_category(
         )
     category.update(data.dict(exclude_unset=True))
     db.commit()
+    cache.invalidate(user.id)
     return category
 
 
+def get_target_category(
+    id: int, target_id: int, user: d.User, db: Session
+) -> d.Category:
+    if target_id == id:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Category cannot be merged into itself",
+        )
+    target = d.Category.get_from_id(target_id, user, db)
+    if not target:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category with the id={target_id} does not exist",
+        )
+    return target
+
+
+@router.post("/{id}/merge", status_code=status.HTTP_200_OK)
+def merge_category(
+    id: int,
+    data: s.CategoryMerge,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.Category:
+    """Move the category's transactions and rules to the target, then delete it"""
+    category = d.Category.get_from_id(id, user, db)
+    if not category:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category with the {id=} does not exist",
+        )
+    target = get_target_category(id, data.target_id, user, db)
+    category.merge_into(db, target)
+    db.delete(category)
+    db.commit()
+    cache.invalidate(user.id)
+    return target
+
+
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_category(
     id: int,
+    reassign_to: int | None = None,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
 ) -> None:
+    """Delete the category
+
+    Its transactions are moved to the `reassign_to` category, or left uncategorized.
+    """
     category = d.Category.get_from_id(id, user, db)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category with the {id=} does not exist",
         )
+    target = None
+    if reassign_to is not None:
+        target = get_target_category(id, reassign_to, user, db)
+    category.reassign_transactions(db, target)
     db.delete(category)
     db.commit()
+    cache.invalidate(user.id)
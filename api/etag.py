@@ -0,0 +1,29 @@
+from hashlib import blake2b
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts: object) -> str:
+    digest = blake2b(":".join(str(part) for part in parts).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+
+    # Weak comparison - W/ prefixes are ignored on both sides
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    """Attach the ETag to the response, return 304 if the client is up to date"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
@@ -0,0 +1,56 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user
+from config import Config, get_config
+from database.main import get_db
+from events.bus import EventBus, get_event_bus
+
+router = APIRouter(prefix="/events", tags=[TagsEnum.EVENTS])
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+async def stream_events(
+    request: Request,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    bus: EventBus = Depends(get_event_bus),
+    config: Config = Depends(get_config),
+) -> StreamingResponse:
+    """Server-sent events announcing the changes of the user's data"""
+    user_id = user.id
+    # The stream is long-lived, it must not hold a pooled connection
+    db.close()
+    queue = bus.subscribe(user_id)
+
+    async def stream() -> AsyncIterator[str]:
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), config.EVENTS_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Keeps the proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_event(event)
+        finally:
+            bus.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Sequence
+
+from sqlalchemy import Row
+
+Partitions = Iterable[Sequence[Row]]
+
+# Columns of the rows streamed by User.stream_transactions
+EXPORT_COLUMNS: list[tuple[str, type]] = [
+    ("id", int),
+    ("transaction_date", datetime),
+    ("title", str),
+    ("place", str),
+    ("info", str),
+    ("base_amount", float),
+    ("base_currency", str),
+    ("main_amount", float),
+    ("category", str),
+    ("bank", str),
+    ("creation_date", datetime),
+]
+COLUMNS = [name for name, _ in EXPORT_COLUMNS]
+
+
+def _serialize(value: object) -> object:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_csv(partitions: Partitions) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode()
+    for rows in partitions:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(map(_serialize, row) for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def write_ndjson(partitions: Partitions) -> Iterator[bytes]:
+    for rows in partitions:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, map(_serialize, row)))) + "\n" for row in rows
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting the written bytes until they are taken"""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def write_parquet(partitions: Partitions) -> Iterator[bytes]:
+    """One row group per partition, each sent as soon as it is written"""
+    import pyarrow as pa  # optional dependency, only required by this format
+    import pyarrow.parquet as pq
+
+    types = {
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        datetime: pa.timestamp("us"),
+    }
+    schema = pa.schema([(name, types[type_]) for name, type_ in EXPORT_COLUMNS])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in partitions:
+            writer.write_table(
+                pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows], schema)
+            )
+            yield sink.take()
+    yield sink.take()
+
+
+# Format -> (writer, media type)
+EXPORT_FORMATS: dict[str, tuple[Callable[[Partitions], Iterator[bytes]], str]] = {
+    "csv": (write_csv, "text/csv"),
+    "ndjson": (write_ndjson, "application/x-ndjson"),
+    "parquet": (write_parquet, "application/vnd.apache.parquet"),
+}
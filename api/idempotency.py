@@ -0,0 +1,230 @@
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from hashlib import sha256
+from threading import Lock
+from typing import Any, NamedTuple
+
+import sqlalchemy as sa
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, sessionmaker
+
+import database.models as d
+from config import Config, get_config
+from database.main import get_session_factory
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+CLEANUP_INTERVAL_SECONDS = 600
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    # None while the original request is being handled
+    status_code: int | None
+    body: bytes | None
+
+
+class IdempotencyStore:
+    """Responses of the write requests, stored per user and Idempotency-Key
+
+    Keys live in an indexed table for `ttl`, completed responses are also kept
+    in a bounded in-memory LRU, which spares the database the repeated retries.
+    A request not completed within `lease` (e.g. its process died) gives its key
+    over to the next retry.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        ttl: timedelta,
+        max_memory_entries: int,
+        lease: timedelta,
+    ) -> None:
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.lease = lease
+        self.max_memory_entries = max_memory_entries
+        self._memory: OrderedDict[
+            tuple[int, str], tuple[float, StoredResponse]
+        ] = OrderedDict()
+        self._lock = Lock()
+        self._last_cleanup = 0.0
+
+    def _remember(self, user_id: int, key: str, stored: StoredResponse) -> None:
+        with self._lock:
+            self._memory[(user_id, key)] = (time.time(), stored)
+            self._memory.move_to_end((user_id, key))
+            if len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _recall(self, user_id: int, key: str) -> StoredResponse | None:
+        with self._lock:
+            entry = self._memory.get((user_id, key))
+            if entry is None:
+                return None
+            stored_at, stored = entry
+            if time.time() - stored_at > self.ttl.total_seconds():
+                del self._memory[(user_id, key)]
+                return None
+            self._memory.move_to_end((user_id, key))
+            return stored
+
+    def reserve(
+        self, user_id: int, key: str, fingerprint: str
+    ) -> StoredResponse | None:
+        """Claim the key for a new request, or return what is stored under it"""
+        if stored := self._recall(user_id, key):
+            return stored
+
+        keys = d.IdempotencyKey
+        now = datetime.utcnow()
+        expired = now - self.ttl
+        with self.session_factory() as db:
+            self._cleanup(db, expired)
+            db.execute(
+                sa.delete(keys).where(
+                    keys.user_id == user_id,
+                    keys.key == key,
+                    keys.creation_date < expired,
+                )
+            )
+            # The unique constraint lets only one of the concurrent requests in
+            claimed = db.scalar(
+                postgresql.insert(keys)
+                .values(user_id=user_id, key=key, fingerprint=fingerprint)
+                .on_conflict_do_nothing()
+                .returning(keys.id)
+            )
+            if claimed is None:
+                # Take over the abandoned claim of the same request
+                claimed = db.scalar(
+                    sa.update(keys)
+                    .where(
+                        keys.user_id == user_id,
+                        keys.key == key,
+                        keys.fingerprint == fingerprint,
+                        keys.status_code.is_(None),
+                        keys.claimed_at < now - self.lease,
+                    )
+                    .values(claimed_at=now)
+                    .returning(keys.id)
+                )
+            db.commit()
+            if claimed is not None:
+                return None
+            row = db.execute(
+                select(keys.fingerprint, keys.status_code, keys.body).filter_by(
+                    user_id=user_id, key=key
+                )
+            ).one()
+        stored = StoredResponse(*row)
+        if stored.status_code is not None:
+            self._remember(user_id, key, stored)
+        return stored
+
+    def complete(
+        self, user_id: int, key: str, fingerprint: str, status_code: int, body: bytes
+    ) -> None:
+        with self.session_factory() as db:
+            db.execute(
+                sa.update(d.IdempotencyKey)
+                .filter_by(user_id=user_id, key=key)
+                .values(status_code=status_code, body=body)
+            )
+            db.commit()
+        self._remember(user_id, key, StoredResponse(fingerprint, status_code, body))
+
+    def release(self, user_id: int, key: str) -> None:
+        """Forget the key of a failed request, so that its retry is handled anew"""
+        with self.session_factory() as db:
+            db.execute(sa.delete(d.IdempotencyKey).filter_by(user_id=user_id, key=key))
+            db.commit()
+
+    def _cleanup(self, db: Session, expired: datetime) -> None:
+        # At most once in a while, by whichever request comes first
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return
+            self._last_cleanup = now
+        db.execute(
+            sa.delete(d.IdempotencyKey).where(d.IdempotencyKey.creation_date < expired)
+        )
+
+
+_store: IdempotencyStore | None = None
+
+
+def get_idempotency_store(
+    config: Config = Depends(get_config),
+    session_factory: sessionmaker = Depends(get_session_factory),
+) -> IdempotencyStore:
+    global _store
+    if _store is None:
+        _store = IdempotencyStore(
+            session_factory,
+            timedelta(hours=config.IDEMPOTENCY_TTL_HOURS),
+            config.IDEMPOTENCY_MEMORY_ENTRIES,
+            timedelta(seconds=config.IDEMPOTENCY_LEASE_SECONDS),
+        )
+    return _store
+
+
+def idempotent_response(
+    request: Request,
+    user: d.User,
+    store: IdempotencyStore,
+    data: BaseModel,
+    handle: Callable[[], Any],
+    status_code: int,
+) -> Any:
+    """Call `handle` once per Idempotency-Key, replay its response for the retries
+
+    Requests without the header are handled as usual. A failed request releases
+    its key, so it can be retried.
+    """
+    key = request.headers.get(HEADER)
+    if key is None:
+        return handle()
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{HEADER} must have 1 to {MAX_KEY_LENGTH} characters",
+        )
+
+    fingerprint = sha256(
+        f"{request.method} {request.url.path}\n{data.json(sort_keys=True)}".encode()
+    ).hexdigest()
+    stored = store.reserve(user.id, key, fingerprint)
+    if stored is not None:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{HEADER} was already used for a different request",
+            )
+        if stored.status_code is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Request with the {HEADER} is still being handled",
+            )
+        return Response(
+            stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        content = json.dumps(jsonable_encoder(handle())).encode()
+    except BaseException:
+        store.release(user.id, key)
+        raise
+    store.complete(user.id, key, fingerprint, status_code, content)
+    return Response(content, status_code=status_code, media_type="application/json")
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user
+from database.main import get_db
+
+router = APIRouter(prefix="/jobs", tags=[TagsEnum.JOBS])
+
+
+def accepted_job_response(job: d.Job) -> JSONResponse:
+    """202 response pointing the client to the status of the enqueued job"""
+    return JSONResponse(
+        jsonable_encoder(s.Job.from_orm(job)),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": router.url_path_for("get_job", id=job.id)},
+    )
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+def get_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> list[s.Job]:
+    return list(
+        db.scalars(
+            select(d.Job)
+            .filter_by(user=user)
+            .order_by(d.Job.creation_date.desc())
+            .limit(limit)
+        ).all()
+    )
+
+
+@router.get("/{id}", status_code=status.HTTP_200_OK)
+def get_job(
+    id: int,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> s.Job:
+    job = d.Job.get_from_id(id, user, db)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with the {id=} does not exist",
+        )
+    return job
@@ -1,9 +1,30 @@
-from fastapi import APIRouter, status
+import os
+import time
+
+from fastapi import APIRouter, Depends, status
 from fastapi.responses import RedirectResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+from database.main import get_db
 
 router = APIRouter()
 
+# Measured per worker process, as each one imports the app separately
+STARTED_AT = time.monotonic()
+
 
 @router.get("/")
 def main() -> RedirectResponse:
     return RedirectResponse("/docs", status_code=status.HTTP_308_PERMANENT_REDIRECT)
+
+
+@router.get("/health", status_code=status.HTTP_200_OK)
+def health(db: Session = Depends(get_db)) -> s.Health:
+    db.execute(select(1))
+    return s.Health(
+        pid=os.getpid(),
+        uptime_seconds=time.monotonic() - STARTED_AT,
+        pool=db.get_bind().pool.status(),
+    )
@@ -0,0 +1,45 @@
+import math
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user
+from config import CurrenciesEnum
+from database.main import get_replica_db
+
+router = APIRouter(prefix="/rates", tags=[TagsEnum.RATES])
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+def get_rates(
+    day: date = Query(..., alias="date"),
+    sources: list[CurrenciesEnum] = Query(..., alias="source"),
+    targets: list[CurrenciesEnum] | None = Query(None, alias="target"),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_replica_db),
+) -> s.Rates:
+    """Rates of every source to every target currency, the main currency by default"""
+    # Deferred, NumPy is only needed once rates are requested
+    from database.conversion import CURRENCY_INDEX, RateMatrix
+
+    matrix = RateMatrix.load(db, day)
+    if not matrix.has_rates(day):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Exchange rates for the {day=} do not exist",
+        )
+    if targets is None:
+        targets = [CurrenciesEnum(user.main_currency)]
+
+    cross_rates = matrix.cross_rates(day)
+    rates: dict[CurrenciesEnum, dict[CurrenciesEnum, float | None]] = {}
+    for source in sources:
+        rates[source] = {}
+        for target in targets:
+            rate = float(cross_rates[CURRENCY_INDEX[source], CURRENCY_INDEX[target]])
+            rates[source][target] = None if math.isnan(rate) else rate
+    return s.Rates(date=day, rates=rates)
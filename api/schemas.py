@@ -1,20 +1,31 @@
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Literal
 
-import regex as re
-from pydantic import BaseModel, EmailStr, Extra, Field, validator
+from pydantic import BaseModel, EmailStr, Extra, Field, root_validator, validator
 
 from config import CurrenciesEnum
 
+if TYPE_CHECKING:
+    import regex
+
 # String must only contain alphanumeric characters and underscores
 word_regex = alphanumeric_word_regex = r"^\w+$"
 
 
+@lru_cache()
+def get_unicode_name_regex() -> "regex.Pattern":
+    # Deferred, the regex module is only needed once a name is validated
+    import regex as re
+
+    return re.compile(r"^\p{L}+$", re.UNICODE)
+
+
 def validate_unicode_name(value: str) -> str:
     if not isinstance(value, str):
         raise TypeError("String required")
 
-    regex = re.compile(r"^\p{L}+$", re.UNICODE)
-    m = regex.fullmatch(value)
+    m = get_unicode_name_regex().fullmatch(value)
     if not m:
         raise ValueError("String must only contain Unicode letters")
     return m.group()
@@ -93,6 +104,12 @@ class PasswordReset(GeneralBaseModel):
         return repeat_password
 
 
+class Health(GeneralBaseModel):
+    pid: int
+    uptime_seconds: float
+    pool: str
+
+
 class Token(GeneralBaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -114,6 +131,28 @@ class CategoryCreate(GeneralBaseModel):
     _check_unicode_regex = validator("name", allow_reuse=True)(validate_unicode_name)
 
 
+class CategoryMerge(GeneralBaseModel):
+    target_id: int
+
+
+class CategoryRule(GeneralBaseModel):
+    id: int
+    category_id: int
+    field: Literal["title", "place", "info"]
+    pattern: str
+    priority: int
+
+    class Config:
+        orm_mode = True
+
+
+class CategoryRuleCreate(GeneralBaseModel):
+    category_id: int
+    field: Literal["title", "place", "info"]
+    pattern: str = Field(..., min_length=1, max_length=100)
+    priority: int = 0
+
+
 class Bank(GeneralBaseModel):
     id: int
     name: str
@@ -141,6 +180,36 @@ class Transaction(GeneralBaseModel):
         orm_mode = True
 
 
+class CategoryTotal(GeneralBaseModel):
+    category: Category | None
+    total: float
+    count: int
+
+
+class TransactionSummary(GeneralBaseModel):
+    main_currency: CurrenciesEnum
+    total: float
+    categories: list[CategoryTotal]
+
+
+class BalancePoint(GeneralBaseModel):
+    date: date
+    balance: float
+
+
+class BankBalanceHistory(GeneralBaseModel):
+    bank: Bank
+    opening: float
+    closing: float
+    days: list[BalancePoint]
+
+
+class BankBalances(GeneralBaseModel):
+    main_currency: CurrenciesEnum
+    total: float
+    banks: list[BankBalanceHistory]
+
+
 class TransactionCreate(GeneralBaseModel):
     info: str | None
     title: str | None
@@ -159,6 +228,30 @@ class TransactionCreate(GeneralBaseModel):
         return value
 
 
+class TransactionImport(GeneralBaseModel):
+    transactions: list[TransactionCreate] = Field(..., max_items=5000)
+
+
+class TransactionImportResult(GeneralBaseModel):
+    created: int
+    duplicates: int
+
+
+class TransactionBulkModify(GeneralBaseModel):
+    category_id: int | None
+    bank_id: int | None
+    place: str | None
+
+    @root_validator(pre=True)
+    def _check_not_empty(cls, values: dict) -> dict:
+        assert values, "At least one field must be set"
+        return values
+
+
+class TransactionBulkResult(GeneralBaseModel):
+    count: int
+
+
 class TransactionModify(GeneralBaseModel):
     info: str | None
     title: str | None
@@ -175,3 +268,120 @@ class TransactionModify(GeneralBaseModel):
             value.date() < datetime.utcnow().date()
         ), "Transactions can only be set on for the past days"
         return value
+
+
+class Budget(GeneralBaseModel):
+    id: int
+    category: Category
+    monthly_limit: float
+
+    class Config:
+        orm_mode = True
+
+
+class BudgetCreate(GeneralBaseModel):
+    category_id: int
+    monthly_limit: float = Field(..., gt=0)
+
+
+class BudgetModify(GeneralBaseModel):
+    monthly_limit: float = Field(..., gt=0)
+
+
+class BudgetStatus(GeneralBaseModel):
+    budget: Budget
+    month: date
+    # Net outflow of the category's transactions in the month
+    spent: float
+    remaining: float
+
+
+class RecurringPayment(GeneralBaseModel):
+    id: int
+    description: str
+    period: str
+    amount: float
+    occurrences: int
+    last_date: date
+    next_date: date
+    confidence: float
+
+    class Config:
+        orm_mode = True
+
+
+class ForecastEntry(GeneralBaseModel):
+    date: date
+    description: str
+    amount: float
+
+
+class Forecast(GeneralBaseModel):
+    main_currency: CurrenciesEnum
+    total: float
+    entries: list[ForecastEntry]
+
+
+class Rates(GeneralBaseModel):
+    date: date
+    # Source currency -> target currency -> rate, None if unavailable
+    rates: dict[CurrenciesEnum, dict[CurrenciesEnum, float | None]]
+
+
+class Job(GeneralBaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: float
+    attempts: int
+    result: dict | None
+    error: str | None
+    creation_date: datetime
+    start_date: datetime | None
+    finish_date: datetime | None
+
+    class Config:
+        orm_mode = True
+
+
+class RecurringPayments(GeneralBaseModel):
+    # False while the detection is being refreshed by the job
+    up_to_date: bool
+    job: Job | None
+    payments: list[RecurringPayment]
+
+
+class Tombstone(GeneralBaseModel):
+    entity: str
+    id: int
+
+
+class Sync(GeneralBaseModel):
+    # Position to pass as `since` in the next request
+    cursor: str
+    has_more: bool
+    # All the data is sent again, the client's stored data must be replaced
+    reset: bool
+    user: User | None
+    categories: list[Category]
+    transactions: list[Transaction]
+    deleted: list[Tombstone]
+
+
+class BatchOperation(GeneralBaseModel):
+    method: Literal["create", "modify", "delete"]
+    entity: Literal["transaction", "category"]
+    # Required by the modify and delete operations
+    id: int | None
+    # Body of the corresponding create or modify endpoint
+    data: dict | None
+
+
+class Batch(GeneralBaseModel):
+    operations: list[BatchOperation] = Field(..., min_items=1, max_items=1000)
+
+
+class BatchResult(GeneralBaseModel):
+    status: int
+    id: int | None
+    detail: str | list | None
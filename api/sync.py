@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+import api.schemas as s
+import database.models as d
+from api import TagsEnum
+from api.auth import get_current_user, get_read_db
+
+router = APIRouter(prefix="/sync", tags=[TagsEnum.SYNC])
+
+
+def parse_cursor(
+    since: str | None = Query(None, regex=r"^\d+\.\d+$")
+) -> tuple[int, int] | None:
+    if since is None:
+        return None
+    xid, seq = since.split(".")
+    return int(xid), int(seq)
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+def sync(
+    since: tuple[int, int] | None = Depends(parse_cursor),
+    limit: int = Query(1000, ge=1, le=5000),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> s.Sync:
+    """Rows created, modified or deleted after the `since` cursor
+
+    A cursor older than the retention of the deletions gets all the data again,
+    with `reset` set - the client has to drop what it has stored.
+    Changes are returned only up to the oldest transaction running in the whole
+    database, so a long transaction delays the sync of all the users. Background
+    jobs commit their work in batches for that reason.
+    """
+    reset = since is not None and since[0] <= user.sync_horizon
+    if reset:
+        since = None
+    changes, xmin = user.select_changes(db, since, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if has_more:
+        cursor = changes[-1][2:]
+    else:
+        # Everything before xmin is synced, the running transactions come after
+        cursor = max(since or (0, 0), (xmin, 0))
+
+    ids: dict[str, list[int]] = defaultdict(list)
+    for entity, id, *_ in changes:
+        ids[entity].append(id)
+    categories = db.scalars(
+        select(d.Category).where(d.Category.id.in_(ids[d.Category.__tablename__]))
+    ).all()
+    transactions = db.scalars(
+        select(d.Transaction)
+        .where(d.Transaction.id.in_(ids[d.Transaction.__tablename__]))
+        .options(selectinload(d.Transaction.category))
+        .options(selectinload(d.Transaction.bank))
+    ).all()
+    tombstones = db.scalars(
+        select(d.Tombstone).where(d.Tombstone.id.in_(ids[d.Tombstone.__tablename__]))
+    ).all()
+
+    return s.Sync(
+        cursor=f"{cursor[0]}.{cursor[1]}",
+        has_more=has_more,
+        reset=reset,
+        user=user if ids[d.User.__tablename__] else None,
+        categories=[s.Category.from_orm(category) for category in categories],
+        transactions=[
+            s.Transaction.from_orm(transaction) for transaction in transactions
+        ],
+        deleted=[
+            s.Tombstone(entity=tombstone.entity, id=tombstone.entity_id)
+            for tombstone in tombstones
+        ],
+    )
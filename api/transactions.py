@@ -1,40 +1,405 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import importlib.util
+import math
+from datetime import date, datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 import api.schemas as s
 import database.models as d
 from api import TagsEnum
-from api.auth import get_current_user
-from database.main import get_db
+from api.auth import get_current_user, get_read_db
+from api.cache import ResponseCache, cached_response, get_cache
+from api.etag import make_etag, not_modified
+from api.export import EXPORT_FORMATS
+from api.idempotency import IdempotencyStore, get_idempotency_store, idempotent_response
+from database.categorization import get_categorizer
+from database.main import get_db, get_replica_db
+from events.bus import queue_event
+from jobs.runner import JobRunner, get_job_runner
 
 router = APIRouter(prefix="/transactions", tags=[TagsEnum.TRANSACTIONS])
 
 
+def check_references(rows: list[dict], user: d.User, db: Session) -> None:
+    """Raise 404 if the rows assign a category of another user or an unknown bank
+
+    All the referenced ids are checked with a query per table.
+    """
+    category_ids = {row.get("category_id") for row in rows} - {None}
+    if category_ids:
+        owned = set(
+            db.scalars(
+                select(d.Category.id).where(
+                    d.Category.user_id == user.id, d.Category.id.in_(category_ids)
+                )
+            )
+        )
+        if missing := category_ids - owned:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Category with the id={min(missing)} does not exist",
+            )
+    bank_ids = {row.get("bank_id") for row in rows} - {None}
+    if bank_ids:
+        existing = set(db.scalars(select(d.Bank.id).where(d.Bank.id.in_(bank_ids))))
+        if missing := bank_ids - existing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Bank with the id={min(missing)} does not exist",
+            )
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 def create_transaction(
+    request: Request,
     data: s.TransactionCreate,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    replica_db: Session = Depends(get_replica_db),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
 ) -> s.Transaction:
-    transaction = d.Transaction(user=user, **data.dict(exclude_unset=True), db=db)
-    db.add(transaction)
+    def handle() -> s.Transaction:
+        check_references([data.dict()], user, db)
+        transaction = d.Transaction(
+            user=user, **data.dict(exclude_unset=True), db=db, rates_db=replica_db
+        )
+        get_categorizer(user, db).categorize([transaction])
+        db.add(transaction)
+        db.commit()
+        cache.invalidate(user.id)
+        return s.Transaction.from_orm(transaction)
+
+    return idempotent_response(
+        request, user, idempotency, data, handle, status.HTTP_201_CREATED
+    )
+
+
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+def import_transactions(
+    request: Request,
+    data: s.TransactionImport,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    replica_db: Session = Depends(get_replica_db),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+) -> s.TransactionImportResult:
+    """Create the transactions in bulk, skipping the ones already stored"""
+    # Deferred, the bulk import pulls in NumPy
+    from database import importing
+
+    def handle() -> s.TransactionImportResult:
+        rows = [transaction.dict() for transaction in data.transactions]
+        check_references(rows, user, db)
+        try:
+            created, duplicates = importing.import_transactions(
+                user, db, rows, replica_db
+            )
+        except d.MissingRateError as error:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error)
+            )
+        if created:
+            # Bulk INSERT skips the flush hooks collecting the events
+            queue_event(
+                db, user.id, {"type": "transactions.imported", "count": created}
+            )
+        db.commit()
+        cache.invalidate(user.id)
+        return s.TransactionImportResult(created=created, duplicates=duplicates)
+
+    return idempotent_response(
+        request, user, idempotency, data, handle, status.HTTP_201_CREATED
+    )
+
+
+EXPANDABLE_FIELDS = ("category", "bank")
+DEFAULT_FIELDS = [
+    field for field in s.Transaction.__fields__ if field not in EXPANDABLE_FIELDS
+]
+SPARSE_FIELDS = [*DEFAULT_FIELDS, "category_id", "bank_id"]
+
+
+def split_names(value: str | None) -> list[str]:
+    if value is None:
+        return []
+    return list(
+        dict.fromkeys(name.strip() for name in value.split(",") if name.strip())
+    )
+
+
+def get_fieldset(
+    fields: str
+    | None = Query(
+        None, description="Comma-separated columns to return, the id is always included"
+    ),
+    expand: str
+    | None = Query(
+        None, description="Comma-separated nested objects to return: category, bank"
+    ),
+) -> tuple[list[str], list[str]] | None:
+    """Sparse fieldset of the listed transactions, None for the full representation"""
+    if fields is None and expand is None:
+        return None
+    selected = DEFAULT_FIELDS if fields is None else ["id", *split_names(fields)]
+    selected = list(dict.fromkeys(selected))
+    expanded = split_names(expand)
+    unknown = [field for field in selected if field not in SPARSE_FIELDS] + [
+        name for name in expanded if name not in EXPANDABLE_FIELDS
+    ]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return selected, expanded
+
+
+@router.get("/", response_model=list[s.Transaction], status_code=status.HTTP_200_OK)
+def get_transactions(
+    request: Request,
+    response: Response,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    category_id: int | None = None,
+    bank_id: int | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fieldset: tuple[list[str], list[str]] | None = Depends(get_fieldset),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[s.Transaction] | Response:
+    def build() -> list[s.Transaction] | list[dict]:
+        if fieldset is not None:
+            return user.select_transaction_fields(
+                db, *fieldset, date_from, date_to, category_id, bank_id, limit, offset
+            )
+        transactions = user.select_transactions(
+            db, date_from, date_to, category_id, bank_id, limit, offset
+        )
+        return [s.Transaction.from_orm(transaction) for transaction in transactions]
+
+    return cached_response(request, response, user, cache, build)
+
+
+def get_filter_clauses(
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    category_id: int | None = None,
+    bank_id: int | None = None,
+    place: str | None = None,
+) -> list:
+    """Filters of the bulk operations, which must not affect all the transactions"""
+    clauses = d.Transaction.filter_clauses(
+        date_from, date_to, category_id, bank_id, place
+    )
+    if not clauses:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one filter is required",
+        )
+    return clauses
+
+
+@router.patch("/", status_code=status.HTTP_200_OK)
+def modify_transactions(
+    data: s.TransactionBulkModify,
+    clauses: list = Depends(get_filter_clauses),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.TransactionBulkResult:
+    """Modify all the transactions matching the filters with a single statement"""
+    values = data.dict(exclude_unset=True)
+    check_references([values], user, db)
+    count = user.update_transactions(db, values, clauses)
+    if count:
+        queue_event(db, user.id, {"type": "transactions.modified", "count": count})
     db.commit()
-    return transaction
+    cache.invalidate(user.id)
+    return s.TransactionBulkResult(count=count)
 
 
-@router.get("/{id}", status_code=status.HTTP_200_OK)
+@router.delete("/", status_code=status.HTTP_200_OK)
+def delete_transactions(
+    clauses: list = Depends(get_filter_clauses),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.TransactionBulkResult:
+    """Delete all the transactions matching the filters with a single statement"""
+    count = user.delete_transactions(db, clauses)
+    if count:
+        queue_event(db, user.id, {"type": "transactions.deleted", "count": count})
+    db.commit()
+    cache.invalidate(user.id)
+    return s.TransactionBulkResult(count=count)
+
+
+@router.get(
+    "/summary", response_model=s.TransactionSummary, status_code=status.HTTP_200_OK
+)
+def get_transactions_summary(
+    request: Request,
+    response: Response,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.TransactionSummary | Response:
+    def build() -> s.TransactionSummary:
+        totals = [
+            s.CategoryTotal(
+                category=s.Category.from_orm(category) if category else None,
+                total=total,
+                count=count,
+            )
+            for category, total, count in user.summarize_transactions(
+                db, date_from, date_to
+            )
+        ]
+        return s.TransactionSummary(
+            main_currency=user.main_currency,
+            total=d.round_amount(
+                math.fsum(total.total for total in totals), user.main_currency
+            ),
+            categories=totals,
+        )
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.get("/recurring", status_code=status.HTTP_200_OK)
+def get_recurring_transactions(
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    runner: JobRunner = Depends(get_job_runner),
+) -> s.RecurringPayments:
+    """Detected recurring payments, refreshed in the background after data changes"""
+    job = None
+    if user.recurring_version != user.data_version:
+        job = runner.enqueue_once("detect_recurring", user, {}, db)
+    return s.RecurringPayments(
+        up_to_date=job is None,
+        job=job,
+        payments=user.select_recurring_payments(db),
+    )
+
+
+@router.get("/forecast", status_code=status.HTTP_200_OK)
+def get_forecast(
+    days: int = Query(90, ge=1, le=366),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> s.Forecast:
+    """Expected cash flow of the recurring payments in the following days"""
+    start = date.today()
+    end = start + timedelta(days=days)
+    entries = sorted(
+        (
+            s.ForecastEntry(
+                date=day, description=payment.description, amount=payment.amount
+            )
+            for payment in user.select_recurring_payments(db)
+            for day in payment.dates_until(start, end)
+        ),
+        key=lambda entry: entry.date,
+    )
+    return s.Forecast(
+        main_currency=user.main_currency,
+        total=d.round_amount(
+            math.fsum(entry.amount for entry in entries), user.main_currency
+        ),
+        entries=entries,
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+)
+def export_transactions(
+    export_format: Literal["csv", "ndjson", "parquet"] = Query("csv", alias="format"),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> StreamingResponse:
+    """Stream all the transactions, memory use does not depend on their number"""
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Parquet export is not available",
+        )
+
+    write, media_type = EXPORT_FORMATS[export_format]
+    filename = f"transactions.{export_format}"
+    partitions = user.stream_transactions(db, date_from, date_to)
+    return StreamingResponse(
+        write(partitions),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get(
+    "/search", response_model=list[s.Transaction], status_code=status.HTTP_200_OK
+)
+def search_transactions(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fieldset: tuple[list[str], list[str]] | None = Depends(get_fieldset),
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[s.Transaction] | Response:
+    def build() -> list[s.Transaction] | list[dict]:
+        if fieldset is not None:
+            return user.search_transaction_fields(
+                db, *fieldset, q, date_from, date_to, limit, offset
+            )
+        transactions = user.search_transactions(
+            db, q, date_from, date_to, limit, offset
+        )
+        return [s.Transaction.from_orm(transaction) for transaction in transactions]
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.get("/{id}", response_model=s.Transaction, status_code=status.HTTP_200_OK)
 def get_transaction(
     id: int,
+    request: Request,
+    response: Response,
     user: d.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-) -> s.Transaction:
-    transaction = d.Transaction.get_from_id(id, user, db)
-    if not transaction:
+    db: Session = Depends(get_read_db),
+) -> s.Transaction | Response:
+    versions = d.Transaction.get_version(id, user, db)
+    if versions is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category with the {id=} does not exist",
         )
-    return transaction
+    # Nested category is a part of the representation, so its version is too
+    if cached := not_modified(
+        request, response, make_etag("transaction", id, *versions)
+    ):
+        return cached
+
+    return d.Transaction.get_from_id(id, user, db)
 
 
 # Create TransactionModify schema
@@ -44,6 +409,8 @@ def modify_transaction(
     data: s.TransactionModify,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    replica_db: Session = Depends(get_replica_db),
 ) -> s.Transaction:
     transaction = d.Transaction.get_from_id(id, user, db)
     if not transaction:
@@ -51,8 +418,12 @@ def modify_transaction(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category with the {id=} does not exist",
         )
-    transaction.update(data.dict(exclude_unset=True), db)
+    values = data.dict(exclude_unset=True)
+    check_references([values], user, db)
+    # Exchange rates are reference data, no read-your-writes concerns
+    transaction.update(values, db, replica_db)
     db.commit()
+    cache.invalidate(user.id)
     return transaction
 
 
@@ -61,6 +432,7 @@ def delete_transaction(
     id: int,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
 ) -> None:
     transaction = d.Transaction.get_from_id(id, user, db)
     if not transaction:
@@ -70,3 +442,4 @@ def delete_transaction(
         )
     db.delete(transaction)
     db.commit()
+    cache.invalidate(user.id)
@@ -1,6 +1,16 @@
+import math
+from datetime import date
 from typing import Annotated
 
-from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status
+from fastapi import (
+    APIRouter,
+    Cookie,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 from sqlalchemy.orm import Session
@@ -13,10 +23,15 @@ from api.auth import (
     create_access_token,
     create_refresh_token,
     get_current_user,
+    get_read_db,
     verify_refresh_token,
 )
-from config import Config, get_config
+from api.cache import ResponseCache, cached_response, get_cache
+from api.etag import make_etag, not_modified
+from api.jobs import accepted_job_response
+from config import Config, CurrenciesEnum, get_config
 from database.main import get_db
+from jobs.runner import JobRunner, get_job_runner
 
 router = APIRouter(tags=[TagsEnum.USER])
 
@@ -80,33 +95,158 @@ def create_user(data: s.UserCreate, db: Session = Depends(get_db)) -> s.User:
     return new_user
 
 
-@router.get("/user")
-def current_user(user: d.User = Depends(get_current_user)) -> s.User:
+@router.get("/user", response_model=s.User)
+def current_user(
+    request: Request,
+    response: Response,
+    user: d.User = Depends(get_current_user),
+) -> s.User | Response:
+    if cached := not_modified(
+        request, response, make_etag("user", user.id, user.version_id)
+    ):
+        return cached
     return user
 
 
-@router.put("/user", response_model=s.User, status_code=status.HTTP_200_OK)
+@router.put(
+    "/user",
+    response_model=s.User,
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_202_ACCEPTED: {"model": s.Job}},
+)
 def modify_current_user(
     data: s.UserModify,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> s.User:
-    user.update(data.dict(exclude_unset=True), db)
+    cache: ResponseCache = Depends(get_cache),
+    config: Config = Depends(get_config),
+    runner: JobRunner = Depends(get_job_runner),
+) -> s.User | Response:
+    changes = data.dict(exclude_unset=True)
+    main_currency = changes.get("main_currency")
+    if (
+        main_currency is not None
+        and main_currency != user.main_currency
+        and user.count_transactions(db) > config.JOB_BACKGROUND_THRESHOLD
+    ):
+        # Re-conversion of a long history is moved out of the request
+        del changes["main_currency"]
+        user.update(changes, db)
+        db.commit()
+        job = runner.enqueue(
+            "change_main_currency", user, {"main_currency": main_currency}, db
+        )
+        return accepted_job_response(job)
+
+    user.update(changes, db)
     db.commit()
+    # Main currency change re-converts all the transactions
+    cache.invalidate(user.id)
     return user
 
 
-@router.delete("/user", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/user",
+    response_model=None,
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={status.HTTP_202_ACCEPTED: {"model": s.Job}},
+)
 def delete_current_user(
     data: s.Password,
     user: d.User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> None:
+    cache: ResponseCache = Depends(get_cache),
+    config: Config = Depends(get_config),
+    runner: JobRunner = Depends(get_job_runner),
+) -> Response | None:
     if not user.verify_password(data.password):
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Incorrect password")
 
-    db.delete(user)
-    db.commit()
+    if user.count_transactions(db) > config.JOB_BACKGROUND_THRESHOLD:
+        job = runner.enqueue(
+            "delete_account", user, {"batch_size": config.DELETE_BATCH_SIZE}, db
+        )
+        return accepted_job_response(job)
+
+    user_id = user.id
+    user.delete_account(db, config.DELETE_BATCH_SIZE)
+    cache.invalidate(user_id)
+
+
+@router.get("/user/banks", response_model=list[s.Bank], status_code=status.HTTP_200_OK)
+def current_user_banks(
+    request: Request,
+    response: Response,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[s.Bank] | Response:
+    def build() -> list[s.Bank]:
+        return [s.Bank.from_orm(bank) for bank in user.select_banks(db)]
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.get(
+    "/user/banks/balances",
+    response_model=s.BankBalances,
+    status_code=status.HTTP_200_OK,
+)
+def current_user_bank_balances(
+    request: Request,
+    response: Response,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    bank_id: int | None = None,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> s.BankBalances | Response:
+    """Closing balance at every bank per day, in the main currency"""
+
+    def build() -> s.BankBalances:
+        def rounded(amount: float) -> float:
+            return d.round_amount(amount, user.main_currency)
+
+        histories = [
+            s.BankBalanceHistory(
+                bank=s.Bank.from_orm(bank),
+                opening=rounded(opening),
+                closing=rounded(days[-1][1] if days else opening),
+                days=[
+                    s.BalancePoint(date=day, balance=rounded(balance))
+                    for day, balance in days
+                ],
+            )
+            for bank, opening, days in user.select_bank_balances(
+                db, date_from, date_to, bank_id
+            )
+        ]
+        return s.BankBalances(
+            main_currency=user.main_currency,
+            total=rounded(math.fsum(history.closing for history in histories)),
+            banks=histories,
+        )
+
+    return cached_response(request, response, user, cache, build)
+
+
+@router.get(
+    "/user/currencies",
+    response_model=list[CurrenciesEnum],
+    status_code=status.HTTP_200_OK,
+)
+def current_user_currencies(
+    request: Request,
+    response: Response,
+    user: d.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache: ResponseCache = Depends(get_cache),
+) -> list[CurrenciesEnum] | Response:
+    def build() -> list[str]:
+        return user.select_base_currencies(db)
+
+    return cached_response(request, response, user, cache, build)
 
 
 @router.put("/user/password", status_code=status.HTTP_200_OK)
@@ -0,0 +1,50 @@
+"""Cold start benchmark - import of the application module and the app creation
+
+Every sample runs in a fresh interpreter, as an autoscaled container would.
+
+Usage:
+    python -m benchmarks.startup --runs 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+SAMPLE = """
+import time
+start = time.perf_counter()
+import wallitapi
+imported = time.perf_counter()
+wallitapi.create_app()
+created = time.perf_counter()
+print(imported - start, created - imported)
+"""
+
+
+def measure(runs: int) -> tuple[list[float], list[float]]:
+    imports, creations = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SAMPLE], capture_output=True, text=True, check=True
+        ).stdout
+        import_time, creation_time = map(float, output.split())
+        imports.append(import_time)
+        creations.append(creation_time)
+    return imports, creations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    imports, creations = measure(args.runs)
+    for label, samples in (("import", imports), ("create_app", creations)):
+        print(
+            f"{label:>10}: median {statistics.median(samples) * 1000:.1f} ms, "
+            f"min {min(samples) * 1000:.1f} ms, max {max(samples) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
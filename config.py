@@ -160,6 +160,21 @@ class CurrenciesEnum(str, Enum):
     ZMW = "ZMW"
 
 
+# ISO 4217 minor unit exponents, the currencies not listed have cents
+CURRENCY_EXPONENTS = {
+    **dict.fromkeys(
+        ["BIF", "CLP", "DJF", "GNF", "ISK", "JPY", "KMF", "KRW", "PYG"]
+        + ["RWF", "UGX", "VND", "VUV", "XAF", "XOF", "XPF"],
+        0,
+    ),
+    **dict.fromkeys(["BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND"], 3),
+}
+
+
+def currency_exponent(currency: str) -> int:
+    return CURRENCY_EXPONENTS.get(currency, 2)
+
+
 class Config(BaseSettings):
     class Config:
         env_file = ".env"
@@ -170,6 +185,49 @@ class Config(BaseSettings):
     REFRESH_TOKEN_EXPIRATION_DAYS: int = 3
 
     SQLALCHEMY_DATABASE_URI: str
+    # Optional replica serving the read-only endpoints
+    SQLALCHEMY_READ_REPLICA_URI: str | None = None
+    # Range partitioning of transactions - "month", "year" or None (disabled)
+    TRANSACTIONS_PARTITION_INTERVAL: str | None = None
+    TRANSACTIONS_PARTITIONS_AHEAD: int = 3
+
+    # Response cache of per-user list/summary endpoints - "memory", "redis" or "none"
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_MAX_ENTRIES: int = 4096
+    RESPONSE_CACHE_TTL_SECONDS: int = 600
+    RESPONSE_CACHE_REDIS_URL: str | None = None
+
+    # Fan-out of the data change events - "memory" (single process) or "postgres"
+    EVENTS_BACKEND: str = "memory"
+    EVENTS_KEEPALIVE_SECONDS: int = 15
+
+    # Responses replayed for the retried requests with the same Idempotency-Key
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_MEMORY_ENTRIES: int = 1024
+    # Requests still unanswered after this are considered dead, their retry is handled
+    IDEMPOTENCY_LEASE_SECONDS: int = 60
+
+    # Background jobs
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_DELAY_SECONDS: int = 10
+    JOB_STALE_MINUTES: int = 60
+    # Operations touching more transactions than this are run as background jobs
+    JOB_BACKGROUND_THRESHOLD: int = 5000
+    # Rows removed per DELETE statement (and commit) of the account deletion
+    DELETE_BATCH_SIZE: int = 5000
+    # Transactions categorized per UPDATE batch (and commit) of the re-categorization
+    CATEGORIZE_BATCH_SIZE: int = 1000
+
+    # Production server, started with `python wallitapi.py`
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int | None = None  # one per CPU core if not set
+    SERVER_LOOP: str = "uvloop"
+    SERVER_HTTP: str = "httptools"
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_BACKLOG: int = 2048
+    SERVER_GRACEFUL_SHUTDOWN_SECONDS: int = 30
 
     # Currency conversion API
     CURRENCYSCOOP_API_KEY: str
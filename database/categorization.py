@@ -0,0 +1,251 @@
+"""Categorization of transactions by the user's rules and categorization history
+
+Rules are case-insensitive substring matches on a single text field, tried in
+the order of their priority. Transactions not matched by any rule are classified
+by the words of their text fields, voting for the categories other transactions
+containing the same words were given.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Callable, Iterable
+from threading import Lock
+
+import sqlalchemy as sa
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.models import (
+    Category,
+    CategorySpend,
+    SpendDeltas,
+    Transaction,
+    User,
+    add_spend_delta,
+    bump_data_versions,
+)
+
+# Words of at least 3 letters, numbers and dates are not descriptive
+WORD_REGEX = re.compile(r"[^\W\d_]{3,}")
+
+# Most recent categorized transactions the word model is trained on
+TRAINING_SIZE = 5000
+# Data versions after which the word model is retrained
+RETRAIN_AFTER = 20
+# Average share of the votes a category needs to be assigned
+MIN_CONFIDENCE = 0.6
+MAX_CACHED_USERS = 1024
+
+
+def extract_words(*texts: str | None) -> set[str]:
+    return {
+        word for text in texts if text for word in WORD_REGEX.findall(text.casefold())
+    }
+
+
+class Categorizer:
+    def __init__(
+        self,
+        rules: list[tuple[str, str, int]],
+        category_ids: set[int],
+        word_shares: dict[str, dict[int, float]],
+        rules_version: int,
+        model_version: int,
+    ) -> None:
+        # (field, casefolded pattern, category id) in the order of application
+        self.rules = rules
+        # Categories existing at the rules version, the model may know deleted ones
+        self.category_ids = category_ids
+        # Word -> category id -> share of the word's occurrences in the category
+        self.word_shares = word_shares
+        self.rules_version = rules_version
+        self.model_version = model_version
+
+    @staticmethod
+    def load_rules(user: User, db: Session) -> list[tuple[str, str, int]]:
+        return [
+            (rule.field, rule.pattern.casefold(), rule.category_id)
+            for rule in user.select_category_rules(db)
+        ]
+
+    @staticmethod
+    def load_category_ids(user: User, db: Session) -> set[int]:
+        return set(db.scalars(select(Category.id).filter_by(user_id=user.id)))
+
+    @staticmethod
+    def train(user: User, db: Session) -> dict[str, dict[int, float]]:
+        rows = db.execute(
+            select(
+                Transaction.category_id,
+                Transaction.title,
+                Transaction.place,
+                Transaction.info,
+            )
+            .filter_by(user_id=user.id)
+            .where(Transaction.category_id.is_not(None))
+            .order_by(Transaction.id.desc())
+            .limit(TRAINING_SIZE)
+        )
+        counts: dict[str, Counter[int]] = defaultdict(Counter)
+        for category_id, *texts in rows:
+            for word in extract_words(*texts):
+                counts[word][category_id] += 1
+
+        return {
+            word: {
+                category_id: count / sum(categories.values())
+                for category_id, count in categories.items()
+            }
+            for word, categories in counts.items()
+        }
+
+    def predict(
+        self, title: str | None, place: str | None, info: str | None
+    ) -> int | None:
+        texts = {"title": title, "place": place, "info": info}
+        for field, pattern, category_id in self.rules:
+            text = texts[field]
+            if text and pattern in text.casefold():
+                return category_id
+
+        known_words = [
+            word
+            for word in extract_words(title, place, info)
+            if word in self.word_shares
+        ]
+        if not known_words:
+            return None
+        votes: Counter[int] = Counter()
+        for word in known_words:
+            votes.update(
+                {
+                    category_id: share
+                    for category_id, share in self.word_shares[word].items()
+                    if category_id in self.category_ids
+                }
+            )
+        if not votes:
+            return None
+        category_id, score = votes.most_common(1)[0]
+        return category_id if score / len(known_words) >= MIN_CONFIDENCE else None
+
+    def categorize(self, transactions: Iterable[Transaction]) -> int:
+        """Assign categories to the uncategorized transactions, return their number"""
+        categorized = 0
+        for transaction in transactions:
+            if transaction.category_id is not None or transaction.category is not None:
+                continue
+            category_id = self.predict(
+                transaction.title, transaction.place, transaction.info
+            )
+            if category_id is not None:
+                transaction.category_id = category_id
+                categorized += 1
+        return categorized
+
+
+_categorizers: OrderedDict[int, Categorizer] = OrderedDict()
+_lock = Lock()
+
+
+def get_categorizer(user: User, db: Session) -> Categorizer:
+    """User's categorizer, rebuilt only as much as the user's data changed
+
+    Rules and category ids are reloaded on any change of the data version, while
+    the word model is retrained only once every RETRAIN_AFTER versions.
+    Its predictions of the categories deleted since are ignored.
+    """
+    version = user.data_version
+    with _lock:
+        categorizer = _categorizers.get(user.id)
+
+    if categorizer is None or not (
+        0 <= version - categorizer.model_version <= RETRAIN_AFTER
+    ):
+        categorizer = Categorizer(
+            Categorizer.load_rules(user, db),
+            Categorizer.load_category_ids(user, db),
+            Categorizer.train(user, db),
+            version,
+            version,
+        )
+    elif categorizer.rules_version != version:
+        categorizer = Categorizer(
+            Categorizer.load_rules(user, db),
+            Categorizer.load_category_ids(user, db),
+            categorizer.word_shares,
+            version,
+            categorizer.model_version,
+        )
+
+    with _lock:
+        _categorizers[user.id] = categorizer
+        _categorizers.move_to_end(user.id)
+        while len(_categorizers) > MAX_CACHED_USERS:
+            _categorizers.popitem(last=False)
+    return categorizer
+
+
+def recategorize(
+    user: User,
+    db: Session,
+    batch_size: int,
+    report_progress: Callable[[float], None] | None = None,
+) -> int:
+    """Categorize all the user's uncategorized transactions with set-based UPDATEs"""
+    categorizer = get_categorizer(user, db)
+    uncategorized = (Transaction.user_id == user.id, Transaction.category_id.is_(None))
+    total = db.scalar(select(sa.func.count()).where(*uncategorized)) or 1
+
+    processed = categorized = last_id = 0
+    while True:
+        rows = db.execute(
+            select(
+                Transaction.id,
+                Transaction.title,
+                Transaction.place,
+                Transaction.info,
+                Transaction.transaction_date,
+                Transaction.main_amount,
+            )
+            .where(*uncategorized, Transaction.id > last_id)
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        assigned: dict[int, list[int]] = defaultdict(list)
+        spend_deltas: SpendDeltas = {}
+        for row in rows:
+            category_id = categorizer.predict(row.title, row.place, row.info)
+            if category_id is not None:
+                assigned[category_id].append(row.id)
+                add_spend_delta(
+                    spend_deltas,
+                    user.id,
+                    category_id,
+                    row.transaction_date,
+                    row.main_amount,
+                    1,
+                )
+        for category_id, ids in assigned.items():
+            result = db.execute(
+                sa.update(Transaction)
+                .where(Transaction.id.in_(ids), *uncategorized)
+                .values(category_id=category_id, version_id=Transaction.version_id + 1)
+                .execution_options(synchronize_session=False)
+            )
+            categorized += result.rowcount
+        if assigned:
+            # Bulk UPDATEs skip the flush hooks
+            CategorySpend.apply_deltas(db.connection(), spend_deltas)
+            bump_data_versions(db.connection(), [user.id])
+        db.commit()
+
+        processed += len(rows)
+        if report_progress is not None:
+            report_progress(processed / total)
+    return categorized
@@ -0,0 +1,163 @@
+"""Vectorized currency conversion over the EUR-bridge exchange rates
+
+Importing this module pulls in NumPy, so it is imported only where conversion
+of many amounts at once is needed.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import CurrenciesEnum, currency_exponent
+from database.models import ExchangeRate, MissingRateError
+
+CURRENCIES = [currency.value for currency in CurrenciesEnum]
+CURRENCY_INDEX = {currency: i for i, currency in enumerate(CURRENCIES)}
+BRIDGE_CURRENCY = "EUR"
+
+
+def round_amounts(amounts: np.ndarray, currency: str) -> np.ndarray:
+    """Vectorized `round_amount` - half to even, to the currency's minor unit"""
+    scale = 10.0 ** currency_exponent(currency)
+    # Rounding off the binary noise first turns e.g. 267.49999999999997 into 267.5
+    return np.rint(np.round(amounts * scale, 6)) / scale
+
+
+class RateMatrix:
+    """Rates of all the currencies to the bridge currency, one row per day
+
+    Missing rates are stored as NaN. Cross rate of any pair on a day is
+    `rates[day, target] / rates[day, source]`, as in `ExchangeRate.find_exchange_rate`.
+    """
+
+    def __init__(self, start: date, rates: np.ndarray) -> None:
+        self.start = start
+        self.rates = rates
+
+    @classmethod
+    def load(
+        cls,
+        db: Session,
+        date_from: date,
+        date_to: date | None = None,
+        currencies: Iterable[str] | None = None,
+    ) -> RateMatrix:
+        """Load the rates of the days in [date_from, date_to] with a single query"""
+        date_to = date_to or date_from
+        days = (date_to - date_from).days + 1
+        rates = np.full((days, len(CURRENCIES)), np.nan)
+        # Rates are quoted against the bridge currency, which may not be stored
+        rates[:, CURRENCY_INDEX[BRIDGE_CURRENCY]] = 1.0
+
+        query = select(ExchangeRate.date, ExchangeRate.source, ExchangeRate.rate).where(
+            ExchangeRate.date >= date_from,
+            ExchangeRate.date < date_to + timedelta(days=1),
+        )
+        if currencies is not None:
+            query = query.where(ExchangeRate.source.in_(set(currencies)))
+        for day, source, rate in db.execute(query):
+            if source in CURRENCY_INDEX:
+                rates[(day.date() - date_from).days, CURRENCY_INDEX[source]] = rate
+        return cls(date_from, rates)
+
+    def _day_indices(self, days: Sequence[date]) -> np.ndarray:
+        indices = np.array([(day - self.start).days for day in days], dtype=np.intp)
+        outside = (indices < 0) | (indices >= len(self.rates))
+        if outside.any():
+            raise MissingRateError(
+                f"Rates for {days[int(np.argmax(outside))]} were not loaded"
+            )
+        return indices
+
+    def has_rates(self, day: date) -> bool:
+        """Whether any rate besides the bridge currency's one is known on the day"""
+        row = self.rates[self._day_indices([day])[0]]
+        return np.count_nonzero(~np.isnan(row)) > 1
+
+    def cross_rates(self, day: date) -> np.ndarray:
+        """Matrix of all the cross rates on the day, indexed [source, target]"""
+        row = self.rates[self._day_indices([day])[0]]
+        return row[np.newaxis, :] / row[:, np.newaxis]
+
+    def bridge_rate(self, day: date, currency: str) -> float | None:
+        """Units of the currency per one of the bridge currency, None if unknown"""
+        if currency == BRIDGE_CURRENCY:
+            return 1.0
+        rate = self.rates[self._day_indices([day])[0], CURRENCY_INDEX[currency]]
+        return None if np.isnan(rate) else float(rate)
+
+    def rate(self, day: date, source: str, target: str) -> float:
+        row = self.rates[self._day_indices([day])[0]]
+        rate = row[CURRENCY_INDEX[target]] / row[CURRENCY_INDEX[source]]
+        if np.isnan(rate):
+            raise MissingRateError(f"No {source}/{target} rate on {day}")
+        return float(rate)
+
+    def to_bridge(
+        self, amounts: Sequence[float], sources: Sequence[str], days: Sequence[date]
+    ) -> np.ndarray:
+        """Amounts in the bridge currency, NaN where the source rate is missing"""
+        source_indices = np.array(
+            [CURRENCY_INDEX[source] for source in sources], dtype=np.intp
+        )
+        day_rates = self.rates[self._day_indices(days)]
+        positions = np.arange(len(source_indices))
+        return np.asarray(amounts, dtype=float) / day_rates[positions, source_indices]
+
+    def from_bridge(
+        self, bridge_amounts: Sequence[float], target: str, days: Sequence[date]
+    ) -> np.ndarray:
+        """Bridge currency amounts in the target currency, rounded to its minor unit
+
+        Needs just the target rate of every day. NaN where it is missing.
+        """
+        target_rates = self.rates[self._day_indices(days), CURRENCY_INDEX[target]]
+        return round_amounts(
+            np.asarray(bridge_amounts, dtype=float) * target_rates, target
+        )
+
+    def convert(
+        self,
+        amounts: Sequence[float],
+        sources: Sequence[str],
+        target: str,
+        days: Sequence[date],
+        bridge_amounts: Sequence[float | None] | None = None,
+    ) -> np.ndarray:
+        """Convert the amounts, each in its own currency and on its own day, to `target`
+
+        Amounts already in the target currency are kept as they are, the others
+        are rounded to the target's minor unit. Known `bridge_amounts` spare the lookups
+        of the source rates, the unknown (None) ones are derived from them.
+        """
+        amounts_array = np.asarray(amounts, dtype=float)
+        if not len(amounts_array):
+            return amounts_array
+
+        if bridge_amounts is None:
+            bridge = self.to_bridge(amounts_array, sources, days)
+        else:
+            bridge = np.array(bridge_amounts, dtype=float)
+            unknown = np.flatnonzero(np.isnan(bridge))
+            if len(unknown):
+                bridge[unknown] = self.to_bridge(
+                    amounts_array[unknown],
+                    [sources[i] for i in unknown],
+                    [days[i] for i in unknown],
+                )
+        source_indices = np.array([CURRENCY_INDEX[source] for source in sources])
+        converted = np.where(
+            source_indices == CURRENCY_INDEX[target],
+            amounts_array,
+            self.from_bridge(bridge, target, days),
+        )
+
+        missing = np.isnan(converted)
+        if missing.any():
+            i = int(np.argmax(missing))
+            raise MissingRateError(f"No {sources[i]}/{target} rate on {days[i]}")
+        return converted
@@ -0,0 +1,126 @@
+"""Bulk import of transactions, skipping the ones already stored
+
+Importing this module pulls in NumPy, so it is imported only where the import runs.
+"""
+import math
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.categorization import get_categorizer
+from database.conversion import RateMatrix
+from database.models import (
+    BalanceDeltas,
+    BankBalance,
+    CategorySpend,
+    SpendDeltas,
+    Transaction,
+    User,
+    add_balance_delta,
+    add_spend_delta,
+    bump_data_versions,
+)
+
+
+def count_stored(user: User, db: Session, fingerprints: set[str]) -> Counter[str]:
+    """Number of the user's stored transactions per fingerprint, with a single query"""
+    rows = db.execute(
+        select(Transaction.fingerprint, sa.func.count())
+        .where(
+            Transaction.user_id == user.id, Transaction.fingerprint.in_(fingerprints)
+        )
+        .group_by(Transaction.fingerprint)
+    )
+    return Counter(dict(rows.tuples().all()))
+
+
+def import_transactions(
+    user: User, db: Session, rows: list[dict], rates_db: Session | None = None
+) -> tuple[int, int]:
+    """Insert the transactions not stored yet, return the numbers of created and skipped
+
+    A fingerprint is inserted only as many times as it occurs in the batch beyond
+    the number of times it is already stored. Re-imported overlapping statements
+    create nothing, while genuinely repeated transactions within one are kept.
+    """
+    if not rows:
+        return 0, 0
+
+    # Concurrent imports of the same user would not see each other's rows
+    db.execute(select(sa.func.pg_advisory_xact_lock(user.id)))
+    fingerprints = [
+        Transaction.make_fingerprint(
+            row["base_amount"],
+            row["base_currency"],
+            row["transaction_date"],
+            row.get("title"),
+            row.get("place"),
+        )
+        for row in rows
+    ]
+    stored = count_stored(user, db, set(fingerprints))
+    new_rows = []
+    for row, fingerprint in zip(rows, fingerprints):
+        if stored[fingerprint] > 0:
+            stored[fingerprint] -= 1
+        else:
+            new_rows.append({**row, "fingerprint": fingerprint})
+    if not new_rows:
+        return 0, len(rows)
+
+    days = [row["transaction_date"].date() for row in new_rows]
+    currencies = {row["base_currency"] for row in new_rows}
+    rates = RateMatrix.load(
+        rates_db or db, min(days), max(days), currencies | {user.main_currency}
+    )
+    amounts = [row["base_amount"] for row in new_rows]
+    sources = [row["base_currency"] for row in new_rows]
+    eur_amounts = rates.to_bridge(amounts, sources, days)
+    main_amounts = rates.convert(
+        amounts, sources, user.main_currency, days, eur_amounts
+    ).tolist()
+
+    categorizer = get_categorizer(user, db)
+    for row, main_amount, eur_amount, day in zip(
+        new_rows, main_amounts, eur_amounts.tolist(), days
+    ):
+        known = not math.isnan(eur_amount)
+        row.update(
+            user_id=user.id,
+            main_amount=main_amount,
+            eur_amount=eur_amount if known else None,
+            rate_date=day if known else None,
+            version_id=1,
+        )
+        if row.get("category_id") is None:
+            row["category_id"] = categorizer.predict(
+                row.get("title"), row.get("place"), row.get("info")
+            )
+
+    db.execute(sa.insert(Transaction), new_rows)
+    # Bulk INSERT skips the flush hooks
+    spend_deltas: SpendDeltas = {}
+    balance_deltas: BalanceDeltas = {}
+    for row in new_rows:
+        add_spend_delta(
+            spend_deltas,
+            user.id,
+            row["category_id"],
+            row["transaction_date"],
+            row["main_amount"],
+            1,
+        )
+        add_balance_delta(
+            balance_deltas,
+            user.id,
+            row.get("bank_id"),
+            row["transaction_date"],
+            row["main_amount"],
+            1,
+        )
+    CategorySpend.apply_deltas(db.connection(), spend_deltas)
+    BankBalance.apply_deltas(db.connection(), balance_deltas)
+    bump_data_versions(db.connection(), [user.id])
+    return len(new_rows), len(rows) - len(new_rows)
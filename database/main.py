@@ -1,18 +1,64 @@
 from typing import Generator
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from config import get_config
 
-Engine = create_engine(get_config().SQLALCHEMY_DATABASE_URI)
-SessionLocal = sessionmaker(bind=Engine, autocommit=False, autoflush=True)
+# Bound to the engines once they are created
+SessionLocal = sessionmaker(autocommit=False, autoflush=True)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+_engine: Engine | None = None
+_replica_engine: Engine | None = None
+
+
+def get_engine() -> Engine:
+    """Create the engine on the first use - importing the models requires no config"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(get_config().SQLALCHEMY_DATABASE_URI)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def get_replica_engine() -> Engine:
+    """Engine of the read replica, the primary engine if no replica is configured"""
+    global _replica_engine
+    if _replica_engine is None:
+        uri = get_config().SQLALCHEMY_READ_REPLICA_URI
+        _replica_engine = create_engine(uri) if uri else get_engine()
+        ReplicaSessionLocal.configure(bind=_replica_engine)
+    return _replica_engine
+
+
+def dispose_engine() -> None:
+    global _engine, _replica_engine
+    for engine in {_engine, _replica_engine} - {None}:
+        engine.dispose()
+    _engine = _replica_engine = None
+
 
 def get_db() -> Generator[Session, None, None]:
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_session_factory() -> sessionmaker:
+    get_engine()
+    return SessionLocal
+
+
+def get_replica_db() -> Generator[Session, None, None]:
+    get_replica_engine()
+    db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,17 +1,93 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_EVEN, Decimal
 from enum import Enum
+from functools import lru_cache
+from hashlib import blake2b
+from itertools import chain
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Sequence
 
 import sqlalchemy as sa
 import sqlalchemy.orm as so
-from passlib.context import CryptContext
 from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Session, with_parent
 
+from config import currency_exponent
 from database.main import Base
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# (user_id, category_id, month) -> (change of the total, change of the count)
+SpendDeltas = dict[tuple[int, int, date], tuple[float, int]]
+# (user_id, bank_id, day) -> (change of the balance, change of the count)
+BalanceDeltas = dict[tuple[int, int, date], tuple[float, int]]
+
+# Amounts are stored exactly, so SUMs in SQL don't drift. Python still gets floats,
+# rounded to the currency's minor unit on the way in.
+Money = sa.Numeric(18, 4, asdecimal=False)
+
+
+def round_amount(amount: float, currency: str) -> float:
+    """Round half to even to the currency's minor unit, in decimal arithmetic"""
+    unit = Decimal(1).scaleb(-currency_exponent(currency))
+    return float(Decimal(repr(amount)).quantize(unit, ROUND_HALF_EVEN))
+
+
+# Shared by all the synchronized tables, orders their changes globally
+CHANGE_SEQ = sa.Sequence("change_seq", metadata=Base.metadata)
+
+
+def change_seq_column() -> so.MappedColumn[int]:
+    """Number of the row's latest change, assigned by every INSERT and UPDATE"""
+    return so.mapped_column(
+        sa.BigInteger,
+        server_default=CHANGE_SEQ.next_value(),
+        onupdate=CHANGE_SEQ.next_value(),
+        index=True,
+    )
+
+
+def current_xid() -> sa.ColumnElement[int]:
+    """Id of the current database transaction, as a 64-bit integer"""
+    return sa.func.pg_current_xact_id().cast(sa.Text).cast(sa.BigInteger)
+
+
+def snapshot_xmin() -> sa.ColumnElement[int]:
+    """Id of the oldest transaction still running, all the older ones are finished"""
+    return (
+        sa.func.pg_snapshot_xmin(sa.func.pg_current_snapshot())
+        .cast(sa.Text)
+        .cast(sa.BigInteger)
+    )
+
+
+def change_xid_column() -> so.MappedColumn[int]:
+    """Transaction of the row's latest change
+
+    Sequence numbers are taken before the commit, so they don't follow the commit
+    order. Syncing uses the transaction ids to wait for the overlapping writes.
+    """
+    return so.mapped_column(
+        sa.BigInteger,
+        server_default=sa.text("pg_current_xact_id()::text::bigint"),
+        onupdate=current_xid(),
+        index=True,
+    )
+
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+    from database.conversion import RateMatrix
+
+
+@lru_cache()
+def get_pwd_context() -> CryptContext:
+    # Deferred, passlib and bcrypt are only needed once a password is checked
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 class UpdatableMixin:
@@ -30,6 +106,17 @@ class User(Base, UpdatableMixin):
     first_name: so.Mapped[str] = so.mapped_column(sa.Text)
     last_name: so.Mapped[str] = so.mapped_column(sa.Text)
     main_currency: so.Mapped[str] = so.mapped_column(sa.String(3), default="CZK")
+    version_id: so.Mapped[int] = so.mapped_column(nullable=False)
+    change_seq: so.Mapped[int] = change_seq_column()
+    change_xid: so.Mapped[int] = change_xid_column()
+    # Latest transaction whose tombstones were pruned, older sync cursors must resync
+    sync_horizon: so.Mapped[int] = so.mapped_column(
+        sa.BigInteger, default=0, server_default="0"
+    )
+    # Bumped on every change of the user's data or main currency
+    data_version: so.Mapped[int] = so.mapped_column(default=0, server_default="0")
+    # Data version the recurring payments were last detected on
+    recurring_version: so.Mapped[int | None] = so.mapped_column()
 
     transactions: so.Mapped[list[Transaction]] = so.relationship(
         "Transaction",
@@ -48,6 +135,8 @@ class User(Base, UpdatableMixin):
         uselist=True,
     )
 
+    __mapper_args__ = {"version_id_col": version_id}
+
     @property
     def password(self) -> None:
         raise AttributeError("Password is not a readable attribute")
@@ -61,28 +150,553 @@ class User(Base, UpdatableMixin):
 
     def update(self, data: dict, db: Session, *args, **kwargs) -> None:
         if "main_currency" in data and data["main_currency"] != self.main_currency:
-            for transaction in self.select_transactions(db):
-                transaction.convert_to_main_amount(data["main_currency"])
+            self.change_main_currency(data["main_currency"], db)
         super(self.__class__, self).update(data)
 
+    def change_main_currency(
+        self,
+        main_currency: str,
+        db: Session,
+        report_progress: Callable[[float], None] | None = None,
+        batch_size: int = 1000,
+        commit_batches: bool = False,
+    ) -> None:
+        """Re-convert all the transactions and budget limits to the new main currency
+
+        Transactions are processed in batches in the order of their ids and flushed
+        after each one, so the memory use does not grow with the history.
+        With `commit_batches` each batch is committed as well, so that a long history
+        doesn't hold back the xmin the sync cursors advance to. Until the final
+        commit of the budgets and the currency itself, the amounts are converted
+        only partially. A rerun completes them, as it converts the base amounts.
+        Transactions normalized to EUR need only the new currency's rate of every day,
+        the source rates are loaded only for the ones stored without eur_amount.
+        """
+        # Deferred, NumPy is only needed for the bulk conversion
+        from database.conversion import RateMatrix
+
+        total = self.count_transactions(db) or 1
+        converted = 0
+        last_id = 0
+        while True:
+            transactions = db.scalars(
+                select(Transaction)
+                .where(with_parent(self, User.transactions), Transaction.id > last_id)
+                .order_by(Transaction.id)
+                .limit(batch_size)
+            ).all()
+            if not transactions:
+                break
+            days = [transaction.transaction_date.date() for transaction in transactions]
+            currencies = {
+                transaction.base_currency
+                for transaction in transactions
+                if transaction.eur_amount is None
+            }
+            rates = RateMatrix.load(
+                db, min(days), max(days), currencies | {main_currency}
+            )
+            amounts = rates.convert(
+                [transaction.base_amount for transaction in transactions],
+                [transaction.base_currency for transaction in transactions],
+                main_currency,
+                days,
+                [transaction.eur_amount for transaction in transactions],
+            ).tolist()
+            for transaction, amount in zip(transactions, amounts):
+                transaction.main_amount = amount
+            last_id = transactions[-1].id
+            # Flushed rows are no longer referenced by the session
+            if commit_batches:
+                db.commit()
+            else:
+                db.flush()
+            converted += len(transactions)
+            if report_progress is not None:
+                report_progress(converted / total)
+
+        # Budget limits are in the main currency too, converted at the latest rate
+        budgets = db.scalars(select(Budget).filter_by(user_id=self.id)).all()
+        if budgets:
+            currencies = {self.main_currency, main_currency}
+            day = ExchangeRate.find_latest_day(currencies, db)
+            if day is None:
+                raise MissingRateError(
+                    f"No {self.main_currency}/{main_currency} rate for the budgets"
+                )
+            limits = (
+                RateMatrix.load(db, day, day, currencies)
+                .convert(
+                    [budget.monthly_limit for budget in budgets],
+                    [self.main_currency] * len(budgets),
+                    main_currency,
+                    [day] * len(budgets),
+                )
+                .tolist()
+            )
+            for budget, limit in zip(budgets, limits):
+                budget.monthly_limit = limit
+        self.main_currency = main_currency
+
+    def delete_account(
+        self,
+        db: Session,
+        batch_size: int,
+        report_progress: Callable[[float], None] | None = None,
+    ) -> None:
+        """Delete the user and all the owned data with bulk DELETEs in bounded batches
+
+        Rows are never loaded into the session and every batch is committed
+        separately, so that neither memory nor lock duration grows with the history.
+        """
+        total = self.count_transactions(db) + self.count_categories(db) or 1
+        deleted = 0
+        for model in (Transaction, Category):
+            while True:
+                batch = (
+                    select(model.id)
+                    .filter_by(user_id=self.id)
+                    .limit(batch_size)
+                    .scalar_subquery()
+                )
+                result = db.execute(
+                    sa.delete(model)
+                    .where(model.id.in_(batch))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                if result.rowcount == 0:
+                    break
+                deleted += result.rowcount
+                if report_progress is not None:
+                    report_progress(deleted / total)
+
+        db.execute(
+            sa.delete(User)
+            .where(User.id == self.id)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
     def set_password(self, password: str) -> None:
-        self.password_hash = pwd_context.hash(password)
+        self.password_hash = get_pwd_context().hash(password)
 
     def verify_password(self, plain_password: str) -> bool:
-        return pwd_context.verify(plain_password, self.password_hash)
+        return get_pwd_context().verify(plain_password, self.password_hash)
+
+    def _transactions_query(
+        self,
+        date_from: datetime | None,
+        date_to: datetime | None,
+        category_id: int | None,
+        bank_id: int | None,
+        limit: int | None,
+        offset: int,
+    ) -> sa.Select:
+        return (
+            select(Transaction)
+            .where(
+                with_parent(self, User.transactions),
+                *Transaction.filter_clauses(date_from, date_to, category_id, bank_id),
+            )
+            .order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+
+    def select_transactions(
+        self,
+        db: Session,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        category_id: int | None = None,
+        bank_id: int | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[Transaction]:
+        query = (
+            self._transactions_query(
+                date_from, date_to, category_id, bank_id, limit, offset
+            )
+            .options(so.selectinload(Transaction.category))
+            .options(so.selectinload(Transaction.bank))
+        )
+        return list(db.scalars(query).all())
+
+    def select_transaction_fields(
+        self,
+        db: Session,
+        fields: Sequence[str],
+        expand: Sequence[str],
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        category_id: int | None = None,
+        bank_id: int | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Same as `select_transactions`, but only the fields and expanded objects"""
+        query = self._transactions_query(
+            date_from, date_to, category_id, bank_id, limit, offset
+        )
+        return Transaction.fetch_fields(db, query, fields, expand)
+
+    def update_transactions(
+        self, db: Session, values: dict, clauses: list[sa.ColumnElement[bool]]
+    ) -> int:
+        """Set the values of the user's transactions matching the clauses at once
+
+        Return the number of the updated transactions.
+        """
+        transactions = Transaction.__table__
+        # Previous category and bank of every row, returned by the same statement
+        old = transactions.alias("old")
+        rows = db.execute(
+            sa.update(transactions)
+            .where(
+                transactions.c.user_id == self.id,
+                old.c.id == transactions.c.id,
+                *clauses,
+            )
+            .values(**values, version_id=transactions.c.version_id + 1)
+            .returning(
+                transactions.c.id,
+                transactions.c.base_amount,
+                transactions.c.base_currency,
+                transactions.c.transaction_date,
+                transactions.c.title,
+                transactions.c.place,
+                transactions.c.main_amount,
+                transactions.c.category_id,
+                transactions.c.bank_id,
+                old.c.category_id.label("old_category_id"),
+                old.c.bank_id.label("old_bank_id"),
+            )
+        ).all()
+        if not rows:
+            return 0
 
-    def select_transactions(self, db: Session) -> list[Transaction]:
+        # Bulk UPDATE skips the flush hooks
+        if "category_id" in values:
+            spend_deltas: SpendDeltas = {}
+            for row in rows:
+                for category_id, sign in (
+                    (row.old_category_id, -1),
+                    (row.category_id, 1),
+                ):
+                    add_spend_delta(
+                        spend_deltas,
+                        self.id,
+                        category_id,
+                        row.transaction_date,
+                        row.main_amount,
+                        sign,
+                    )
+            CategorySpend.apply_deltas(db.connection(), spend_deltas)
+        if "bank_id" in values:
+            balance_deltas: BalanceDeltas = {}
+            for row in rows:
+                for bank_id, sign in ((row.old_bank_id, -1), (row.bank_id, 1)):
+                    add_balance_delta(
+                        balance_deltas,
+                        self.id,
+                        bank_id,
+                        row.transaction_date,
+                        row.main_amount,
+                        sign,
+                    )
+            BankBalance.apply_deltas(db.connection(), balance_deltas)
+        if values.keys() & Transaction.FINGERPRINT_FIELDS:
+            fingerprints = sa.values(
+                sa.column("id", sa.Integer),
+                sa.column("fingerprint", sa.String),
+                name="fingerprints",
+            ).data(
+                [
+                    (
+                        row.id,
+                        Transaction.make_fingerprint(
+                            row.base_amount,
+                            row.base_currency,
+                            row.transaction_date,
+                            row.title,
+                            row.place,
+                        ),
+                    )
+                    for row in rows
+                ]
+            )
+            db.execute(
+                sa.update(transactions)
+                .where(transactions.c.id == fingerprints.c.id)
+                .values(
+                    fingerprint=fingerprints.c.fingerprint,
+                    change_seq=transactions.c.change_seq,
+                    change_xid=transactions.c.change_xid,
+                )
+            )
+        bump_data_versions(db.connection(), [self.id])
+        return len(rows)
+
+    def delete_transactions(
+        self, db: Session, clauses: list[sa.ColumnElement[bool]]
+    ) -> int:
+        """Delete the user's transactions matching the clauses at once
+
+        Return the number of the deleted transactions.
+        """
+        transactions = Transaction.__table__
+        rows = db.execute(
+            sa.delete(transactions)
+            .where(transactions.c.user_id == self.id, *clauses)
+            .returning(
+                transactions.c.id,
+                transactions.c.transaction_date,
+                transactions.c.main_amount,
+                transactions.c.category_id,
+                transactions.c.bank_id,
+            )
+        ).all()
+        if not rows:
+            return 0
+
+        # Bulk DELETE skips the flush hooks
+        spend_deltas: SpendDeltas = {}
+        balance_deltas: BalanceDeltas = {}
+        for row in rows:
+            add_spend_delta(
+                spend_deltas,
+                self.id,
+                row.category_id,
+                row.transaction_date,
+                row.main_amount,
+                -1,
+            )
+            add_balance_delta(
+                balance_deltas,
+                self.id,
+                row.bank_id,
+                row.transaction_date,
+                row.main_amount,
+                -1,
+            )
+        CategorySpend.apply_deltas(db.connection(), spend_deltas)
+        BankBalance.apply_deltas(db.connection(), balance_deltas)
+        Tombstone.record(
+            db.connection(),
+            self.id,
+            Transaction.__tablename__,
+            [row.id for row in rows],
+        )
+        bump_data_versions(db.connection(), [self.id])
+        return len(rows)
+
+    def stream_transactions(
+        self,
+        db: Session,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Sequence[sa.Row]]:
+        """Flat rows of the transactions in batches, read with a server-side cursor"""
+        query = (
+            select(
+                Transaction.id,
+                Transaction.transaction_date,
+                Transaction.title,
+                Transaction.place,
+                Transaction.info,
+                Transaction.base_amount,
+                Transaction.base_currency,
+                Transaction.main_amount,
+                Category.name.label("category"),
+                Bank.name.label("bank"),
+                Transaction.creation_date,
+            )
+            .outerjoin(Transaction.category)
+            .outerjoin(Transaction.bank)
+            .where(
+                Transaction.user_id == self.id,
+                *Transaction.filter_clauses(date_from, date_to),
+            )
+            .order_by(Transaction.transaction_date, Transaction.id)
+            .execution_options(yield_per=batch_size)
+        )
+        yield from db.execute(query).partitions()
+
+    def _search_query(
+        self,
+        text: str,
+        date_from: datetime | None,
+        date_to: datetime | None,
+        limit: int | None,
+        offset: int,
+    ) -> sa.Select:
+        query = sa.func.websearch_to_tsquery("simple", text)
+        rank = sa.func.ts_rank(Transaction.search_vector, query)
+        return (
+            select(Transaction)
+            .where(
+                with_parent(self, User.transactions),
+                Transaction.search_vector.bool_op("@@")(query),
+                *Transaction.filter_clauses(date_from, date_to),
+            )
+            .order_by(
+                rank.desc(), Transaction.transaction_date.desc(), Transaction.id.desc()
+            )
+            .limit(limit)
+            .offset(offset)
+        )
+
+    def search_transactions(
+        self,
+        db: Session,
+        text: str,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[Transaction]:
+        """Full-text search over title, place and info, the best matches first"""
+        statement = (
+            self._search_query(text, date_from, date_to, limit, offset)
+            .options(so.selectinload(Transaction.category))
+            .options(so.selectinload(Transaction.bank))
+        )
+        return list(db.scalars(statement).all())
+
+    def search_transaction_fields(
+        self,
+        db: Session,
+        fields: Sequence[str],
+        expand: Sequence[str],
+        text: str,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Same as `search_transactions`, but only the fields and expanded objects"""
+        statement = self._search_query(text, date_from, date_to, limit, offset)
+        return Transaction.fetch_fields(db, statement, fields, expand)
+
+    def summarize_transactions(
+        self,
+        db: Session,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> list[tuple[Category | None, float, int]]:
+        """Sum up main amounts of the transactions per category"""
+        totals = (
+            select(
+                Transaction.category_id,
+                sa.func.sum(Transaction.main_amount).label("total"),
+                sa.func.count().label("count"),
+            )
+            .where(
+                with_parent(self, User.transactions),
+                *Transaction.filter_clauses(date_from, date_to),
+            )
+            .group_by(Transaction.category_id)
+            .subquery()
+        )
+        rows = db.execute(
+            select(Category, totals.c.total, totals.c.count)
+            .select_from(totals)
+            .outerjoin(Category, Category.id == totals.c.category_id)
+            .order_by(totals.c.total)
+        ).all()
+        return [(category, total, count) for category, total, count in rows]
+
+    def count_transactions(self, db: Session) -> int:
+        return db.scalar(
+            select(sa.func.count()).where(with_parent(self, User.transactions))
+        )
+
+    def count_categories(self, db: Session) -> int:
+        return db.scalar(
+            select(sa.func.count()).where(with_parent(self, User.categories))
+        )
+
+    def select_categories(self, db: Session) -> list[Category]:
+        return list(
+            db.scalars(select(Category).where(with_parent(self, User.categories))).all()
+        )
+
+    def select_category_rules(self, db: Session) -> list[CategoryRule]:
         return list(
             db.scalars(
-                select(Transaction).where(with_parent(self, User.transactions))
+                select(CategoryRule)
+                .filter_by(user_id=self.id)
+                .order_by(CategoryRule.priority.desc(), CategoryRule.id)
             ).all()
         )
 
-    def select_categories(self, db: Session) -> list[Category]:
+    def select_budgets(self, db: Session, month: date) -> list[tuple[Budget, float]]:
+        """User's budgets with the month's total of their category, one row each"""
+        rows = db.execute(
+            select(Budget, sa.func.coalesce(CategorySpend.total, 0))
+            .outerjoin(
+                CategorySpend,
+                sa.and_(
+                    CategorySpend.user_id == self.id,
+                    CategorySpend.category_id == Budget.category_id,
+                    CategorySpend.month == month,
+                ),
+            )
+            .filter(Budget.user_id == self.id)
+            .options(so.selectinload(Budget.category))
+            .order_by(Budget.id)
+        ).all()
+        return [(budget, total) for budget, total in rows]
+
+    def select_recurring_payments(self, db: Session) -> list[RecurringPayment]:
         return list(
-            db.scalars(select(Category).where(with_parent(self, User.categories))).all()
+            db.scalars(
+                select(RecurringPayment)
+                .filter_by(user_id=self.id)
+                .order_by(RecurringPayment.next_date, RecurringPayment.id)
+            ).all()
         )
 
+    def select_changes(
+        self, db: Session, since: tuple[int, int] | None, limit: int
+    ) -> tuple[list[tuple[str, int, int, int]], int]:
+        """(table name, id, change xid, change sequence) of the rows changed after
+        `since`, along with the xmin of the snapshot they were read in
+
+        Only the changes of the transactions older than xmin are returned, as a
+        running transaction can still commit rows positioned before them. Deleted
+        rows are listed under the "tombstones" table with the deleted row's table
+        and id in the tombstone.
+        """
+        xmin = db.scalar(select(snapshot_xmin()))
+        changes = sa.union_all(
+            *(
+                select(
+                    sa.literal(model.__tablename__).label("entity"),
+                    model.id,
+                    model.change_xid,
+                    model.change_seq,
+                ).where(
+                    (model.id if model is User else model.user_id) == self.id,
+                    model.change_xid < xmin,
+                    *(
+                        ()
+                        if since is None
+                        else (sa.tuple_(model.change_xid, model.change_seq) > since,)
+                    ),
+                )
+                for model in (User, Category, Transaction, Tombstone)
+            )
+        ).subquery()
+        rows = db.execute(
+            select(changes)
+            .order_by(changes.c.change_xid, changes.c.change_seq)
+            .limit(limit)
+        ).all()
+        return [tuple(row) for row in rows], xmin
+
     def select_banks(self, db: Session) -> list[Bank]:
         return list(
             db.scalars(
@@ -93,6 +707,57 @@ class User(Base, UpdatableMixin):
             ).all()
         )
 
+    def select_bank_balances(
+        self,
+        db: Session,
+        date_from: date | None = None,
+        date_to: date | None = None,
+        bank_id: int | None = None,
+    ) -> list[tuple[Bank, float, list[tuple[date, float]]]]:
+        """Opening balance at every bank and its closing balances in the range
+
+        Only the days with transactions are returned, read from the daily ledger.
+        """
+        clauses = [BankBalance.user_id == self.id]
+        if bank_id is not None:
+            clauses.append(BankBalance.bank_id == bank_id)
+        openings: dict[int, float] = {}
+        if date_from is not None:
+            openings = dict(
+                db.execute(
+                    select(BankBalance.bank_id, sa.func.sum(BankBalance.change))
+                    .where(*clauses, BankBalance.day < date_from)
+                    .group_by(BankBalance.bank_id)
+                ).all()
+            )
+            clauses.append(BankBalance.day >= date_from)
+        if date_to is not None:
+            clauses.append(BankBalance.day <= date_to)
+        rows = db.execute(
+            select(
+                BankBalance.bank_id,
+                BankBalance.day,
+                sa.func.sum(BankBalance.change).over(
+                    partition_by=BankBalance.bank_id, order_by=BankBalance.day
+                ),
+            )
+            .where(*clauses)
+            .order_by(BankBalance.bank_id, BankBalance.day)
+        ).all()
+
+        days: dict[int, list[tuple[date, float]]] = {}
+        for row_bank_id, day, running in rows:
+            opening = openings.get(row_bank_id, 0.0)
+            days.setdefault(row_bank_id, []).append((day, opening + running))
+        banks = db.scalars(
+            select(Bank)
+            .where(Bank.id.in_(openings.keys() | days.keys()))
+            .order_by(Bank.id)
+        ).all()
+        return [
+            (bank, openings.get(bank.id, 0.0), days.get(bank.id, [])) for bank in banks
+        ]
+
     def select_base_currencies(self, db: Session) -> list[str]:
         return list(
             db.scalars(
@@ -105,24 +770,50 @@ class User(Base, UpdatableMixin):
 
 class Transaction(Base, UpdatableMixin):
     __tablename__ = "transactions"
+    __table_args__ = (
+        sa.Index(
+            "ix_transactions_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        sa.Index("ix_transactions_user_id_fingerprint", "user_id", "fingerprint"),
+    )
 
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     info: so.Mapped[str | None] = so.mapped_column(sa.Text, index=True)
     title: so.Mapped[str | None] = so.mapped_column(sa.Text)
-    main_amount: so.Mapped[float] = so.mapped_column("main_amount", index=True)
-    base_amount: so.Mapped[float] = so.mapped_column(index=True)
+    main_amount: so.Mapped[float] = so.mapped_column(Money, index=True)
+    base_amount: so.Mapped[float] = so.mapped_column(Money, index=True)
     base_currency: so.Mapped[str] = so.mapped_column(sa.String(3), index=True)
+    # Base amount in the bridge currency, re-conversions need only the target rate
+    eur_amount: so.Mapped[float | None] = so.mapped_column()
+    # Day of the exchange rates behind eur_amount
+    rate_date: so.Mapped[date | None] = so.mapped_column(sa.Date)
     transaction_date: so.Mapped[datetime] = so.mapped_column(sa.DateTime, index=True)
     creation_date: so.Mapped[datetime] = so.mapped_column(
         sa.DateTime, index=True, default=datetime.utcnow
     )
     place: so.Mapped[str | None] = so.mapped_column(sa.Text)
+    version_id: so.Mapped[int] = so.mapped_column(nullable=False)
+    change_seq: so.Mapped[int] = change_seq_column()
+    change_xid: so.Mapped[int] = change_xid_column()
+    # Identifies the same transaction coming from overlapping statements
+    fingerprint: so.Mapped[str | None] = so.mapped_column(sa.String(32))
+    # 'simple' configuration - merchant names and memos are not in any one language
+    search_vector: so.Mapped[str] = so.mapped_column(
+        TSVECTOR,
+        sa.Computed(
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(place, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(info, '')), 'C')",
+            persisted=True,
+        ),
+        deferred=True,
+    )
 
-    category_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("categories.id"), index=True
+    category_id: so.Mapped[int | None] = so.mapped_column(
+        sa.ForeignKey("categories.id", ondelete="SET NULL"), index=True
     )
     user_id: so.Mapped[int | None] = so.mapped_column(
-        sa.ForeignKey("users.id", ondelete="CASCADE")
+        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
     )
     bank_id: so.Mapped[int | None] = so.mapped_column(sa.ForeignKey("banks.id"))
 
@@ -134,12 +825,32 @@ class Transaction(Base, UpdatableMixin):
         "Bank", back_populates="transactions"
     )
 
+    __mapper_args__ = {"version_id_col": version_id}
+
+    FINGERPRINT_FIELDS = {
+        "base_amount",
+        "base_currency",
+        "transaction_date",
+        "title",
+        "place",
+    }
+    # Fields of the transaction, which the spend and balance ledgers depend on
+    LEDGER_FIELDS = (
+        "user_id",
+        "category_id",
+        "bank_id",
+        "transaction_date",
+        "main_amount",
+    )
+
     def __init__(
         self,
         base_amount: float,
         base_currency: str,
         transaction_date: datetime,
         db: Session,
+        rates_db: Session | None = None,
+        rates: RateMatrix | None = None,
         **kwargs: dict,
     ) -> None:
         super(Transaction, self).__init__(
@@ -148,36 +859,194 @@ class Transaction(Base, UpdatableMixin):
             transaction_date=transaction_date,
             **kwargs,
         )
-        self.convert_to_main_amount(db=db)
+        self.convert_to_main_amount(db=db, rates_db=rates_db, rates=rates)
+        self.fingerprint = self.make_fingerprint(
+            base_amount, base_currency, transaction_date, self.title, self.place
+        )
 
     def __repr__(self) -> str:
         return f"Transaction: {self.base_amount} {self.base_currency} on {self.transaction_date}"
 
-    def update(self, data: dict, db: Session, *args, **kwargs) -> None:
+    def ledger_values(self) -> dict:
+        return {name: getattr(self, name) for name in self.LEDGER_FIELDS}
+
+    def update(
+        self,
+        data: dict,
+        db: Session,
+        rates_db: Session | None = None,
+        rates: RateMatrix | None = None,
+        *args,
+        **kwargs,
+    ) -> None:
         super(self.__class__, self).update(data)
         if "base_amount" in data or "base_currency" in data:
-            self.convert_to_main_amount(db=db)
+            self.convert_to_main_amount(db=db, rates_db=rates_db, rates=rates)
+        if data.keys() & self.FINGERPRINT_FIELDS:
+            self.fingerprint = self.make_fingerprint(
+                self.base_amount,
+                self.base_currency,
+                self.transaction_date,
+                self.title,
+                self.place,
+            )
+
+    @staticmethod
+    def make_fingerprint(
+        base_amount: float,
+        base_currency: str,
+        transaction_date: datetime,
+        title: str | None,
+        place: str | None,
+    ) -> str:
+        """Hash of the transaction's content, insensitive to case and whitespace"""
+        parts = [
+            transaction_date.date().isoformat(),
+            # In the currency's minor unit, so that no distinct amounts collide
+            f"{base_amount:.{currency_exponent(base_currency)}f}",
+            base_currency,
+            *(" ".join((text or "").casefold().split()) for text in (title, place)),
+        ]
+        return blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
 
     def convert_to_main_amount(
-        self, db: Session, target_currency: str | None = None
+        self,
+        db: Session,
+        target_currency: str | None = None,
+        rates_db: Session | None = None,
+        rates: RateMatrix | None = None,
     ) -> None:
+        """Convert the base amount, `rates_db` (e.g. a replica) serves the rate lookup
+
+        Preloaded `rates` spare the lookup queries when many transactions are converted.
+        The amount normalized to the bridge currency is stored along, if its rate
+        is known.
+        """
         if target_currency is None:
             target_currency = self.user.main_currency
+        day = self.transaction_date.date()
+
+        def find_rate(currency: str) -> float | None:
+            if rates is not None:
+                return rates.bridge_rate(day, currency)
+            # No_autoflush is necessary as this is part of Transaction initialization
+            with db.no_autoflush:
+                return ExchangeRate.find_bridge_rate(day, currency, rates_db or db)
+
+        source_rate = find_rate(self.base_currency)
+        self.eur_amount = (
+            None if source_rate is None else self.base_amount / source_rate
+        )
+        self.rate_date = None if source_rate is None else day
         if target_currency == self.base_currency:
             self.main_amount = self.base_amount
             return
 
-        # No_autoflush is necessary as this is part of Transaction initialization process
-        with db.no_autoflush:
-            exchange_rate = ExchangeRate.find_exchange_rate(
-                self.transaction_date, self.base_currency, target_currency, db
+        target_rate = find_rate(target_currency)
+        if self.eur_amount is None or target_rate is None:
+            raise MissingRateError(
+                f"No {self.base_currency}/{target_currency} rate on {day}"
             )
-        self.main_amount = round(self.base_amount * exchange_rate, 2)
+        self.main_amount = round_amount(self.eur_amount * target_rate, target_currency)
 
     @classmethod
     def get_from_id(cls, id: int, user: User, db: Session) -> Transaction | None:
         return db.query(cls).filter_by(id=id, user=user).first()
 
+    @classmethod
+    def fetch_fields(
+        cls,
+        db: Session,
+        query: sa.Select,
+        fields: Sequence[str],
+        expand: Sequence[str],
+    ) -> list[dict]:
+        """Execute the query of transactions, selecting only the columns it needs
+
+        `fields` are names of the columns, `expand` of the relationships to Category
+        or Bank, which are returned as nested {"id", "name"} objects.
+        """
+        columns = [getattr(cls, field) for field in fields]
+        for name in expand:
+            model = getattr(cls, name).property.mapper.class_
+            columns += [model.id.label(f"{name}.id"), model.name.label(f"{name}.name")]
+        query = query.with_only_columns(*columns, maintain_column_froms=True)
+        for name in expand:
+            query = query.outerjoin(getattr(cls, name))
+
+        items = []
+        for row in db.execute(query).mappings():
+            item = {field: row[field] for field in fields}
+            for name in expand:
+                item[name] = (
+                    {"id": row[f"{name}.id"], "name": row[f"{name}.name"]}
+                    if row[f"{name}.id"] is not None
+                    else None
+                )
+            items.append(item)
+        return items
+
+    @classmethod
+    def filter_clauses(
+        cls,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        category_id: int | None = None,
+        bank_id: int | None = None,
+        place: str | None = None,
+    ) -> list[sa.ColumnElement[bool]]:
+        clauses = []
+        if date_from is not None:
+            clauses.append(cls.transaction_date >= date_from)
+        if date_to is not None:
+            clauses.append(cls.transaction_date <= date_to)
+        if category_id is not None:
+            clauses.append(cls.category_id == category_id)
+        if bank_id is not None:
+            clauses.append(cls.bank_id == bank_id)
+        if place is not None:
+            clauses.append(cls.place == place)
+        return clauses
+
+    @classmethod
+    def get_version(
+        cls, id: int, user: User, db: Session
+    ) -> tuple[int, int | None] | None:
+        """Query the versions of Transaction and its Category without loading them"""
+        row = db.execute(
+            select(cls.version_id, Category.version_id)
+            .outerjoin(cls.category)
+            .filter(cls.id == id, cls.user_id == user.id)
+        ).first()
+        return None if row is None else tuple(row)
+
+
+class CategoryRule(Base):
+    """User's rule assigning a category to transactions containing the pattern"""
+
+    __tablename__ = "category_rules"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    field: so.Mapped[str] = so.mapped_column(sa.String(5))
+    pattern: so.Mapped[str] = so.mapped_column(sa.Text)
+    # Rules with higher priority are applied first
+    priority: so.Mapped[int] = so.mapped_column(default=0)
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    category_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("categories.id", ondelete="CASCADE"), index=True
+    )
+
+    category: so.Mapped[Category] = so.relationship("Category")
+
+    def __repr__(self) -> str:
+        return f"CategoryRule: {self.field} ~ '{self.pattern}'"
+
+    @classmethod
+    def get_from_id(cls, id: int, user: User, db: Session) -> CategoryRule | None:
+        return db.scalar(select(cls).filter_by(id=id, user_id=user.id))
+
 
 class MyBanks(Enum):
     REVOLUT = "revolut"
@@ -192,7 +1061,7 @@ class Bank(Base):
     statement_type: so.Mapped[str] = so.mapped_column(sa.String(10))
     name_enum: so.Mapped[MyBanks] = so.mapped_column(unique=True)
 
-    transactions: so.Mapped[int] = so.relationship(
+    transactions: so.Mapped[list[Transaction]] = so.relationship(
         "Transaction", back_populates="bank", lazy=True, uselist=True
     )
 
@@ -216,24 +1085,470 @@ class Category(Base, UpdatableMixin):
         index=True,
     )
     user_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("users.id", ondelete="CASCADE")
+        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
     )
+    version_id: so.Mapped[int] = so.mapped_column(nullable=False)
+    change_seq: so.Mapped[int] = change_seq_column()
+    change_xid: so.Mapped[int] = change_xid_column()
 
     user: so.Mapped[User] = so.relationship(
         "User", back_populates="categories", lazy=True
     )
+    # Transactions are moved with a single UPDATE, see `reassign_transactions`
     transactions: so.Mapped[list[Transaction]] = so.relationship(
-        "Transaction", back_populates="category", lazy=True
+        "Transaction", back_populates="category", lazy=True, passive_deletes=True
     )
 
+    __mapper_args__ = {"version_id_col": version_id}
+
     def __repr__(self) -> str:
         return f"Category: {self.name}"
 
+    def reassign_transactions(self, db: Session, target: Category | None) -> int:
+        """Move all the category's transactions to the target, or uncategorize them
+
+        Runs as a single UPDATE, the transactions are never loaded. Return their number.
+        """
+        connection = db.connection()
+        transactions = Transaction.__table__
+        result = connection.execute(
+            sa.update(transactions)
+            .where(transactions.c.category_id == self.id)
+            .values(
+                category_id=target.id if target else None,
+                version_id=transactions.c.version_id + 1,
+            )
+        )
+        if not result.rowcount:
+            return 0
+
+        # Bulk UPDATE skips the flush hooks. The category's own spend is left as is,
+        # to be deleted along with it.
+        if target is not None:
+            spend = connection.execute(
+                select(
+                    CategorySpend.user_id,
+                    CategorySpend.month,
+                    CategorySpend.total,
+                    CategorySpend.count,
+                ).filter_by(category_id=self.id)
+            )
+            CategorySpend.apply_deltas(
+                connection,
+                {
+                    (user_id, target.id, month): (total, count)
+                    for user_id, month, total, count in spend
+                },
+            )
+        bump_data_versions(connection, [self.user_id])
+        return result.rowcount
+
+    def merge_into(self, db: Session, target: Category) -> int:
+        """Move the category's transactions and rules to the target
+
+        Return the number of the moved transactions.
+        """
+        db.execute(
+            sa.update(CategoryRule)
+            .filter_by(category_id=self.id)
+            .values(category_id=target.id)
+            .execution_options(synchronize_session=False)
+        )
+        return self.reassign_transactions(db, target)
+
     @classmethod
     def get_from_id(cls, id: int, user: User, db: Session) -> Category | None:
         """Query for Category with an id"""
         return db.query(cls).filter_by(id=id, user=user).first()
 
+    @classmethod
+    def get_version(cls, id: int, user: User, db: Session) -> int | None:
+        """Query for the version of Category without loading it"""
+        return db.scalar(select(cls.version_id).filter_by(id=id, user_id=user.id))
+
+
+class Budget(Base, UpdatableMixin):
+    """Monthly spending limit of a category, in the user's main currency"""
+
+    __tablename__ = "budgets"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    monthly_limit: so.Mapped[float] = so.mapped_column(Money)
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    category_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("categories.id", ondelete="CASCADE"), unique=True
+    )
+
+    category: so.Mapped[Category] = so.relationship("Category")
+
+    def __repr__(self) -> str:
+        return f"Budget: {self.monthly_limit} for {self.category_id}"
+
+    @classmethod
+    def get_from_id(cls, id: int, user: User, db: Session) -> Budget | None:
+        return db.scalar(select(cls).filter_by(id=id, user_id=user.id))
+
+
+class CategorySpend(Base):
+    """Running sum of main amounts of a category's transactions per month
+
+    Kept up to date incrementally - by the flush hook for the ORM changes and
+    with `apply_deltas` by the bulk statements, which skip the flush hooks.
+    """
+
+    __tablename__ = "category_spend"
+
+    category_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    month: so.Mapped[date] = so.mapped_column(sa.Date, primary_key=True)
+    # Part of the key, so that a transaction never adds to another user's total
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    total: so.Mapped[float] = so.mapped_column(Money, default=0)
+    count: so.Mapped[int] = so.mapped_column(default=0)
+
+    @staticmethod
+    def month_of(day: datetime) -> date:
+        return day.date().replace(day=1)
+
+    @classmethod
+    def apply_deltas(cls, connection: sa.Connection, deltas: SpendDeltas) -> None:
+        """Add the changes of (user_id, category_id, month) totals and counts"""
+        values = [
+            {
+                "user_id": user_id,
+                "category_id": category_id,
+                "month": month,
+                "total": total,
+                "count": count,
+            }
+            for (user_id, category_id, month), (total, count) in deltas.items()
+            if total or count
+        ]
+        if not values:
+            return
+        statement = postgresql.insert(cls)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[cls.category_id, cls.month, cls.user_id],
+                set_={
+                    "total": cls.total + statement.excluded.total,
+                    "count": cls.count + statement.excluded.count,
+                },
+            ),
+            values,
+        )
+
+    @classmethod
+    def rebuild(cls, connection: sa.Connection, category_id: int) -> None:
+        """Recompute the category's spend from scratch"""
+        connection.execute(sa.delete(cls).filter_by(category_id=category_id))
+        month = sa.func.date_trunc("month", Transaction.transaction_date).cast(sa.Date)
+        connection.execute(
+            sa.insert(cls).from_select(
+                ["category_id", "month", "user_id", "total", "count"],
+                select(
+                    Transaction.category_id,
+                    month,
+                    Transaction.user_id,
+                    sa.func.sum(Transaction.main_amount),
+                    sa.func.count(),
+                )
+                .filter_by(category_id=category_id)
+                .group_by(Transaction.category_id, month, Transaction.user_id),
+            )
+        )
+
+
+def add_spend_delta(
+    deltas: SpendDeltas,
+    user_id: int | None,
+    category_id: int | None,
+    transaction_date: datetime,
+    main_amount: float,
+    sign: int,
+) -> None:
+    if user_id is None or category_id is None:
+        return
+    key = (user_id, category_id, CategorySpend.month_of(transaction_date))
+    total, count = deltas.get(key, (0.0, 0))
+    deltas[key] = (total + sign * main_amount, count + sign)
+
+
+class BankBalance(Base):
+    """Net change of the user's balance at a bank per day, in the main currency
+
+    The closing balance of a day is the running sum of the changes up to it, so
+    a balance history costs the number of days shown rather than of transactions.
+    Maintained like CategorySpend, transactions without a bank are not counted.
+    """
+
+    __tablename__ = "bank_balances"
+
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    bank_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("banks.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: so.Mapped[date] = so.mapped_column(sa.Date, primary_key=True)
+    change: so.Mapped[float] = so.mapped_column(Money, default=0)
+    count: so.Mapped[int] = so.mapped_column(default=0)
+
+    @classmethod
+    def apply_deltas(cls, connection: sa.Connection, deltas: BalanceDeltas) -> None:
+        """Add the changes of (user_id, bank_id, day) balances and counts"""
+        values = [
+            {
+                "user_id": user_id,
+                "bank_id": bank_id,
+                "day": day,
+                "change": change,
+                "count": count,
+            }
+            for (user_id, bank_id, day), (change, count) in deltas.items()
+            if change or count
+        ]
+        if not values:
+            return
+        statement = postgresql.insert(cls)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.bank_id, cls.day],
+                set_={
+                    "change": cls.change + statement.excluded.change,
+                    "count": cls.count + statement.excluded.count,
+                },
+            ),
+            values,
+        )
+
+    @classmethod
+    def rebuild(cls, connection: sa.Connection, user_id: int) -> None:
+        """Recompute the user's balances from scratch"""
+        connection.execute(sa.delete(cls).filter_by(user_id=user_id))
+        day = Transaction.transaction_date.cast(sa.Date)
+        connection.execute(
+            sa.insert(cls).from_select(
+                ["user_id", "bank_id", "day", "change", "count"],
+                select(
+                    Transaction.user_id,
+                    Transaction.bank_id,
+                    day,
+                    sa.func.sum(Transaction.main_amount),
+                    sa.func.count(),
+                )
+                .where(Transaction.user_id == user_id, Transaction.bank_id.is_not(None))
+                .group_by(Transaction.user_id, Transaction.bank_id, day),
+            )
+        )
+
+
+def add_balance_delta(
+    deltas: BalanceDeltas,
+    user_id: int | None,
+    bank_id: int | None,
+    transaction_date: datetime,
+    main_amount: float,
+    sign: int,
+) -> None:
+    if user_id is None or bank_id is None:
+        return
+    key = (user_id, bank_id, transaction_date.date())
+    change, count = deltas.get(key, (0.0, 0))
+    deltas[key] = (change + sign * main_amount, count + sign)
+
+
+class RecurringPayment(Base):
+    """Payment or income repeating with a regular period, found by the analysis"""
+
+    __tablename__ = "recurring_payments"
+
+    # Period name -> its average length in days
+    PERIODS = {
+        "weekly": 7.0,
+        "biweekly": 14.0,
+        "monthly": 30.44,
+        "quarterly": 91.31,
+        "yearly": 365.25,
+    }
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    description: so.Mapped[str] = so.mapped_column(sa.Text)
+    period: so.Mapped[str] = so.mapped_column(sa.String(10))
+    amount: so.Mapped[float] = so.mapped_column()
+    occurrences: so.Mapped[int] = so.mapped_column()
+    last_date: so.Mapped[date] = so.mapped_column(sa.Date)
+    next_date: so.Mapped[date] = so.mapped_column(sa.Date)
+    confidence: so.Mapped[float] = so.mapped_column()
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+
+    def __repr__(self) -> str:
+        return f"RecurringPayment: {self.amount} {self.period} at '{self.description}'"
+
+    def dates_until(self, start: date, end: date) -> list[date]:
+        """Expected dates of the payment in [start, end]"""
+        period = timedelta(days=round(self.PERIODS[self.period]))
+        day = self.next_date
+        if day < start:
+            day += period * -(-(start - day).days // period.days)
+        dates = []
+        while day <= end:
+            dates.append(day)
+            day += period
+        return dates
+
+
+class Tombstone(Base):
+    """Trace of a deleted row, letting the synced clients delete it as well"""
+
+    __tablename__ = "tombstones"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    entity: so.Mapped[str] = so.mapped_column(sa.String(20))
+    entity_id: so.Mapped[int] = so.mapped_column()
+    change_seq: so.Mapped[int] = change_seq_column()
+    change_xid: so.Mapped[int] = change_xid_column()
+    creation_date: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=datetime.utcnow
+    )
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE")
+    )
+
+    __table_args__ = (
+        sa.Index("ix_tombstones_user_id_creation_date", "user_id", "creation_date"),
+    )
+
+    # Clients not synced for longer are sent all their data again
+    RETENTION = timedelta(days=90)
+
+    @classmethod
+    def record(
+        cls, connection: sa.Connection, user_id: int, entity: str, ids: Iterable[int]
+    ) -> None:
+        """Record deletions done by bulk statements, which skip the flush hooks"""
+        values = [{"user_id": user_id, "entity": entity, "entity_id": id} for id in ids]
+        if values:
+            connection.execute(sa.insert(cls), values)
+            cls.prune(connection, [user_id])
+
+    @classmethod
+    def prune(cls, connection: sa.Connection, user_ids: Iterable[int]) -> None:
+        """Delete the users' tombstones older than RETENTION and move their sync
+        horizons past them"""
+        rows = connection.execute(
+            sa.delete(cls)
+            .where(
+                cls.user_id.in_(set(user_ids)),
+                cls.creation_date < datetime.utcnow() - cls.RETENTION,
+            )
+            .returning(cls.user_id, cls.change_xid)
+        ).all()
+        horizons: dict[int, int] = {}
+        for user_id, change_xid in rows:
+            horizons[user_id] = max(horizons.get(user_id, 0), change_xid)
+        if not horizons:
+            return
+        users = User.__table__
+        connection.execute(
+            sa.update(users)
+            .where(users.c.id == sa.bindparam("user_id"))
+            .values(
+                sync_horizon=sa.func.greatest(
+                    users.c.sync_horizon, sa.bindparam("horizon")
+                ),
+                # Not a change of the user's own row
+                change_seq=users.c.change_seq,
+                change_xid=users.c.change_xid,
+            ),
+            [
+                {"user_id": user_id, "horizon": horizon}
+                for user_id, horizon in horizons.items()
+            ],
+        )
+
+
+class IdempotencyKey(Base):
+    """Response of a write request, replayed for its retries with the same key"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (sa.UniqueConstraint("user_id", "key"),)
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    key: so.Mapped[str] = so.mapped_column(sa.String(255))
+    # Hash of the method, path and body, a key must not be reused for another request
+    fingerprint: so.Mapped[str] = so.mapped_column(sa.String(64))
+    # Not set while the request is being handled
+    status_code: so.Mapped[int | None] = so.mapped_column()
+    body: so.Mapped[bytes | None] = so.mapped_column(sa.LargeBinary)
+    creation_date: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, index=True, default=datetime.utcnow
+    )
+    # Start of the latest attempt to handle the request
+    claimed_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=datetime.utcnow
+    )
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="CASCADE")
+    )
+
+    def __repr__(self) -> str:
+        return f"IdempotencyKey: {self.key} of {self.user_id}"
+
+
+class JobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+
+class Job(Base):
+    """Persisted state of a long-running operation executed in the background"""
+
+    __tablename__ = "jobs"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    kind: so.Mapped[str] = so.mapped_column(sa.String(50))
+    status: so.Mapped[JobStatus] = so.mapped_column(
+        index=True, default=JobStatus.PENDING
+    )
+    params: so.Mapped[dict] = so.mapped_column(sa.JSON, default=dict)
+    result: so.Mapped[dict | None] = so.mapped_column(sa.JSON)
+    error: so.Mapped[str | None] = so.mapped_column(sa.Text)
+    progress: so.Mapped[float] = so.mapped_column(default=0)
+    attempts: so.Mapped[int] = so.mapped_column(default=0)
+    creation_date: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=datetime.utcnow
+    )
+    start_date: so.Mapped[datetime | None] = so.mapped_column(sa.DateTime)
+    finish_date: so.Mapped[datetime | None] = so.mapped_column(sa.DateTime)
+
+    # Jobs outlive the account deletion they perform
+    user_id: so.Mapped[int | None] = so.mapped_column(
+        sa.ForeignKey("users.id", ondelete="SET NULL"), index=True
+    )
+
+    user: so.Mapped[User | None] = so.relationship("User")
+
+    def __repr__(self) -> str:
+        return f"Job {self.id}: {self.kind} {self.status.value}"
+
+    @classmethod
+    def get_from_id(cls, id: int, user: User, db: Session) -> Job | None:
+        return db.query(cls).filter_by(id=id, user=user).first()
+
+
+class MissingRateError(LookupError):
+    pass
+
 
 class ExchangeRate(Base, UpdatableMixin):
     """Table holding exchange rates of various currencies to a single, 'bridge' currency"""
@@ -258,3 +1573,133 @@ class ExchangeRate(Base, UpdatableMixin):
         target_rate = db.query(cls).filter_by(date=date.date(), source=target).scalar()
 
         return (1 / source_rate.rate) * target_rate.rate
+
+    @classmethod
+    def find_latest_day(cls, currencies: Iterable[str], db: Session) -> date | None:
+        """Latest day with the rates of all the currencies, None if there is none"""
+        sources = set(currencies) - {"EUR"}
+        day = db.scalar(
+            select(cls.date)
+            .where(cls.source.in_(sources))
+            .group_by(cls.date)
+            .having(sa.func.count(sa.distinct(cls.source)) == len(sources))
+            .order_by(cls.date.desc())
+            .limit(1)
+        )
+        return day.date() if day is not None else None
+
+    @classmethod
+    def find_bridge_rate(cls, day: date, currency: str, db: Session) -> float | None:
+        """Units of the currency per one EUR on the day, None if unknown"""
+        if currency == "EUR":
+            return 1.0
+        return db.scalar(select(cls.rate).filter_by(date=day, source=currency))
+
+
+def bump_data_versions(connection: sa.Connection, user_ids: Iterable[int]) -> None:
+    """Bump the data version of the users, needed after bulk statements on their data"""
+    # Core UPDATE, so that the User's version_id (and its ETag) stays untouched
+    users = User.__table__
+    connection.execute(
+        sa.update(users).where(users.c.id.in_(set(user_ids)))
+        # Not a change of the user's own row, synced clients need not refetch it
+        .values(
+            data_version=users.c.data_version + 1,
+            change_seq=users.c.change_seq,
+            change_xid=users.c.change_xid,
+        )
+    )
+
+
+@sa.event.listens_for(Session, "after_flush")
+def bump_data_version(session: Session, flush_context: so.UOWTransaction) -> None:
+    """Bump the data version of users whose data or main currency were flushed"""
+    user_ids = {
+        sa.inspect(obj).dict.get("user_id")
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, (Transaction, Category, CategoryRule, Budget))
+        and (obj not in session.dirty or session.is_modified(obj))
+    }
+    # All the amounts are reported in the main currency
+    user_ids |= {
+        obj.id
+        for obj in session.dirty
+        if isinstance(obj, User)
+        and sa.inspect(obj).attrs.main_currency.history.has_changes()
+    }
+    user_ids.discard(None)
+    if user_ids:
+        bump_data_versions(session.connection(), user_ids)
+
+
+@sa.event.listens_for(Session, "after_flush")
+def track_transaction_totals(
+    session: Session, flush_context: so.UOWTransaction
+) -> None:
+    """Move the flushed transactions' amounts between the spend totals and balances"""
+    changed: list[tuple[dict, int]] = []
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            changed.append((obj.ledger_values(), 1))
+    for obj in chain(session.dirty, session.deleted):
+        if not isinstance(obj, Transaction):
+            continue
+        state = sa.inspect(obj)
+        old = {}
+        for name in Transaction.LEDGER_FIELDS:
+            history = state.attrs[name].history
+            if history.deleted:
+                old[name] = history.deleted[0]
+            elif history.added:  # set for the first time
+                old[name] = None
+            elif obj in session.deleted:
+                old[name] = state.dict.get(name)
+            else:
+                # Unchanged, the row still exists if it has to be loaded
+                old[name] = getattr(obj, name)
+        changed.append((old, -1))
+        if obj not in session.deleted:
+            changed.append((obj.ledger_values(), 1))
+
+    spend_deltas: SpendDeltas = {}
+    balance_deltas: BalanceDeltas = {}
+    for values, sign in changed:
+        bank_id = values.pop("bank_id")
+        add_spend_delta(spend_deltas, sign=sign, **values)
+        add_balance_delta(
+            balance_deltas,
+            values["user_id"],
+            bank_id,
+            values["transaction_date"],
+            values["main_amount"],
+            sign,
+        )
+
+    # Spend of the deleted categories is removed with them
+    deleted_categories = {
+        obj.id for obj in session.deleted if isinstance(obj, Category)
+    }
+    spend_deltas = {
+        key: delta
+        for key, delta in spend_deltas.items()
+        if key[1] not in deleted_categories
+    }
+    CategorySpend.apply_deltas(session.connection(), spend_deltas)
+    BankBalance.apply_deltas(session.connection(), balance_deltas)
+
+
+@sa.event.listens_for(Session, "after_flush")
+def record_tombstones(session: Session, flush_context: so.UOWTransaction) -> None:
+    values = [
+        {
+            "user_id": sa.inspect(obj).dict.get("user_id"),
+            "entity": obj.__tablename__,
+            "entity_id": obj.id,
+        }
+        for obj in session.deleted
+        if isinstance(obj, (Transaction, Category))
+    ]
+    values = [value for value in values if value["user_id"] is not None]
+    if values:
+        session.connection().execute(sa.insert(Tombstone), values)
+        Tombstone.prune(session.connection(), [value["user_id"] for value in values])
@@ -0,0 +1,263 @@
+"""Optional range partitioning of the transactions table by transaction_date
+
+The ORM mapping stays the same - Transaction is identified by its id, which keeps
+being unique thanks to the shared sequence. Partitioned table only changes
+the primary key to (id, transaction_date), as required by Postgres.
+
+Usage:
+    python -m database.partitioning convert --interval month
+    python -m database.partitioning create-ahead --interval month --count 3
+    python -m database.partitioning detach --before 2020-01-01
+"""
+import argparse
+import re
+from datetime import date
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+
+from config import get_config
+from database.main import get_engine
+from database.models import Transaction
+
+INTERVALS = ("month", "year")
+
+TABLE = Transaction.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def partition_start(day: date, interval: str) -> date:
+    if interval == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def next_partition_start(start: date, interval: str) -> date:
+    if interval == "year" or start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start: date, interval: str) -> str:
+    if interval == "month":
+        return f"{TABLE}_y{start.year}m{start.month:02}"
+    return f"{TABLE}_y{start.year}"
+
+
+def parse_partition_name(name: str) -> tuple[date, str] | None:
+    """Inverse of partition_name, None for the tables not following the scheme"""
+    match = re.fullmatch(rf"{TABLE}_y(\d{{4}})(?:m(\d{{2}}))?", name)
+    if match is None:
+        return None
+    year, month = match.groups()
+    if month is None:
+        return date(int(year), 1, 1), "year"
+    return date(int(year), int(month), 1), "month"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(
+        conn.scalar(
+            sa.text(
+                "SELECT count(*) FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table"
+            ),
+            {"table": TABLE},
+        )
+    )
+
+
+def list_partitions(conn: Connection) -> list[str]:
+    return list(
+        conn.scalars(
+            sa.text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = :table ORDER BY child.relname"
+            ),
+            {"table": TABLE},
+        ).all()
+    )
+
+
+def table_exists(conn: Connection, name: str) -> bool:
+    return conn.scalar(sa.text("SELECT to_regclass(:name)"), {"name": name}) is not None
+
+
+def create_partition(conn: Connection, start: date, interval: str) -> str:
+    """Create the partition, moving into it its rows stored in the default partition
+
+    Postgres refuses to create a partition whose rows are in the default one, so
+    the default partition is detached while they are moved.
+    """
+    name = partition_name(start, interval)
+    if table_exists(conn, name):
+        return name
+    end = next_partition_start(start, interval)
+    bounds = {"start": start, "end": end}
+    in_range = "transaction_date >= :start AND transaction_date < :end"
+    misplaced = table_exists(conn, DEFAULT_PARTITION) and conn.scalar(
+        sa.text(f"SELECT EXISTS (SELECT FROM {DEFAULT_PARTITION} WHERE {in_range})"),
+        bounds,
+    )
+    if misplaced:
+        conn.execute(
+            sa.text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        )
+    conn.execute(
+        sa.text(
+            f"CREATE TABLE {name} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+    if misplaced:
+        columns = ", ".join(
+            column.name
+            for column in Transaction.__table__.columns
+            if column.computed is None
+        )
+        conn.execute(
+            sa.text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} "
+                f"RETURNING {columns}) "
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+            ),
+            bounds,
+        )
+        conn.execute(
+            sa.text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+        )
+    return name
+
+
+def create_partitions_ahead(
+    conn: Connection, interval: str, count: int, today: date | None = None
+) -> list[str]:
+    """Make sure partitions exist from the current period up to `count` periods ahead
+
+    Holds a transaction-level advisory lock, so that the worker processes starting
+    at once don't create the same partitions concurrently.
+    """
+    # Two-key form, the single keys are the user ids locked by the imports
+    conn.execute(
+        sa.text("SELECT pg_advisory_xact_lock(CAST(:table AS regclass)::oid::int, 0)"),
+        {"table": TABLE},
+    )
+    start = partition_start(today or date.today(), interval)
+    names = []
+    for _ in range(count + 1):
+        names.append(create_partition(conn, start, interval))
+        start = next_partition_start(start, interval)
+    return names
+
+
+def detach_partitions_before(conn: Connection, before: date) -> list[str]:
+    """Detach the partitions entirely older than `before`
+
+    The detached tables keep their rows and can be archived or dropped separately.
+    """
+    detached = []
+    for name in list_partitions(conn):
+        parsed = parse_partition_name(name)
+        if parsed is None:
+            continue
+        start, interval = parsed
+        if next_partition_start(start, interval) <= before:
+            conn.execute(sa.text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            detached.append(name)
+    return detached
+
+
+def convert_to_partitioned(conn: Connection, interval: str) -> None:
+    """Rebuild the plain transactions table as a partitioned one, keeping its rows"""
+    table = Transaction.__table__
+    legacy = f"{TABLE}_unpartitioned"
+    sequence = f"{TABLE}_id_seq"
+
+    conn.execute(sa.text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+    conn.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    conn.execute(
+        sa.text(
+            f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS "
+            "INCLUDING CONSTRAINTS INCLUDING GENERATED) "
+            "PARTITION BY RANGE (transaction_date)"
+        )
+    )
+    conn.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    # Plain DDL - AddConstraint would disable the inline creation of the constraints
+    for foreign_key in table.foreign_key_constraints:
+        columns = ", ".join(column.name for column in foreign_key.columns)
+        referred = ", ".join(element.column.name for element in foreign_key.elements)
+        ondelete = f" ON DELETE {foreign_key.ondelete}" if foreign_key.ondelete else ""
+        conn.execute(
+            sa.text(
+                f"ALTER TABLE {TABLE} ADD FOREIGN KEY ({columns}) "
+                f"REFERENCES {foreign_key.referred_table.name} ({referred}){ondelete}"
+            )
+        )
+
+    first, last = conn.execute(
+        sa.text(f"SELECT min(transaction_date), max(transaction_date) FROM {legacy}")
+    ).one()
+    if first is not None:
+        start = partition_start(first.date(), interval)
+        while start <= last.date():
+            create_partition(conn, start, interval)
+            start = next_partition_start(start, interval)
+    create_partitions_ahead(conn, interval, count=1)
+    # Catches the back-dated transactions outside of the maintained range
+    conn.execute(
+        sa.text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+    )
+
+    columns = ", ".join(
+        column.name for column in table.columns if column.computed is None
+    )
+    conn.execute(
+        sa.text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy}")
+    )
+    conn.execute(sa.text(f"DROP TABLE {legacy}"))
+
+    # Index names are unique per schema, so they are created after the drop
+    conn.execute(sa.text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, transaction_date)"))
+    for index in table.indexes:
+        conn.execute(sa.schema.CreateIndex(index))
+
+
+def ensure_partitions() -> None:
+    """Create the partitions ahead on startup, if the partitioning is enabled"""
+    config = get_config()
+    if config.TRANSACTIONS_PARTITION_INTERVAL is None:
+        return
+    with get_engine().begin() as conn:
+        if is_partitioned(conn):
+            create_partitions_ahead(
+                conn,
+                config.TRANSACTIONS_PARTITION_INTERVAL,
+                config.TRANSACTIONS_PARTITIONS_AHEAD,
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("convert", "create-ahead", "detach"))
+    parser.add_argument("--interval", choices=INTERVALS, default="month")
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--before", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    with get_engine().begin() as conn:
+        if args.command == "convert":
+            convert_to_partitioned(conn, args.interval)
+        elif args.command == "create-ahead":
+            print(*create_partitions_ahead(conn, args.interval, args.count))
+        else:
+            if args.before is None:
+                parser.error("detach requires --before")
+            print(*detach_partitions_before(conn, args.before))
+
+
+if __name__ == "__main__":
+    main()
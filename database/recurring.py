@@ -0,0 +1,151 @@
+"""Detection of recurring payments and income in the user's transactions
+
+Transactions are grouped by their normalized place (or title) and every group
+is tested for regular intervals matching one of PERIODS and for stable amounts.
+Importing this module pulls in NumPy, so it is imported only by the job running it.
+"""
+import re
+from collections.abc import Callable
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.models import RecurringPayment, Transaction, User
+
+PERIODS = RecurringPayment.PERIODS
+# Only the recent history is analysed, which bounds the cost of every refresh
+WINDOW_DAYS = 2 * 366
+MIN_OCCURRENCES = 3
+# Maximal relative deviation of the intervals and amounts from their medians
+MAX_DEVIATION = 0.2
+
+NON_LETTERS_REGEX = re.compile(r"[\W\d_]+")
+
+
+def normalize_description(*texts: str | None) -> str:
+    """The first non-empty text, without letter case, digits and punctuation"""
+    for text in texts:
+        if text and (key := NON_LETTERS_REGEX.sub(" ", text.casefold()).strip()):
+            return key
+    return ""
+
+
+def match_period(interval: float) -> str | None:
+    name = min(PERIODS, key=lambda name: abs(interval - PERIODS[name]) / PERIODS[name])
+    if abs(interval - PERIODS[name]) / PERIODS[name] <= MAX_DEVIATION:
+        return name
+    return None
+
+
+def relative_deviation(values: np.ndarray) -> float:
+    median = np.median(values)
+    if median == 0:
+        return np.inf
+    return float(np.median(np.abs(values - median)) / abs(median))
+
+
+def detect_recurring(
+    keys: np.ndarray, days: np.ndarray, amounts: np.ndarray, today: date
+) -> list[dict]:
+    """Find the recurring groups among transactions, given as parallel arrays
+
+    `days` are ordinal day numbers. Groups which stopped recurring more than two
+    periods ago are left out.
+    """
+    order = np.lexsort((days, keys))
+    keys, days, amounts = keys[order], days[order], amounts[order]
+    # Start indices of the groups of equal keys
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+
+    found = []
+    for start, end in zip(starts, ends):
+        if end - start < MIN_OCCURRENCES or not keys[start]:
+            continue
+        group_days, group_amounts = days[start:end], amounts[start:end]
+        intervals = np.diff(group_days)
+        intervals = intervals[intervals > 0]
+        if len(intervals) < MIN_OCCURRENCES - 1:
+            continue
+
+        interval = float(np.median(intervals))
+        period = match_period(interval)
+        interval_deviation = relative_deviation(intervals)
+        amount_deviation = relative_deviation(group_amounts)
+        if (
+            period is None
+            or interval_deviation > MAX_DEVIATION
+            or amount_deviation > MAX_DEVIATION
+        ):
+            continue
+        last_date = date.fromordinal(int(group_days[-1]))
+        if (today - last_date).days > 2 * PERIODS[period]:
+            continue
+
+        found.append(
+            {
+                "description": str(keys[start]),
+                "period": period,
+                "amount": round(float(np.median(group_amounts)), 2),
+                "occurrences": int(end - start),
+                "last_date": last_date,
+                "next_date": last_date + timedelta(days=round(PERIODS[period])),
+                "confidence": round(1 - (interval_deviation + amount_deviation) / 2, 2),
+            }
+        )
+    return found
+
+
+def refresh_recurring(
+    user: User,
+    db: Session,
+    report_progress: Callable[[float], None] | None = None,
+    today: date | None = None,
+) -> int:
+    """Replace the user's detected recurring payments, return their number"""
+    today = today or date.today()
+    # Read first - changes made during the analysis leave the results stale
+    version = db.scalar(select(User.data_version).filter_by(id=user.id))
+    rows = db.execute(
+        select(
+            Transaction.title,
+            Transaction.place,
+            Transaction.transaction_date,
+            Transaction.main_amount,
+        ).where(
+            Transaction.user_id == user.id,
+            Transaction.transaction_date
+            >= datetime.combine(today, datetime.min.time())
+            - timedelta(days=WINDOW_DAYS),
+        )
+    ).all()
+    if report_progress is not None:
+        report_progress(0.5)
+
+    found = detect_recurring(
+        np.array([normalize_description(row.place, row.title) for row in rows]),
+        np.array([row.transaction_date.toordinal() for row in rows], dtype=np.int64),
+        np.array([row.main_amount for row in rows], dtype=float),
+        today,
+    )
+    db.execute(sa.delete(RecurringPayment).filter_by(user_id=user.id))
+    if found:
+        db.execute(
+            sa.insert(RecurringPayment),
+            [{**payment, "user_id": user.id} for payment in found],
+        )
+    users = User.__table__
+    db.execute(
+        sa.update(users)
+        .where(users.c.id == user.id)
+        .values(
+            recurring_version=version,
+            change_seq=users.c.change_seq,
+            change_xid=users.c.change_xid,
+        )
+    )
+    db.commit()
+    return len(found)
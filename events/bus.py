@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import select
+from collections import defaultdict
+from itertools import chain
+from threading import Event, Lock, Thread
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+import database.models as d
+from config import Config, get_config
+from database.main import get_engine
+
+logger = logging.getLogger("uvicorn.error")
+
+CHANNEL = "wallit_events"
+MAX_QUEUED_EVENTS = 100
+
+
+class EventBus:
+    """In-process pub/sub of the users' data change events
+
+    Events are published from any thread and delivered to the asyncio queues
+    of the user's subscribers, on their own event loops.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[
+            int, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]
+        ] = defaultdict(set)
+        self._lock = Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Must be called from the event loop consuming the queue"""
+        queue: asyncio.Queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers[user_id]
+            subscribers.difference_update(
+                {subscriber for subscriber in subscribers if subscriber[1] is queue}
+            )
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.dispatch(user_id, event)
+
+    def dispatch(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+def _offer(queue: asyncio.Queue, event: dict) -> None:
+    # A slow client loses events rather than growing the memory use
+    if not queue.full():
+        queue.put_nowait(event)
+
+
+class PostgresEventBus(EventBus):
+    """Fan-out to all the worker processes through Postgres LISTEN/NOTIFY"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._notify_connection = None
+        self._notify_lock = Lock()
+        self._stopped = Event()
+        self._listener: Thread | None = None
+
+    def _connect(self):  # noqa: ANN202
+        # Kept out of the pool for the lifetime of the bus
+        connection = get_engine().raw_connection()
+        connection.detach()
+        driver_connection = connection.driver_connection
+        driver_connection.autocommit = True
+        return driver_connection
+
+    def publish(self, user_id: int, event: dict) -> None:
+        payload = json.dumps({"user_id": user_id, "event": event})
+        with self._notify_lock:
+            if self._notify_connection is None:
+                self._notify_connection = self._connect()
+            with self._notify_connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._listener = Thread(target=self._listen, name="events", daemon=True)
+        self._listener.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.join()
+        with self._notify_lock:
+            if self._notify_connection is not None:
+                self._notify_connection.close()
+                self._notify_connection = None
+
+    def _listen(self) -> None:
+        connection = self._connect()
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        try:
+            while not self._stopped.is_set():
+                if select.select([connection], [], [], 1) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    message = json.loads(connection.notifies.pop(0).payload)
+                    self.dispatch(message["user_id"], message["event"])
+        finally:
+            connection.close()
+
+
+def create_event_bus(config: Config) -> EventBus:
+    match config.EVENTS_BACKEND:
+        case "memory":
+            return EventBus()
+        case "postgres":
+            return PostgresEventBus()
+    raise ValueError(f"Unknown events backend '{config.EVENTS_BACKEND}'")
+
+
+_bus: EventBus | None = None
+
+
+def get_event_bus(config: Config = Depends(get_config)) -> EventBus:
+    global _bus
+    if _bus is None:
+        _bus = create_event_bus(config)
+    return _bus
+
+
+def start_event_bus() -> None:
+    get_event_bus(get_config()).start()
+
+
+def stop_event_bus() -> None:
+    if _bus is not None:
+        _bus.stop()
+
+
+# Flushed changes are published only once their transaction commits
+EVENTS_KEY = "pending_events"
+# Number of the events pending when each savepoint began
+MARKS_KEY = "pending_event_marks"
+
+
+def queue_event(session: Session, user_id: int | None, event: dict) -> None:
+    """Publish the event after the session's transaction commits"""
+    session.info.setdefault(EVENTS_KEY, []).append((user_id, event))
+
+
+@sa.event.listens_for(Session, "after_flush")
+def collect_events(session: Session, flush_context: so.UOWTransaction) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.new:
+            action = "created"
+        elif obj in session.deleted:
+            action = "deleted"
+        elif session.is_modified(obj):
+            action = "modified"
+        else:
+            continue
+
+        if isinstance(obj, (d.Transaction, d.Category)):
+            user_id = sa.inspect(obj).dict.get("user_id")
+            entity = "transaction" if isinstance(obj, d.Transaction) else "category"
+            queue_event(session, user_id, {"type": f"{entity}.{action}", "id": obj.id})
+        elif isinstance(obj, d.User) and action == "modified":
+            queue_event(session, obj.id, {"type": "user.modified", "id": obj.id})
+        elif isinstance(obj, d.Job) and (
+            action == "created" or sa.inspect(obj).attrs.status.history.added
+        ):
+            event = {"type": f"job.{obj.status.value.lower()}", "id": obj.id}
+            queue_event(session, obj.user_id, {**event, "kind": obj.kind})
+
+
+@sa.event.listens_for(Session, "after_transaction_create")
+def mark_events(session: Session, transaction: so.SessionTransaction) -> None:
+    if transaction.nested:
+        marks = session.info.setdefault(MARKS_KEY, {})
+        marks[transaction] = len(session.info.get(EVENTS_KEY, []))
+
+
+@sa.event.listens_for(Session, "after_soft_rollback")
+def discard_savepoint_events(
+    session: Session, previous_transaction: so.SessionTransaction
+) -> None:
+    mark = session.info.get(MARKS_KEY, {}).pop(previous_transaction, None)
+    if mark is not None:
+        del session.info.get(EVENTS_KEY, [])[mark:]
+
+
+@sa.event.listens_for(Session, "after_commit")
+def publish_events(session: Session) -> None:
+    # Released savepoint, its events are committed only along with the root
+    if session.in_nested_transaction():
+        return
+    session.info.pop(MARKS_KEY, None)
+    events = session.info.pop(EVENTS_KEY, [])
+    if not events:
+        return
+    bus = get_event_bus(get_config())
+    for user_id, event in events:
+        if user_id is None:
+            continue
+        try:
+            bus.publish(user_id, event)
+        except Exception:
+            # Data is committed already, a lost notification must not fail the request
+            logger.exception("Publishing of an event failed")
+
+
+@sa.event.listens_for(Session, "after_transaction_end")
+def discard_events(session: Session, transaction: so.SessionTransaction) -> None:
+    # Events of a rolled back savepoint are discarded by `discard_savepoint_events`,
+    # the ones left at the end of the root transaction were rolled back with it
+    if transaction.parent is None:
+        session.info.pop(MARKS_KEY, None)
+        session.info.pop(EVENTS_KEY, None)
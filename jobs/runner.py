@@ -0,0 +1,168 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Timer
+
+from fastapi import Depends
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+import database.models as d
+from config import Config, get_config
+from database.main import get_session_factory
+from jobs.tasks import TASKS
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class JobRunner:
+    """Executes persisted jobs on a bounded pool of worker threads"""
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        max_workers: int,
+        max_attempts: int,
+        retry_delay_seconds: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+
+    def enqueue(self, kind: str, user: d.User, params: dict, db: Session) -> d.Job:
+        if kind not in TASKS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+
+        job = d.Job(kind=kind, user=user, params=params)
+        db.add(job)
+        db.commit()
+        self.submit(job.id)
+        return job
+
+    def enqueue_once(self, kind: str, user: d.User, params: dict, db: Session) -> d.Job:
+        """Enqueue the job unless the user has one of the kind waiting or running"""
+        job = db.scalar(
+            select(d.Job).filter(
+                d.Job.kind == kind,
+                d.Job.user_id == user.id,
+                d.Job.status.in_([d.JobStatus.PENDING, d.JobStatus.RUNNING]),
+            )
+        )
+        return job or self.enqueue(kind, user, params, db)
+
+    def submit(self, job_id: int) -> None:
+        self._executor.submit(self._run, job_id)
+
+    def recover(self, stale_after: timedelta) -> None:
+        """Resubmit pending jobs and the running ones abandoned by a dead process"""
+        with self.session_factory() as db:
+            db.execute(
+                update(d.Job)
+                .where(
+                    d.Job.status == d.JobStatus.RUNNING,
+                    d.Job.start_date < datetime.utcnow() - stale_after,
+                )
+                .values(status=d.JobStatus.PENDING)
+            )
+            db.commit()
+            job_ids = db.scalars(
+                select(d.Job.id).filter_by(status=d.JobStatus.PENDING)
+            ).all()
+
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _claim(self, job_id: int, db: Session) -> bool:
+        # Atomic PENDING -> RUNNING transition, only one worker process wins it
+        claimed = db.execute(
+            update(d.Job)
+            .where(d.Job.id == job_id, d.Job.status == d.JobStatus.PENDING)
+            .values(
+                status=d.JobStatus.RUNNING,
+                attempts=d.Job.attempts + 1,
+                start_date=datetime.utcnow(),
+                error=None,
+            )
+        )
+        db.commit()
+        return claimed.rowcount == 1
+
+    def _report_progress(self, job_id: int, progress: float) -> None:
+        # Separate session, so that the progress is visible before the job commits
+        with self.session_factory() as db:
+            db.execute(
+                update(d.Job).where(d.Job.id == job_id).values(progress=progress)
+            )
+            db.commit()
+
+    def _run(self, job_id: int) -> None:
+        with self.session_factory() as db:
+            if not self._claim(job_id, db):
+                return
+
+            job = db.get(d.Job, job_id)
+            try:
+                result = TASKS[job.kind](
+                    job, db, lambda progress: self._report_progress(job_id, progress)
+                )
+            except Exception as e:
+                logger.exception(f"Job {job_id} ({job.kind}) failed")
+                db.rollback()
+                self._fail(job_id, repr(e), db)
+            else:
+                job = db.get(d.Job, job_id)
+                job.status = d.JobStatus.SUCCEEDED
+                job.progress = 1
+                job.result = result
+                job.finish_date = datetime.utcnow()
+                db.commit()
+
+    def _fail(self, job_id: int, error: str, db: Session) -> None:
+        job = db.get(d.Job, job_id)
+        job.error = error
+        if job.attempts < self.max_attempts:
+            job.status = d.JobStatus.PENDING
+            db.commit()
+            # Linear backoff between the attempts
+            retry = Timer(
+                self.retry_delay_seconds * job.attempts, self.submit, [job_id]
+            )
+            retry.daemon = True
+            retry.start()
+        else:
+            job.status = d.JobStatus.FAILED
+            job.finish_date = datetime.utcnow()
+            db.commit()
+
+
+_runner: JobRunner | None = None
+
+
+def get_job_runner(
+    config: Config = Depends(get_config),
+    session_factory: sessionmaker = Depends(get_session_factory),
+) -> JobRunner:
+    global _runner
+    if _runner is None:
+        _runner = JobRunner(
+            session_factory,
+            config.JOB_WORKERS,
+            config.JOB_MAX_ATTEMPTS,
+            config.JOB_RETRY_DELAY_SECONDS,
+        )
+    return _runner
+
+
+def start_job_runner() -> None:
+    config = get_config()
+    runner = get_job_runner(config, get_session_factory())
+    runner.recover(timedelta(minutes=config.JOB_STALE_MINUTES))
+
+
+def stop_job_runner() -> None:
+    if _runner is not None:
+        _runner.shutdown()
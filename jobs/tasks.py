@@ -0,0 +1,54 @@
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+import database.models as d
+
+# Handler receives the claimed job, a session and a progress callback [0, 1].
+# Its return value is stored as the job's result.
+Task = Callable[[d.Job, Session, Callable[[float], None]], dict | None]
+
+
+def change_main_currency(
+    job: d.Job, db: Session, report_progress: Callable[[float], None]
+) -> dict:
+    user = job.user
+    user.change_main_currency(
+        job.params["main_currency"], db, report_progress, commit_batches=True
+    )
+    db.commit()
+    return {"main_currency": user.main_currency}
+
+
+def delete_account(
+    job: d.Job, db: Session, report_progress: Callable[[float], None]
+) -> None:
+    job.user.delete_account(db, job.params["batch_size"], report_progress)
+
+
+def recategorize(
+    job: d.Job, db: Session, report_progress: Callable[[float], None]
+) -> dict:
+    from database.categorization import recategorize as recategorize_transactions
+
+    categorized = recategorize_transactions(
+        job.user, db, job.params["batch_size"], report_progress
+    )
+    return {"categorized": categorized}
+
+
+def detect_recurring(
+    job: d.Job, db: Session, report_progress: Callable[[float], None]
+) -> dict:
+    # Deferred, NumPy is only needed by the analysis
+    from database.recurring import refresh_recurring
+
+    return {"found": refresh_recurring(job.user, db, report_progress)}
+
+
+TASKS: dict[str, Task] = {
+    "change_main_currency": change_main_currency,
+    "delete_account": delete_account,
+    "recategorize": recategorize,
+    "detect_recurring": detect_recurring,
+}
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Generator
 
 import pytest
@@ -8,9 +8,13 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.orm.session import close_all_sessions
 
+from api.cache import LRUCache, get_cache
+from api.idempotency import IdempotencyStore, get_idempotency_store
 from config import Config, CurrenciesEnum, get_config
-from database.main import Base, get_db
+from database import categorization
+from database.main import Base, get_db, get_replica_db, get_session_factory
 from database.models import Bank, Category, Transaction, User
+from jobs.runner import JobRunner, get_job_runner
 from wallitapi import create_app
 
 
@@ -38,15 +42,37 @@ def app() -> Generator[FastAPI, None, None]:
     app = create_app()
     app.dependency_overrides[get_config] = get_test_config
     app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_replica_db] = get_test_db
+    cache = LRUCache(max_entries=100)
+    app.dependency_overrides[get_cache] = lambda: cache
+    store = IdempotencyStore(
+        TestSessionLocal,
+        timedelta(hours=1),
+        max_memory_entries=100,
+        lease=timedelta(minutes=1),
+    )
+    app.dependency_overrides[get_idempotency_store] = lambda: store
+    app.dependency_overrides[get_session_factory] = lambda: TestSessionLocal
+    runner = JobRunner(
+        TestSessionLocal, max_workers=1, max_attempts=1, retry_delay_seconds=0
+    )
+    app.dependency_overrides[get_job_runner] = lambda: runner
 
     try:
         Base.metadata.create_all(bind=Engine)
         yield app
     finally:
+        runner.shutdown()
+        categorization._categorizers.clear()
         close_all_sessions()
         Base.metadata.drop_all(bind=Engine)
 
 
+@pytest.fixture()
+def job_runner(app: FastAPI) -> JobRunner:
+    return app.dependency_overrides[get_job_runner]()
+
+
 @pytest.fixture()
 def client(app: FastAPI) -> TestClient:
     return TestClient(app)
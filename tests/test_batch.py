@@ -0,0 +1,113 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from database.models import Category, ExchangeRate, Transaction
+from tests.conftest import ModelFactory, get_test_access_token_header
+
+
+def test_batch(client: TestClient, db: Session, model_factory: ModelFactory) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, user_2, category_1])
+    db.add_all(
+        [
+            ExchangeRate(date=datetime(2023, 1, 1), source="USD", rate=1.25),
+            ExchangeRate(date=datetime(2023, 1, 2), source="USD", rate=2),
+        ]
+    )
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        -30, "EUR", datetime(2023, 1, 2), None, user_2, None, db
+    )
+    db.add_all([transaction_1, transaction_2, transaction_3])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    operations = [
+        {
+            "method": "create",
+            "entity": "transaction",
+            "data": {
+                "base_amount": -10,
+                "base_currency": "USD",
+                "transaction_date": "2023-01-01T00:00:00",
+            },
+        },
+        {
+            "method": "modify",
+            "entity": "transaction",
+            "id": transaction_1.id,
+            "data": {"base_currency": "USD", "category_id": category_1.id},
+        },
+        {"method": "delete", "entity": "transaction", "id": transaction_2.id},
+        # owned by another user
+        {"method": "delete", "entity": "transaction", "id": transaction_3.id},
+        {"method": "create", "entity": "category", "data": {"name": category_1.name}},
+        {"method": "modify", "entity": "transaction", "data": {"title": "No id"}},
+        {
+            "method": "modify",
+            "entity": "transaction",
+            "id": transaction_1.id,
+            "data": {"base_amount": "many"},
+        },
+        {"method": "create", "entity": "category", "data": {"name": "Travel"}},
+    ]
+    response = client.post("batch/", headers=header, json={"operations": operations})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status"] for result in results] == [
+        201,
+        200,
+        200,
+        404,
+        409,
+        422,
+        422,
+        201,
+    ]
+
+    db.expunge_all()
+    transaction_4 = db.get(Transaction, results[0]["id"])
+    assert transaction_4.main_amount == -8
+    transaction_1 = db.get(Transaction, transaction_1.id)
+    assert transaction_1.main_amount == -5
+    assert transaction_1.category_id == category_1.id
+    assert db.get(Transaction, transaction_2.id) is None
+    assert db.get(Transaction, transaction_3.id) is not None
+    assert db.get(Category, results[7]["id"]).name == "Travel"
+
+
+def test_batch_missing_rate(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    operations = [
+        {
+            "method": "create",
+            "entity": "transaction",
+            "data": {
+                "base_amount": -10,
+                "base_currency": "USD",
+                "transaction_date": "2023-03-01T00:00:00",
+            },
+        },
+        {"method": "create", "entity": "category", "data": {"name": "Travel"}},
+    ]
+    response = client.post("batch/", headers=header, json={"operations": operations})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status"] for result in results] == [422, 201]
+    assert results[0]["detail"].endswith("rate on 2023-03-01")
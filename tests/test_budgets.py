@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from tests.conftest import ModelFactory, get_test_access_token_header
+
+
+def test_budgets(client: TestClient, db: Session, model_factory: ModelFactory) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    category_2 = model_factory.create_category(user_1)
+    category_2.name = "Transport"
+    db.add_all([user_1, category_1, category_2])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 5), category_1, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -50, "EUR", datetime(2022, 12, 31), category_1, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    def spent(month: str = "2023-01-01") -> list[float]:
+        response = client.get("budgets/", headers=header, params={"month": month})
+        assert response.status_code == 200
+        return [status["spent"] for status in response.json()]
+
+    # spend preceding the budget is counted
+    body_1 = {"category_id": category_1.id, "monthly_limit": 100}
+    response = client.post("budgets/", headers=header, json=body_1)
+    assert response.status_code == 201
+    response = client.post("budgets/", headers=header, json=body_1)
+    assert response.status_code == 409
+    body_2 = {"category_id": category_2.id, "monthly_limit": 20}
+    response = client.post("budgets/", headers=header, json=body_2)
+    assert spent() == [10, 0]
+    assert spent("2022-12-15") == [50, 0]
+
+    # created, modified and deleted transactions
+    body_3 = {
+        "base_amount": -5,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-10T00:00:00",
+        "category_id": category_1.id,
+    }
+    response = client.post("transactions/", headers=header, json=body_3)
+    transaction_3_id = response.json()["id"]
+    assert spent() == [15, 0]
+
+    response = client.put(
+        f"transactions/{transaction_1.id}",
+        headers=header,
+        json={"base_amount": -12, "category_id": category_2.id},
+    )
+    assert response.status_code == 200
+    assert spent() == [5, 12]
+    response = client.get("budgets/", headers=header, params={"month": "2023-01-01"})
+    assert response.json()[1]["remaining"] == 8
+
+    response = client.delete(f"transactions/{transaction_3_id}", headers=header)
+    assert response.status_code == 204
+    assert spent() == [0, 12]
+
+    # deleted category takes its budget along
+    response = client.delete(f"categories/{category_2.id}", headers=header)
+    assert response.status_code == 204
+    assert spent() == [0]
+
+    # category of another user can't be assigned, nor would its spend be counted
+    user_2 = model_factory.create_user("EUR")
+    db.add(user_2)
+    db.commit()
+    header_2 = get_test_access_token_header(client, user_2)
+    response = client.post("transactions/", headers=header_2, json=body_3)
+    assert response.status_code == 404
+    operations = [{"method": "create", "entity": "transaction", "data": body_3}]
+    response = client.post("batch/", headers=header_2, json={"operations": operations})
+    assert [result["status"] for result in response.json()] == [404]
+    transaction_4 = model_factory.create_transaction(
+        -70, "EUR", datetime(2023, 1, 7), category_1, user_2, None, db
+    )
+    db.add(transaction_4)
+    db.commit()
+    assert spent() == [0]
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
@@ -123,3 +125,180 @@ def test_delete_category(
     # category not owned by the querying user
     response = client.delete(f"categories/{category_2.id}", headers=header)
     assert response.status_code == 404
+
+
+def test_merge_and_reassign_category(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    category_2 = model_factory.create_category(user_1)
+    category_2.name = "Transport"
+    category_3 = model_factory.create_category(user_1)
+    category_3.name = "Travel"
+    db.add_all([user_1, category_1, category_2, category_3])
+    db.flush()
+    transactions = [
+        model_factory.create_transaction(
+            amount, "EUR", datetime(2023, 1, 1), category, user_1, None, db
+        )
+        for amount, category in [(-10, category_1), (-20, category_2), (-5, None)]
+    ]
+    db.add_all(transactions)
+    db.commit()
+    ids = [transaction.id for transaction in transactions]
+    header = get_test_access_token_header(client, user_1)
+    body = {"category_id": category_2.id, "monthly_limit": 100}
+    client.post("budgets/", headers=header, json=body)
+
+    def category_ids() -> dict[int, int | None]:
+        response = client.get("transactions/", headers=header)
+        return {t["id"]: t["category"] and t["category"]["id"] for t in response.json()}
+
+    # merge
+    response = client.post(
+        f"categories/{category_1.id}/merge",
+        headers=header,
+        json={"target_id": category_2.id},
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == category_2.id
+    assert category_ids() == {
+        ids[0]: category_2.id,
+        ids[1]: category_2.id,
+        ids[2]: None,
+    }
+    response = client.get("budgets/", headers=header, params={"month": "2023-01-01"})
+    assert response.json()[0]["spent"] == 30
+    response = client.get(f"categories/{category_1.id}", headers=header)
+    assert response.status_code == 404
+
+    response = client.post(
+        f"categories/{category_2.id}/merge",
+        headers=header,
+        json={"target_id": category_2.id},
+    )
+    assert response.status_code == 422
+
+    # deletion with reassignment
+    response = client.delete(
+        f"categories/{category_2.id}",
+        headers=header,
+        params={"reassign_to": category_3.id},
+    )
+    assert response.status_code == 204
+    assert category_ids() == {
+        ids[0]: category_3.id,
+        ids[1]: category_3.id,
+        ids[2]: None,
+    }
+
+    # deletion leaves the transactions uncategorized
+    response = client.delete(f"categories/{category_3.id}", headers=header)
+    assert response.status_code == 204
+    assert category_ids() == {ids[0]: None, ids[1]: None, ids[2]: None}
+
+
+def test_get_category_etag(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, category_1])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.get(f"categories/{category_1.id}", headers=header)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # unchanged category
+    response = client.get(
+        f"categories/{category_1.id}", headers={**header, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # modified category
+    client.put(f"categories/{category_1.id}", headers=header, json={"name": "New"})
+    response = client.get(
+        f"categories/{category_1.id}", headers={**header, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_category_rules(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    category_2 = model_factory.create_category(user_2)
+    db.add_all([user_1, user_2, category_1, category_2])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # category not owned by the user
+    body_1 = {"category_id": category_2.id, "field": "place", "pattern": "Tesco"}
+    response = client.post("categories/rules", headers=header, json=body_1)
+    assert response.status_code == 404
+
+    # correct data
+    body_2 = {"category_id": category_1.id, "field": "place", "pattern": "Tesco"}
+    response = client.post("categories/rules", headers=header, json=body_2)
+    assert response.status_code == 201
+    rule_id = response.json()["id"]
+
+    # new transactions are categorized by the rule
+    body_3 = {
+        "base_amount": -10,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-01T00:00:00",
+        "place": "TESCO Stores",
+    }
+    response = client.post("transactions/", headers=header, json=body_3)
+    assert response.status_code == 201
+    assert response.json()["category"]["id"] == category_1.id
+
+    response = client.delete(f"categories/rules/{rule_id}", headers=header)
+    assert response.status_code == 204
+    response = client.get("categories/rules", headers=header)
+    assert response.json() == []
+
+
+def test_categorization_after_deletion(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, category_1])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), category_1, user_1, None, db
+    )
+    transaction_1.title = "Lidl groceries"
+    db.add(transaction_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    body = {
+        "base_amount": -5,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-02T00:00:00",
+        "title": "Lidl",
+    }
+    response = client.post("transactions/", headers=header, json=body)
+    assert response.json()["category"]["id"] == category_1.id
+
+    # the word model isn't retrained yet, but the deleted category is not assigned
+    response = client.delete(f"categories/{category_1.id}", headers=header)
+    assert response.status_code == 204
+    response = client.post("transactions/", headers=header, json=body)
+    assert response.status_code == 201
+    assert response.json()["category"] is None
+    body = {**body, "title": "Lidl shop"}
+    response = client.post(
+        "transactions/import", headers=header, json={"transactions": [body]}
+    )
+    assert response.json() == {"created": 1, "duplicates": 0}
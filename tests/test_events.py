@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+from api.batch import apply_operations
+from api.cache import LRUCache
+from config import get_config
+from database.models import Job
+from events.bus import get_event_bus
+from tests.conftest import ModelFactory
+
+
+def test_publish_committed_changes(
+    app: FastAPI, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    db.add_all([user_1, user_2])
+    db.commit()
+    bus = get_event_bus(get_config())
+
+    async def collect() -> tuple[list[dict], list[dict]]:
+        queue_1, queue_2 = bus.subscribe(user_1.id), bus.subscribe(user_2.id)
+        transaction = model_factory.create_transaction(
+            -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+        )
+        db.add(transaction)
+        db.flush()
+        await asyncio.sleep(0)
+        # nothing is published before the commit
+        assert queue_1.empty()
+        db.commit()
+
+        db.add(model_factory.create_category(user_1))
+        db.flush()
+        db.rollback()
+        # nor the changes of a rolled back savepoint
+        with pytest.raises(ValueError):
+            with db.begin_nested():
+                db.add(model_factory.create_category(user_1))
+                db.flush()
+                raise ValueError
+
+        db.add(Job(kind="detect_recurring", user=user_1))
+        db.commit()
+        await asyncio.sleep(0)
+        events = [queue_1.get_nowait() for _ in range(queue_1.qsize())]
+        bus.unsubscribe(user_1.id, queue_1)
+        bus.unsubscribe(user_2.id, queue_2)
+        return events, [queue_2.get_nowait() for _ in range(queue_2.qsize())]
+
+    events_1, events_2 = asyncio.run(collect())
+    assert [event["type"] for event in events_1] == [
+        "transaction.created",
+        "job.pending",
+    ]
+    assert events_1[1]["kind"] == "detect_recurring"
+    assert events_2 == []
+
+
+def test_publish_committed_batch(
+    app: FastAPI,
+    db: Session,
+    model_factory: ModelFactory,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    bus = get_event_bus(get_config())
+    cache = LRUCache(max_entries=10)
+    batch = s.Batch(
+        operations=[
+            {"method": "create", "entity": "category", "data": {"name": "Travel"}},
+            # failed operation rolls back its own savepoint only
+            {"method": "delete", "entity": "category", "id": 100},
+            {"method": "create", "entity": "category", "data": {"name": "Food"}},
+        ]
+    )
+
+    def fail() -> None:
+        raise ValueError
+
+    async def collect() -> list[dict]:
+        queue = bus.subscribe(user_1.id)
+        # released savepoints are not published before the outer commit
+        with monkeypatch.context() as patch:
+            patch.setattr(db, "commit", fail)
+            with pytest.raises(ValueError):
+                apply_operations(batch, user_1, db, cache, db)
+        db.rollback()
+        await asyncio.sleep(0)
+        assert queue.empty()
+
+        apply_operations(batch, user_1, db, cache, db)
+        await asyncio.sleep(0)
+        bus.unsubscribe(user_1.id, queue)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    events = asyncio.run(collect())
+    assert [event["type"] for event in events] == [
+        "category.created",
+        "category.created",
+    ]
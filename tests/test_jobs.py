@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from config import Config, get_config
+from database.models import ExchangeRate, Job, JobStatus
+from jobs.runner import JobRunner
+from tests.conftest import ModelFactory, get_test_access_token_header, get_test_config
+
+
+def test_get_job(client: TestClient, db: Session, model_factory: ModelFactory) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    job_1 = Job(kind="change_main_currency", user=user_1)
+    job_2 = Job(kind="change_main_currency", user=user_2)
+    db.add_all([user_1, user_2, job_1, job_2])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # correct data
+    response = client.get(f"jobs/{job_1.id}", headers=header)
+    assert response.status_code == 200
+    assert response.json()["status"] == "PENDING"
+
+    # job not owned by the querying user
+    response = client.get(f"jobs/{job_2.id}", headers=header)
+    assert response.status_code == 404
+
+    # all user's jobs
+    response = client.get("jobs/", headers=header)
+    assert response.status_code == 200
+    assert [job["id"] for job in response.json()] == [job_1.id]
+
+
+def test_modify_current_user_in_background(
+    app: FastAPI,
+    client: TestClient,
+    db: Session,
+    model_factory: ModelFactory,
+    job_runner: JobRunner,
+) -> None:
+    def override_test_config() -> Config:
+        config = get_test_config()
+        config.JOB_BACKGROUND_THRESHOLD = 0
+        return config
+
+    app.dependency_overrides[get_config] = override_test_config
+    user_1 = model_factory.create_user("EUR")
+    db.add_all(
+        [
+            user_1,
+            ExchangeRate(date=datetime(2023, 1, 1), source="EUR", rate=1),
+            ExchangeRate(date=datetime(2023, 1, 1), source="USD", rate=1.1),
+        ]
+    )
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    db.add(transaction_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.put("/user", headers=header, json={"main_currency": "USD"})
+    assert response.status_code == 202
+    assert response.headers["Location"] == f"/jobs/{response.json()['id']}"
+
+    job_runner.shutdown()  # waits for the job to finish
+    response = client.get(response.headers["Location"], headers=header)
+    assert response.json()["status"] == JobStatus.SUCCEEDED
+    assert response.json()["progress"] == 1
+
+    db.expire_all()
+    assert user_1.main_currency == "USD"
+    assert transaction_1.main_amount == -11
+
+
+def test_recategorize_in_background(
+    client: TestClient,
+    db: Session,
+    model_factory: ModelFactory,
+    job_runner: JobRunner,
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, category_1])
+    db.flush()
+    transactions = [
+        model_factory.create_transaction(
+            -10, "EUR", datetime(2023, 1, 1), category, user_1, None, db
+        )
+        for category in (category_1, category_1, None, None)
+    ]
+    for transaction in transactions:
+        transaction.info = transaction.place = None
+    transactions[0].title = transactions[1].title = "Lidl groceries"
+    transactions[2].title = "Groceries at Lidl"
+    transactions[3].title = "Cinema"
+    db.add_all(transactions)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.post("/categories/recategorize", headers=header)
+    assert response.status_code == 202
+
+    job_runner.shutdown()  # waits for the job to finish
+    response = client.get(response.headers["Location"], headers=header)
+    assert response.json()["status"] == JobStatus.SUCCEEDED
+    assert response.json()["result"] == {"categorized": 1}
+
+    db.expire_all()
+    assert transactions[2].category_id == category_1.id
+    assert transactions[3].category_id is None
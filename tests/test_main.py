@@ -0,0 +1,26 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from api.cache import LRUCache
+
+
+def test_health(client: TestClient) -> None:
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["pid"] == os.getpid()
+    assert response.json()["uptime_seconds"] > 0
+
+
+def test_lru_cache() -> None:
+    cache = LRUCache(max_entries=2)
+    cache.set(1, "a", b"1")
+    cache.set(2, "b", b"2")
+    cache.set(2, "c", b"3")
+
+    # evicted user is forgotten along with the entry
+    assert cache.get(1, "a") is None
+    assert cache._user_keys == {2: {"b", "c"}}
+    cache.invalidate(2)
+    assert cache.get(2, "b") is None
+    assert cache._user_keys == {}
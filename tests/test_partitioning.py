@@ -0,0 +1,101 @@
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.models import Transaction
+from database.partitioning import (
+    convert_to_partitioned,
+    create_partitions_ahead,
+    detach_partitions_before,
+    is_partitioned,
+    list_partitions,
+    next_partition_start,
+    parse_partition_name,
+    partition_name,
+    partition_start,
+)
+from tests.conftest import Engine, ModelFactory
+
+
+def test_partition_bounds() -> None:
+    assert partition_start(date(2023, 5, 17), "month") == date(2023, 5, 1)
+    assert partition_start(date(2023, 5, 17), "year") == date(2023, 1, 1)
+    assert next_partition_start(date(2023, 12, 1), "month") == date(2024, 1, 1)
+    assert next_partition_start(date(2023, 1, 1), "year") == date(2024, 1, 1)
+
+    name = partition_name(date(2023, 5, 1), "month")
+    assert name == "transactions_y2023m05"
+    assert parse_partition_name(name) == (date(2023, 5, 1), "month")
+    assert parse_partition_name("transactions_y2023") == (date(2023, 1, 1), "year")
+    assert parse_partition_name("transactions_default") is None
+
+
+def test_convert_to_partitioned(
+    app: FastAPI, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2021, 3, 1), None, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2022, 6, 1), None, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2])
+    db.commit()
+
+    with Engine.begin() as conn:
+        convert_to_partitioned(conn, "year")
+        assert is_partitioned(conn)
+        assert {"transactions_y2021", "transactions_y2022"} <= set(
+            list_partitions(conn)
+        )
+        create_partitions_ahead(conn, "year", 1, today=date(2030, 1, 1))
+        assert {"transactions_y2030", "transactions_y2031"} <= set(
+            list_partitions(conn)
+        )
+
+    # rows are kept and new ones get the next ids
+    transaction_3 = model_factory.create_transaction(
+        -30, "EUR", datetime(2022, 7, 1), None, user_1, None, db
+    )
+    db.add(transaction_3)
+    db.commit()
+    assert db.scalars(select(Transaction.id).order_by(Transaction.id)).all() == [
+        transaction_1.id,
+        transaction_2.id,
+        transaction_3.id,
+    ]
+    db.commit()
+
+    with Engine.begin() as conn:
+        assert detach_partitions_before(conn, date(2022, 1, 1)) == [
+            "transactions_y2021"
+        ]
+    assert db.scalars(select(Transaction.id).order_by(Transaction.id)).all() == [
+        transaction_2.id,
+        transaction_3.id,
+    ]
+    db.commit()
+
+    # back-dated transaction lands in the default partition, until its own is created
+    transaction_4 = model_factory.create_transaction(
+        -40, "EUR", datetime(2019, 2, 1), None, user_1, None, db
+    )
+    db.add(transaction_4)
+    db.commit()
+    transaction_4_id = transaction_4.id
+    db.commit()
+    with Engine.begin() as conn:
+        create_partitions_ahead(conn, "year", 0, today=date(2019, 5, 1))
+        assert conn.scalars(sa.text("SELECT id FROM transactions_y2019")).all() == [
+            transaction_4_id
+        ]
+        assert "transactions_default" in list_partitions(conn)
+
+    with Engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE transactions_y2021")
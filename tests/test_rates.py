@@ -0,0 +1,179 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.conversion import MissingRateError, RateMatrix, round_amounts
+from database.models import Budget, ExchangeRate, Transaction, round_amount
+from tests.conftest import ModelFactory, TestSessionLocal, get_test_access_token_header
+
+
+@pytest.fixture()
+def exchange_rates(app: FastAPI, db: Session) -> None:
+    db.add_all(
+        [
+            ExchangeRate(date=datetime(2023, 1, 1), source="USD", rate=1.1),
+            ExchangeRate(date=datetime(2023, 1, 1), source="PLN", rate=4.4),
+            ExchangeRate(date=datetime(2023, 1, 2), source="USD", rate=1.2),
+        ]
+    )
+    db.commit()
+
+
+def test_rate_matrix_convert(db: Session, exchange_rates: None) -> None:
+    rates = RateMatrix.load(db, date(2023, 1, 1), date(2023, 1, 2))
+
+    assert rates.rate(date(2023, 1, 1), "PLN", "USD") == pytest.approx(0.25)
+    converted = rates.convert(
+        [10, 44, 10, 5],
+        ["USD", "PLN", "USD", "EUR"],
+        "EUR",
+        [date(2023, 1, 1), date(2023, 1, 1), date(2023, 1, 2), date(2023, 1, 2)],
+    )
+    assert converted.tolist() == [9.09, 10, 8.33, 5]
+
+    with pytest.raises(MissingRateError):
+        rates.convert([10], ["PLN"], "EUR", [date(2023, 1, 2)])
+    with pytest.raises(MissingRateError):
+        rates.convert([10], ["USD"], "EUR", [date(2023, 1, 3)])
+
+
+def test_eur_normalized_amounts(
+    db: Session, model_factory: ModelFactory, exchange_rates: None
+) -> None:
+    user_1 = model_factory.create_user("USD")
+    db.add(user_1)
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -44, "PLN", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    assert transaction_1.eur_amount == pytest.approx(-10)
+    assert transaction_1.rate_date == date(2023, 1, 1)
+    assert transaction_1.main_amount == -11
+
+    # normalized amounts need only the target rates
+    rates = RateMatrix.load(db, date(2023, 1, 1), date(2023, 1, 2), ["USD"])
+    converted = rates.convert(
+        [-44, 10, 10],
+        ["PLN", "USD", "EUR"],
+        "USD",
+        [date(2023, 1, 1), date(2023, 1, 2), date(2023, 1, 2)],
+        [transaction_1.eur_amount, None, None],
+    )
+    assert converted.tolist() == [-11, 10, 12]
+
+
+def test_change_main_currency_in_batches(
+    db: Session, model_factory: ModelFactory, exchange_rates: None
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("USD")
+    categories = [model_factory.create_category(user) for user in (user_1, user_2)]
+    db.add_all(categories)
+    db.flush()
+    db.add_all(
+        [
+            Budget(monthly_limit=100, user_id=category.user_id, category=category)
+            for category in categories
+        ]
+        + [
+            model_factory.create_transaction(-10, "EUR", day, None, user_1, None, db)
+            for day in (
+                datetime(2023, 1, 1),
+                datetime(2023, 1, 2),
+                datetime(2023, 1, 2),
+            )
+        ]
+    )
+    db.commit()
+
+    progress: list[tuple[float, int]] = []
+
+    def report_progress(value: float) -> None:
+        # every batch is committed before its progress is reported
+        with TestSessionLocal() as other_db:
+            converted = other_db.scalar(
+                select(sa.func.count()).where(Transaction.main_amount != -10)
+            )
+        progress.append((value, converted))
+
+    user_1.change_main_currency(
+        "USD", db, report_progress, batch_size=2, commit_batches=True
+    )
+    db.commit()
+    assert progress == [(pytest.approx(2 / 3), 2), (1, 3)]
+    assert db.scalars(
+        select(Transaction.main_amount).order_by(Transaction.id)
+    ).all() == [-11, -12, -12]
+
+    # limits at the latest rate of both the currencies, PLN one is from a day earlier
+    user_2.change_main_currency("PLN", db)
+    db.commit()
+    assert db.scalars(select(Budget.monthly_limit).order_by(Budget.id)).all() == [
+        120,
+        400,
+    ]
+
+
+def test_exact_amounts(app: FastAPI, db: Session, model_factory: ModelFactory) -> None:
+    assert round_amount(2.675, "EUR") == 2.68
+    assert round_amount(-1234.5, "JPY") == -1234
+    assert round_amount(1.23456, "KWD") == 1.235
+    assert round_amounts(np.array([2.675, -0.125]), "EUR").tolist() == [2.68, -0.12]
+
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.flush()
+    db.add_all(
+        [
+            model_factory.create_transaction(
+                amount, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+            )
+            for amount in (0.1, 0.2)
+        ]
+    )
+    db.commit()
+    assert db.scalar(select(sa.func.sum(Transaction.main_amount))) == 0.3
+
+
+def test_get_rates(
+    client: TestClient, db: Session, model_factory: ModelFactory, exchange_rates: None
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # many pairs at once
+    response = client.get(
+        "/rates",
+        headers=header,
+        params={
+            "date": "2023-01-01",
+            "source": ["USD", "PLN"],
+            "target": ["EUR", "USD", "GBP"],
+        },
+    )
+    assert response.status_code == 200
+    rates = response.json()["rates"]
+    assert rates["USD"]["EUR"] == pytest.approx(1 / 1.1)
+    assert rates["PLN"]["USD"] == pytest.approx(0.25)
+    assert rates["USD"]["GBP"] is None
+
+    # main currency as the default target
+    response = client.get(
+        "/rates", headers=header, params={"date": "2023-01-01", "source": "PLN"}
+    )
+    assert response.status_code == 200
+    assert response.json()["rates"] == {"PLN": {"EUR": pytest.approx(1 / 4.4)}}
+
+    # no rates on the day
+    response = client.get(
+        "/rates", headers=header, params={"date": "2023-01-05", "source": "PLN"}
+    )
+    assert response.status_code == 404
@@ -0,0 +1,153 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from database.models import Tombstone, Transaction
+from tests.conftest import (
+    ModelFactory,
+    TestSessionLocal,
+    get_test_access_token_header,
+)
+
+
+def test_sync(client: TestClient, db: Session, model_factory: ModelFactory) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, user_2, category_1])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), category_1, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        -30, "EUR", datetime(2023, 1, 2), None, user_2, None, db
+    )
+    db.add_all([transaction_1, transaction_2, transaction_3])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # initial sync in pages
+    response = client.get("sync/", headers=header, params={"limit": 3})
+    assert response.status_code == 200
+    page_1 = response.json()
+    assert page_1["has_more"] is True
+    response = client.get(
+        "sync/", headers=header, params={"since": page_1["cursor"], "limit": 3}
+    )
+    page_2 = response.json()
+    assert page_2["has_more"] is False
+    assert page_1["user"]["username"] == user_1.username
+    assert [c["id"] for c in page_1["categories"] + page_2["categories"]] == [
+        category_1.id
+    ]
+    assert sorted(t["id"] for t in page_1["transactions"] + page_2["transactions"]) == [
+        transaction_1.id,
+        transaction_2.id,
+    ]
+
+    # nothing changed
+    cursor = page_2["cursor"]
+    response = client.get("sync/", headers=header, params={"since": cursor})
+    assert response.json()["cursor"] == cursor
+    assert response.json()["transactions"] == []
+    assert response.json()["user"] is None
+
+    # modified and deleted rows only
+    response = client.put(
+        f"transactions/{transaction_1.id}", headers=header, json={"title": "Changed"}
+    )
+    assert response.status_code == 200
+    response = client.delete(f"transactions/{transaction_2.id}", headers=header)
+    assert response.status_code == 204
+    response = client.get("sync/", headers=header, params={"since": cursor})
+    assert [t["title"] for t in response.json()["transactions"]] == ["Changed"]
+    assert response.json()["deleted"] == [
+        {"entity": "transactions", "id": transaction_2.id}
+    ]
+    assert response.json()["user"] is None
+
+
+def test_sync_overlapping_writes(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2])
+    db.commit()
+    transaction_1_id, transaction_2_id = transaction_1.id, transaction_2.id
+    header = get_test_access_token_header(client, user_1)
+    cursor = client.get("sync/", headers=header).json()["cursor"]
+
+    # the earlier write commits after the later one was synced
+    with TestSessionLocal() as db_1, TestSessionLocal() as db_2:
+        # statements without the flush hooks, which would lock the user's row
+        db_1.execute(
+            sa.update(Transaction).filter_by(id=transaction_1_id).values(title="First")
+        )
+        db_2.execute(
+            sa.update(Transaction).filter_by(id=transaction_2_id).values(title="Second")
+        )
+        db_2.commit()
+
+        response = client.get("sync/", headers=header, params={"since": cursor})
+        assert response.json()["transactions"] == []
+        assert response.json()["cursor"] == cursor
+        db_1.commit()
+
+    response = client.get("sync/", headers=header, params={"since": cursor})
+    assert sorted(t["title"] for t in response.json()["transactions"]) == [
+        "First",
+        "Second",
+    ]
+
+
+def test_sync_pruned_deletions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2])
+    db.commit()
+    transaction_1_id = transaction_1.id
+    header = get_test_access_token_header(client, user_1)
+    cursor = client.get("sync/", headers=header).json()["cursor"]
+
+    response = client.delete(f"transactions/{transaction_1_id}", headers=header)
+    assert response.status_code == 204
+    db.execute(
+        sa.update(Tombstone).values(
+            creation_date=datetime.utcnow() - 2 * Tombstone.RETENTION
+        )
+    )
+    db.commit()
+    response = client.delete(f"transactions/{transaction_2.id}", headers=header)
+    assert response.status_code == 204
+
+    # the first deletion is forgotten, the client starts over
+    assert db.scalar(sa.select(sa.func.count()).select_from(Tombstone)) == 1
+    response = client.get("sync/", headers=header, params={"since": cursor})
+    assert response.json()["reset"] is True
+    assert response.json()["transactions"] == []
+    response = client.get(
+        "sync/", headers=header, params={"since": response.json()["cursor"]}
+    )
+    assert response.json()["reset"] is False
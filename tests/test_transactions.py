@@ -0,0 +1,523 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+import api.schemas as s
+from api.idempotency import get_idempotency_store
+from database.models import ExchangeRate, IdempotencyKey
+from jobs.runner import JobRunner
+from tests.conftest import ModelFactory, get_test_access_token_header
+
+
+def test_get_transactions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, user_2, category_1])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), category_1, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 2, 1), None, user_1, None, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        -30, "EUR", datetime(2023, 2, 1), None, user_2, None, db
+    )
+    db.add_all([transaction_1, transaction_2, transaction_3])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # all user's transactions, the newest first
+    response = client.get("transactions/", headers=header)
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [transaction_2.id, transaction_1.id]
+
+    # filtered transactions
+    response = client.get(
+        "transactions/", headers=header, params={"category_id": category_1.id}
+    )
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [transaction_1.id]
+
+    # sparse fieldsets
+    response = client.get(
+        "transactions/",
+        headers=header,
+        params={"fields": "main_amount,category_id", "expand": "category"},
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "id": transaction_2.id,
+            "main_amount": -20,
+            "category_id": None,
+            "category": None,
+        },
+        {
+            "id": transaction_1.id,
+            "main_amount": -10,
+            "category_id": category_1.id,
+            "category": {"id": category_1.id, "name": category_1.name},
+        },
+    ]
+    response = client.get("transactions/", headers=header, params={"expand": "bank"})
+    assert set(response.json()[0]) == {*s.Transaction.__fields__} - {"category"}
+    response = client.get("transactions/", headers=header, params={"fields": "user_id"})
+    assert response.status_code == 422
+
+    # incorrect query param
+    response = client.get("transactions/", headers=header, params={"limit": 0})
+    assert response.status_code == 422
+
+
+def test_get_transactions_summary(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, category_1])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), category_1, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 2, 1), category_1, user_1, None, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        5, "EUR", datetime(2023, 2, 1), None, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2, transaction_3])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.get("transactions/summary", headers=header)
+    assert response.status_code == 200
+    assert response.json() == {
+        "main_currency": "EUR",
+        "total": -25,
+        "categories": [
+            {"category": s.Category.from_orm(category_1), "total": -30, "count": 2},
+            {"category": None, "total": 5, "count": 1},
+        ],
+    }
+
+    response = client.get(
+        "transactions/summary",
+        headers=header,
+        params={"date_from": "2023-01-15T00:00:00"},
+    )
+    assert response.json()["total"] == -15
+
+
+def test_search_transactions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    db.add_all([user_1, user_2])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -20, "EUR", datetime(2023, 2, 1), None, user_1, None, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        -30, "EUR", datetime(2023, 2, 1), None, user_2, None, db
+    )
+    transaction_1.title, transaction_1.place = "Coffee", "Starbucks Prague"
+    transaction_2.title, transaction_2.info = "Groceries", "card payment Starbucks"
+    transaction_3.title = "Starbucks"
+    db.add_all([transaction_1, transaction_2, transaction_3])
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # only user's transactions, ranked by the matched field
+    response = client.get(
+        "transactions/search", headers=header, params={"q": "starbucks"}
+    )
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [transaction_1.id, transaction_2.id]
+
+    response = client.get(
+        "transactions/search", headers=header, params={"q": "starbucks -coffee"}
+    )
+    assert [t["id"] for t in response.json()] == [transaction_2.id]
+
+    response = client.get(
+        "transactions/search",
+        headers=header,
+        params={"q": "starbucks", "fields": "title"},
+    )
+    assert response.json() == [
+        {"id": transaction_1.id, "title": "Coffee"},
+        {"id": transaction_2.id, "title": "Groceries"},
+    ]
+
+    # missing query
+    response = client.get("transactions/search", headers=header)
+    assert response.status_code == 422
+
+
+def test_create_transaction_idempotency(
+    app: FastAPI, client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    db.add_all([user_1, user_2])
+    db.commit()
+    header_1 = get_test_access_token_header(client, user_1)
+    header_2 = get_test_access_token_header(client, user_2)
+
+    body = {
+        "base_amount": -10,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-01T00:00:00",
+    }
+    headers = {**header_1, "Idempotency-Key": "key-1"}
+    response_1 = client.post("transactions/", headers=headers, json=body)
+    assert response_1.status_code == 201
+
+    # retry is replayed, not handled again
+    response_2 = client.post("transactions/", headers=headers, json=body)
+    assert response_2.status_code == 201
+    assert response_2.headers["Idempotent-Replayed"] == "true"
+    assert response_2.json() == response_1.json()
+    response = client.get("transactions/", headers=header_1)
+    assert len(response.json()) == 1
+
+    # key reused for a different request
+    response = client.post(
+        "transactions/", headers=headers, json={**body, "base_amount": -20}
+    )
+    assert response.status_code == 422
+
+    # keys are per user
+    headers = {**header_2, "Idempotency-Key": "key-1"}
+    response = client.post("transactions/", headers=headers, json=body)
+    assert response.json()["id"] != response_1.json()["id"]
+
+    # failed request can be retried with the same key
+    headers = {**header_1, "Idempotency-Key": "key-2"}
+    body = {"name": "Travel"}
+    category_id = client.post("categories/", headers=header_1, json=body).json()["id"]
+    response = client.post("categories/", headers=headers, json=body)
+    assert response.status_code == 409
+    client.delete(f"categories/{category_id}", headers=header_1)
+    response = client.post("categories/", headers=headers, json=body)
+    assert response.status_code == 201
+
+    # request abandoned while being handled blocks its retries only for the lease
+    headers = {**header_1, "Idempotency-Key": "key-3"}
+    response = client.post("categories/", headers=headers, json={"name": "Food"})
+    client.delete(f"categories/{response.json()['id']}", headers=header_1)
+    store = app.dependency_overrides[get_idempotency_store]()
+    store._memory.clear()
+    keys = IdempotencyKey.__table__
+    db.execute(sa.update(keys).filter_by(key="key-3").values(status_code=None))
+    db.commit()
+    response = client.post("categories/", headers=headers, json={"name": "Food"})
+    assert response.status_code == 409
+    db.execute(
+        sa.update(keys)
+        .filter_by(key="key-3")
+        .values(claimed_at=datetime.utcnow() - 2 * store.lease)
+    )
+    db.commit()
+    response = client.post("categories/", headers=headers, json={"name": "Food"})
+    assert response.status_code == 201
+
+
+def test_import_transactions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_2 = model_factory.create_category(user_2)
+    db.add_all(
+        [
+            user_1,
+            category_2,
+            ExchangeRate(date=datetime(2023, 1, 2), source="USD", rate=1.25),
+            ExchangeRate(date=datetime(2023, 1, 2), source="KWD", rate=0.25),
+        ]
+    )
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        -10, "EUR", datetime(2023, 1, 1), None, user_1, None, db
+    )
+    db.add(transaction_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    coffee = {
+        "base_amount": -3.5,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-02T00:00:00",
+        "title": "Coffee",
+    }
+    body = {
+        "transactions": [
+            # already stored, differs only in the letter case
+            {
+                "base_amount": -10,
+                "base_currency": "EUR",
+                "transaction_date": "2023-01-01T10:00:00",
+                "title": transaction_1.title.upper(),
+                "place": transaction_1.place,
+            },
+            # genuinely repeated transaction
+            coffee,
+            coffee,
+            {
+                "base_amount": -5,
+                "base_currency": "USD",
+                "transaction_date": "2023-01-02T00:00:00",
+            },
+        ]
+    }
+    response = client.post("transactions/import", headers=header, json=body)
+    assert response.status_code == 201
+    assert response.json() == {"created": 3, "duplicates": 1}
+
+    response = client.get("transactions/", headers=header)
+    assert sorted(t["main_amount"] for t in response.json()) == [-10, -4, -3.5, -3.5]
+
+    # overlapping statement uploaded again
+    body["transactions"].append({**coffee, "title": "Tea"})
+    response = client.post("transactions/import", headers=header, json=body)
+    assert response.json() == {"created": 1, "duplicates": 4}
+
+    # missing exchange rate
+    body = {"transactions": [{**coffee, "base_currency": "PLN"}]}
+    response = client.post("transactions/import", headers=header, json=body)
+    assert response.status_code == 422
+
+    # category of another user and unknown bank, nothing is imported
+    for reference in ({"category_id": category_2.id}, {"bank_id": 100}):
+        body = {"transactions": [{**coffee, "title": "Juice"}, {**coffee, **reference}]}
+        response = client.post("transactions/import", headers=header, json=body)
+        assert response.status_code == 404
+    response = client.get("transactions/", headers=header)
+    assert len(response.json()) == 5
+
+    # amounts differing in the third decimal of a currency that has it
+    for amount in (-1.231, -1.234):
+        body = {
+            "transactions": [{**coffee, "base_amount": amount, "base_currency": "KWD"}]
+        }
+        response = client.post("transactions/import", headers=header, json=body)
+        assert response.json() == {"created": 1, "duplicates": 0}
+
+
+def test_bulk_modify_and_delete_transactions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    category_2 = model_factory.create_category(user_1)
+    category_2.name = "Transport"
+    db.add_all([user_1, user_2, category_1, category_2])
+    db.flush()
+    transactions = [
+        model_factory.create_transaction(
+            amount, "EUR", datetime(2023, 1, day), category, user, None, db
+        )
+        for amount, day, category, user in [
+            (-10, 1, category_1, user_1),
+            (-20, 2, None, user_1),
+            (-30, 3, category_1, user_1),
+            (-40, 2, None, user_2),
+        ]
+    ]
+    for transaction, place in zip(transactions, ["Shop", "Shop", "Bar", "Shop"]):
+        transaction.place = place
+    db.add_all(transactions)
+    db.commit()
+    ids = [transaction.id for transaction in transactions]
+    header = get_test_access_token_header(client, user_1)
+    for category in (category_1, category_2):
+        body = {"category_id": category.id, "monthly_limit": 100}
+        client.post("budgets/", headers=header, json=body)
+
+    def spent() -> list[float]:
+        response = client.get(
+            "budgets/", headers=header, params={"month": "2023-01-01"}
+        )
+        return [status["spent"] for status in response.json()]
+
+    # only the user's matching transactions are modified
+    response = client.patch(
+        "transactions/",
+        headers=header,
+        params={"place": "Shop"},
+        json={"category_id": category_2.id},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+    assert spent() == [30, 30]
+
+    response = client.patch(
+        "transactions/",
+        headers=header,
+        params={"category_id": category_2.id},
+        json={"place": "Market"},
+    )
+    assert response.json() == {"count": 2}
+    response = client.get("transactions/", headers=header)
+    assert sorted(t["place"] for t in response.json()) == ["Bar", "Market", "Market"]
+
+    # filter, category and bank are required to exist
+    response = client.patch("transactions/", headers=header, json={"place": "Shop"})
+    assert response.status_code == 422
+    response = client.patch(
+        "transactions/",
+        headers=header,
+        params={"place": "Bar"},
+        json={"category_id": category_2.id + 100},
+    )
+    assert response.status_code == 404
+    response = client.patch(
+        "transactions/", headers=header, params={"place": "Bar"}, json={"bank_id": 100}
+    )
+    assert response.status_code == 404
+
+    response = client.delete(
+        "transactions/", headers=header, params={"date_to": "2023-01-02T23:59:59"}
+    )
+    assert response.json() == {"count": 2}
+    assert spent() == [30, 0]
+    response = client.get("transactions/", headers=header)
+    assert [t["id"] for t in response.json()] == [ids[2]]
+    response = client.get("sync/", headers=header)
+    assert sorted(deleted["id"] for deleted in response.json()["deleted"]) == ids[:2]
+    response = client.delete("transactions/", headers=header)
+    assert response.status_code == 422
+
+
+def test_export_transactions(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, category_1])
+    db.flush()
+    transactions = [
+        model_factory.create_transaction(
+            -i,
+            "EUR",
+            datetime(2023, 1, i),
+            category_1 if i % 2 else None,
+            user_1,
+            None,
+            db,
+        )
+        for i in range(1, 6)
+    ]
+    db.add_all(transactions)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.get("transactions/export", headers=header)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == [t.id for t in transactions]
+    assert rows[0]["category"] == category_1.name
+    assert rows[1]["category"] == ""
+
+    response = client.get(
+        "transactions/export",
+        headers=header,
+        params={"format": "ndjson", "date_from": "2023-01-03T00:00:00"},
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["main_amount"] for row in rows] == [-3, -4, -5]
+    assert rows[0]["transaction_date"] == "2023-01-03T00:00:00"
+
+
+def test_recurring_transactions(
+    client: TestClient,
+    db: Session,
+    model_factory: ModelFactory,
+    job_runner: JobRunner,
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.flush()
+    today = datetime.combine(date.today(), datetime.min.time())
+    transactions = [
+        model_factory.create_transaction(
+            amount, "EUR", today - timedelta(days=days), None, user_1, None, db
+        )
+        for amount, days in [(-9.99, 5), (-9.99, 35), (-10.49, 66), (-9.99, 96)]
+        + [(-25, 3), (-140, 41)]
+    ]
+    for i, transaction in enumerate(transactions):
+        transaction.place = "NETFLIX.COM 8472" if i < 4 else f"Shop {i}"
+        transaction.title = transaction.info = None
+    db.add_all(transactions)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    # detection is refreshed in the background
+    response = client.get("transactions/recurring", headers=header)
+    assert response.status_code == 200
+    assert response.json()["up_to_date"] is False
+    assert response.json()["payments"] == []
+
+    job_runner.shutdown()  # waits for the job to finish
+    response = client.get("transactions/recurring", headers=header)
+    assert response.json()["up_to_date"] is True
+    (payment,) = response.json()["payments"]
+    assert payment["description"] == "netflix com"
+    assert payment["period"] == "monthly"
+    assert payment["amount"] == -9.99
+
+    response = client.get("transactions/forecast", headers=header, params={"days": 60})
+    assert response.status_code == 200
+    assert len(response.json()["entries"]) == 2
+    assert response.json()["total"] == -19.98
+
+
+def test_get_transactions_cache(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.get("transactions/", headers=header)
+    assert response.status_code == 200
+    assert response.json() == []
+    etag = response.headers["ETag"]
+
+    # unchanged transactions
+    response = client.get("transactions/", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # a write invalidates the cached list
+    body = {
+        "base_amount": -10,
+        "base_currency": "EUR",
+        "transaction_date": "2023-01-01T00:00:00",
+    }
+    response = client.post("transactions/", headers=header, json=body)
+    assert response.status_code == 201
+
+    response = client.get("transactions/", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [response.json()[0]["id"]]
+    assert response.headers["ETag"] != etag
@@ -1,11 +1,27 @@
+from datetime import datetime
+
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 import api.schemas as s
-from api.auth import create_access_token, create_refresh_token
+from api.auth import create_access_token, create_refresh_token, get_read_db
 from config import Config, get_config
-from tests.conftest import ModelFactory, get_test_access_token_header, get_test_config
+from database.models import (
+    Bank,
+    Category,
+    MyBanks,
+    Transaction,
+    User,
+    bump_data_versions,
+)
+from tests.conftest import (
+    ModelFactory,
+    TestSessionLocal,
+    get_test_access_token_header,
+    get_test_config,
+)
 
 
 def test_get_token(
@@ -122,6 +138,39 @@ def test_current_user(
     assert response.json()["detail"] == "The access token has expired"
 
 
+def test_current_user_etag(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.get("/user", headers=header)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # unchanged user
+    response = client.get("/user", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # modified user
+    client.put("/user", headers=header, json={"first_name": "changedFirst"})
+    response = client.get("/user", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # amounts are reported in the main currency, even without any transactions
+    response = client.get("transactions/summary", headers=header)
+    etag = response.headers["ETag"]
+    client.put("/user", headers=header, json={"main_currency": "USD"})
+    response = client.get(
+        "transactions/summary", headers={**header, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["main_currency"] == "USD"
+
+
 def test_create_user(client: TestClient, model_factory: ModelFactory) -> None:
     user_1 = model_factory.create_user("EUR")
     user_2 = model_factory.create_user("EUR")
@@ -233,6 +282,136 @@ def test_delete_current_user(
     response = client.request("DELETE", "/user", headers=header, json=body_2)
 
 
+def test_delete_current_user_with_data(
+    app: FastAPI, client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    def override_test_config() -> Config:
+        config = get_test_config()
+        config.DELETE_BATCH_SIZE = 2
+        return config
+
+    app.dependency_overrides[get_config] = override_test_config
+    user_1 = model_factory.create_user("EUR")
+    user_2 = model_factory.create_user("EUR")
+    category_1 = model_factory.create_category(user_1)
+    db.add_all([user_1, user_2, category_1])
+    db.flush()
+    transactions = [
+        model_factory.create_transaction(
+            -10, "EUR", datetime(2023, 1, 1), category, user, None, db
+        )
+        for category, user in [
+            (category_1, user_1),
+            (category_1, user_1),
+            (None, user_1),
+            (None, user_2),
+        ]
+    ]
+    db.add_all(transactions)
+    db.commit()
+    header = get_test_access_token_header(client, user_1)
+
+    response = client.request(
+        "DELETE", "/user", headers=header, json={"password": "password1"}
+    )
+    assert response.status_code == 204
+
+    db.expire_all()
+    assert db.scalars(select(User)).all() == [user_2]
+    assert db.scalars(select(Transaction)).all() == [transactions[-1]]
+    assert db.scalars(select(Category)).all() == []
+
+
+def test_bank_balances(
+    client: TestClient, db: Session, model_factory: ModelFactory
+) -> None:
+    user_1 = model_factory.create_user("EUR")
+    bank_1 = Bank(name="Revolut", statement_type="csv", name_enum=MyBanks.REVOLUT)
+    bank_2 = Bank(name="Equabank", statement_type="xml", name_enum=MyBanks.EQUABANK)
+    db.add_all([user_1, bank_1, bank_2])
+    db.flush()
+    transaction_1 = model_factory.create_transaction(
+        100, "EUR", datetime(2022, 12, 31), None, user_1, bank_1, db
+    )
+    transaction_2 = model_factory.create_transaction(
+        -10.1, "EUR", datetime(2023, 1, 1, 10), None, user_1, bank_1, db
+    )
+    transaction_3 = model_factory.create_transaction(
+        -0.2, "EUR", datetime(2023, 1, 1, 18), None, user_1, bank_1, db
+    )
+    transaction_4 = model_factory.create_transaction(
+        -5, "EUR", datetime(2023, 1, 2), None, user_1, None, db
+    )
+    db.add_all([transaction_1, transaction_2, transaction_3, transaction_4])
+    db.commit()
+    bank_1_id, bank_2_id = bank_1.id, bank_2.id
+    header = get_test_access_token_header(client, user_1)
+
+    def balances(**params: str | int) -> dict:
+        response = client.get("user/banks/balances", headers=header, params=params)
+        assert response.status_code == 200
+        return response.json()
+
+    # transactions without a bank are not counted
+    body = balances()
+    assert body["total"] == 89.7
+    assert [bank["bank"]["id"] for bank in body["banks"]] == [bank_1_id]
+    assert body["banks"][0]["days"] == [
+        {"date": "2022-12-31", "balance": 100},
+        {"date": "2023-01-01", "balance": 89.7},
+    ]
+    body = balances(date_from="2023-01-01", date_to="2023-01-01")
+    assert body["banks"][0]["opening"] == 100
+    assert body["banks"][0]["closing"] == 89.7
+
+    # modified, bulk modified and deleted transactions
+    response = client.put(
+        f"transactions/{transaction_2.id}", headers=header, json={"bank_id": bank_2_id}
+    )
+    assert response.status_code == 200
+    body = balances()
+    assert [bank["closing"] for bank in body["banks"]] == [99.8, -10.1]
+    assert body["total"] == 89.7
+
+    response = client.patch(
+        "transactions/",
+        headers=header,
+        params={"date_from": "2023-01-02T00:00:00"},
+        json={"bank_id": bank_2_id},
+    )
+    assert response.json()["count"] == 1
+    response = client.delete(
+        "transactions/", headers=header, params={"bank_id": bank_1_id}
+    )
+    assert response.json()["count"] == 2
+    body = balances()
+    assert [bank["closing"] for bank in body["banks"]] == [0, -15.1]
+    assert body["banks"][1]["days"] == [
+        {"date": "2023-01-01", "balance": -10.1},
+        {"date": "2023-01-02", "balance": -15.1},
+    ]
+
+
+def test_get_read_db(app: FastAPI, db: Session, model_factory: ModelFactory) -> None:
+    user_1 = model_factory.create_user("EUR")
+    db.add(user_1)
+    db.commit()
+    config = get_test_config()
+    config.SQLALCHEMY_READ_REPLICA_URI = config.SQLALCHEMY_DATABASE_URI
+
+    # replica lagging behind the user's latest write
+    with TestSessionLocal() as replica_db:
+        replica_db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        replica_db.scalar(select(User.data_version).filter_by(id=user_1.id))
+        bump_data_versions(db.connection(), [user_1.id])
+        db.commit()
+        assert get_read_db(user_1, db, replica_db, config) is db
+
+    # caught up
+    with TestSessionLocal() as replica_db:
+        assert get_read_db(user_1, db, replica_db, config) is replica_db
+
+
 def test_change_password(
     client: TestClient, db: Session, model_factory: ModelFactory
 ) -> None:
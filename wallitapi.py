@@ -1,29 +1,91 @@
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator
 
-import uvicorn
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 
-from api import categories, main, tags_metadata, transactions, user
+from api import (
+    batch,
+    budgets,
+    categories,
+    events,
+    jobs,
+    main,
+    rates,
+    sync,
+    tags_metadata,
+    transactions,
+    user,
+)
 from api.error_handlers import request_validation_handler
-from config import LOGGING_CONFIG
+from config import LOGGING_CONFIG, Config, get_config
+from database.main import dispose_engine, get_engine
+from database.partitioning import ensure_partitions
+from events.bus import start_event_bus, stop_event_bus
+from jobs.runner import start_job_runner, stop_job_runner
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # The engine is created here, in the serving process, never at import time
+    get_engine()
+    ensure_partitions()
+    start_event_bus()
+    start_job_runner()
+    yield
+    stop_job_runner()
+    stop_event_bus()
+    dispose_engine()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(openapi_tags=tags_metadata)
+    app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
 
     app.include_router(main.router)
     app.include_router(user.router)
     app.include_router(transactions.router)
     app.include_router(categories.router)
+    app.include_router(jobs.router)
+    app.include_router(rates.router)
+    app.include_router(budgets.router)
+    app.include_router(sync.router)
+    app.include_router(events.router)
+    app.include_router(batch.router)
 
     app.add_exception_handler(RequestValidationError, request_validation_handler)
 
-    Path("./logs").mkdir(exist_ok=True)
-
     return app
 
 
-app = create_app()
+def __getattr__(name: str) -> FastAPI:
+    # `uvicorn wallitapi:app` keeps working, while a bare import builds nothing
+    if name == "app":
+        globals()["app"] = app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def run(config: Config) -> None:
+    """Serve the app with worker processes, each creating its own engine"""
+    import uvicorn
+
+    Path("./logs").mkdir(exist_ok=True)
+    uvicorn.run(
+        "wallitapi:create_app",
+        factory=True,
+        host=config.SERVER_HOST,
+        port=config.SERVER_PORT,
+        workers=config.SERVER_WORKERS or os.cpu_count(),
+        loop=config.SERVER_LOOP,
+        http=config.SERVER_HTTP,
+        timeout_keep_alive=config.SERVER_KEEPALIVE_SECONDS,
+        backlog=config.SERVER_BACKLOG,
+        timeout_graceful_shutdown=config.SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+        log_config=LOGGING_CONFIG,
+    )
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, log_config=LOGGING_CONFIG)
+    run(get_config())